@@ -0,0 +1,119 @@
+"""
+Microbenchmark for per-request auth cost in get_current_user.
+
+Compares, for HS256 and ES256 tokens:
+  legacy  - the old per-request work: decode the secret / rebuild the key with
+            from_jwk, then run a full signature verification
+  verify  - full verification with the precomputed secret and key objects
+  cached  - a repeat request served from the verified-token cache
+
+Run from backend/:  python -m benchmarks.bench_auth [--iterations N]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi.security import HTTPAuthorizationCredentials
+from jwt.algorithms import ECAlgorithm
+
+from services import auth_service
+from services.jwks import JWKSManager, parse_jwks_keys
+
+SECRET = b"benchmark-secret-benchmark-secret"
+
+
+def _legacy_hs256(token: str) -> str:
+    secret = os.environ["SUPABASE_JWT_SECRET"]
+    padded = secret + "=" * (4 - len(secret) % 4) if len(secret) % 4 else secret
+    jwt.get_unverified_header(token)
+    payload = jwt.decode(
+        token, base64.b64decode(padded), algorithms=["HS256"], audience="authenticated"
+    )
+    return payload["sub"]
+
+
+def _legacy_es256(token: str, jwk: dict) -> str:
+    jwt.get_unverified_header(token)
+    public_key = ECAlgorithm.from_jwk(jwk)
+    payload = jwt.decode(
+        token,
+        public_key,  # type: ignore
+        algorithms=["ES256"],
+        audience="authenticated",
+    )
+    return payload["sub"]
+
+
+def _time_sync(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+async def _time_async(fn, iterations: int, clear_cache: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if clear_cache:
+            auth_service._token_cache.clear()
+        await fn()
+    return (time.perf_counter() - start) / iterations
+
+
+async def run(iterations: int) -> list[tuple[str, str, float]]:
+    os.environ["SUPABASE_JWT_SECRET"] = base64.b64encode(SECRET).decode()
+    claims = {"sub": "bench-user", "aud": "authenticated", "exp": time.time() + 3600}
+
+    hs_token = jwt.encode(claims, SECRET, algorithm="HS256")
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    jwk = ECAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk["kid"] = "bench-key"
+    es_token = jwt.encode(
+        claims, private_key, algorithm="ES256", headers={"kid": "bench-key"}
+    )
+
+    # A warm JWKS manager, as it is between background refreshes
+    manager = JWKSManager(urls=[])
+    manager.jwks = {"keys": [jwk]}
+    manager.keys = parse_jwks_keys(manager.jwks)
+    manager._expires_at = float("inf")
+    auth_service.get_jwks_manager = lambda: manager  # type: ignore[assignment]
+
+    results = []
+    for alg, token, legacy in (
+        ("HS256", hs_token, lambda: _legacy_hs256(hs_token)),
+        ("ES256", es_token, lambda: _legacy_es256(es_token, jwk)),
+    ):
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+        async def request(credentials=credentials):
+            return await auth_service.get_current_user(credentials)
+
+        results.append((alg, "legacy", _time_sync(legacy, iterations)))
+        results.append((alg, "verify", await _time_async(request, iterations, True)))
+        results.append((alg, "cached", await _time_async(request, iterations, False)))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations))
+    print(f"{'alg':<6} {'path':<7} {'us/request':>11} {'speedup':>8}")
+    legacy_cost: dict[str, float] = {}
+    for alg, path, seconds in results:
+        legacy_cost.setdefault(alg, seconds)
+        speedup = legacy_cost[alg] / seconds
+        print(f"{alg:<6} {path:<7} {seconds * 1e6:>11.1f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
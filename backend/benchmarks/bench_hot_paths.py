@@ -0,0 +1,443 @@
+"""
+Throughput and p50/p95/p99 latency of the backend hot paths, against
+in-process fakes of Supabase, Gemini and ElevenLabs (benchmarks.fakes).
+
+Every case runs --requests operations at each --concurrency level. The
+service cases call the functions directly. The endpoint cases go through
+the FastAPI app over an in-process transport, so middleware, routing and
+HS256 verification in get_current_user are included.
+
+  auth            get_current_user, token cache cold or warm     (cache)
+  memory_read     load_memory_snapshot, memory cache cold or warm (cache, items)
+  memory_append   add_core_instruction                            (items)
+  memory_mutation update_memory_row, conflicting writers retried  (rows)
+  chat            generate_chat_response                          (history, items)
+  reflection      run_reflection_job                              (history)
+  POST /chat, POST /chat/voice, GET /chat/wakeup, GET /child/rewards
+
+Results are written as JSON to --output; compare two runs with
+benchmarks.compare. memory_mutation results also carry counters: the
+conditional write attempts made and how many of them lost to a concurrent
+writer (conflict_rate), next to the mutations/s in throughput_rps.
+
+Run from backend/:  python -m benchmarks.bench_hot_paths [--quick] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+os.environ.setdefault("GEMINI_API_KEY", "dummy")
+
+import httpx
+from fastapi.security import HTTPAuthorizationCredentials
+
+from benchmarks.fakes import (
+    Fakes,
+    history,
+    install_fakes,
+    make_token,
+    seed_user,
+)
+
+# Distinct users the operations of a case are spread over
+USERS = 16
+DEFAULT_OUTPUT = "data/bench_hot_paths.json"
+
+Op = Callable[[int], Awaitable[Any]]
+
+
+@dataclass
+class Result:
+    case: str
+    params: dict[str, Any]
+    concurrency: int
+    requests: int
+    errors: int
+    throughput_rps: float
+    latency_ms: dict[str, float]
+    counters: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        return result_key(self.case, self.params, self.concurrency)
+
+
+def result_key(case: str, params: dict, concurrency: int) -> str:
+    return f"{case} {json.dumps(params, sort_keys=True)} c={concurrency}"
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def measure(op: Op, requests: int, concurrency: int, warmup: int) -> dict:
+    for i in range(warmup):
+        await op(-1 - i)
+
+    latencies: list[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            started = time.perf_counter()
+            try:
+                await op(i)
+            except Exception:  # noqa: BLE001 - any failure counts as an error
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    return {
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ms, 0.50), 3),
+            "p95": round(percentile(ms, 0.95), 3),
+            "p99": round(percentile(ms, 0.99), 3),
+            "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+            "max": round(ms[-1], 3) if ms else 0.0,
+        },
+    }
+
+
+def _user(i: int) -> str:
+    return f"bench-user-{i % USERS}"
+
+
+def _seed(fakes: Fakes, items: int) -> None:
+    for n in range(USERS):
+        seed_user(fakes.db, f"bench-user-{n}", items)
+
+
+def _app_client() -> httpx.AsyncClient:
+    from main import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    )
+
+
+def _auth_headers() -> dict[int, dict[str, str]]:
+    return {
+        n: {"Authorization": f"Bearer {make_token(f'bench-user-{n}')}"}
+        for n in range(USERS)
+    }
+
+
+async def _check(response: httpx.Response) -> None:
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.status_code}: {response.text[:200]}")
+
+
+class CountedOp:
+    """An Op that also reports counters for its result, e.g. retries."""
+
+    def __init__(self, op: Op, counters: Callable[[], dict[str, float]]) -> None:
+        self.op = op
+        self.counters = counters
+
+    async def __call__(self, i: int) -> Any:
+        return await self.op(i)
+
+
+# Builders take the freshly installed fakes and the case params, and return
+# the operation to time. They seed whatever state the operation reads.
+Builder = Callable[[Fakes, dict], Op]
+
+
+def auth_case(fakes: Fakes, params: dict) -> Op:
+    from services import auth_service
+
+    credentials = {
+        n: HTTPAuthorizationCredentials(
+            scheme="Bearer", credentials=make_token(f"bench-user-{n}")
+        )
+        for n in range(USERS)
+    }
+
+    async def op(i: int) -> None:
+        if params["cache"] == "cold":
+            auth_service._token_cache.clear()
+        await auth_service.get_current_user(credentials[i % USERS])
+
+    return op
+
+
+def memory_read_case(fakes: Fakes, params: dict) -> Op:
+    from services import memory_service
+    from services.memory_cache import get_memory_cache
+
+    _seed(fakes, params["items"])
+
+    async def op(i: int) -> None:
+        if params["cache"] == "cold":
+            await get_memory_cache().invalidate(_user(i))
+        await memory_service.load_memory_snapshot(_user(i))
+
+    return op
+
+
+def memory_append_case(fakes: Fakes, params: dict) -> Op:
+    from services import memory_service
+
+    _seed(fakes, params["items"])
+
+    async def op(i: int) -> None:
+        await memory_service.add_core_instruction(_user(i), f"Instruction {i}")
+
+    return op
+
+
+def memory_mutation_case(fakes: Fakes, params: dict) -> Op:
+    from services import memory_service
+
+    _seed(fakes, 5)
+    # Warmup operations (negative i) are not counted
+    counts = {"attempts": 0, "writes": 0}
+
+    async def op(i: int) -> None:
+        def mutate(row: dict) -> dict:
+            counts["attempts"] += i >= 0
+            state = dict(row.get("long_term_state") or {})
+            state["mutations"] = state.get("mutations", 0) + 1
+            return {"long_term_state": state}
+
+        user_id = f"bench-user-{i % params['rows']}"
+        await memory_service.update_memory_row(user_id, mutate)
+        counts["writes"] += i >= 0
+
+    def counters() -> dict[str, float]:
+        attempts, writes = counts["attempts"], counts["writes"]
+        conflicts = attempts - writes
+        return {
+            "attempts": attempts,
+            "conflicts": conflicts,
+            "conflict_rate": round(conflicts / attempts, 4) if attempts else 0.0,
+        }
+
+    return CountedOp(op, counters)
+
+
+def chat_case(fakes: Fakes, params: dict) -> Op:
+    from services import llm_service
+
+    _seed(fakes, params["items"])
+    transcript = history(params["history"])
+
+    async def op(i: int) -> None:
+        await llm_service.generate_chat_response(_user(i), "Let's count!", transcript)
+
+    return op
+
+
+def reflection_case(fakes: Fakes, params: dict) -> Op:
+    from services import llm_service
+    from services.job_queue import Job
+
+    _seed(fakes, 3)
+    transcript = history(params["history"])
+
+    async def op(i: int) -> None:
+        # A fresh job each time, so every stage runs
+        job = Job(
+            id=f"bench-{i}",
+            kind=llm_service.REFLECTION_JOB,
+            user_id=_user(i),
+            payload={"history": transcript},
+        )
+
+        async def report(stage: str, value: Any) -> None:
+            job.progress[stage] = value
+
+        await llm_service.run_reflection_job(job, report)
+
+    return op
+
+
+def endpoint_case(method: str, path: str, body: Callable[[dict], Any] | None = None):
+    def build(fakes: Fakes, params: dict) -> Op:
+        _seed(fakes, params.get("items", 5))
+        client = _app_client()
+        headers = _auth_headers()
+        payload = body(params) if body else None
+
+        async def op(i: int) -> None:
+            response = await client.request(
+                method, path, json=payload, headers=headers[i % USERS]
+            )
+            await _check(response)
+
+        return op
+
+    return build
+
+
+def _chat_body(params: dict) -> dict:
+    return {"message": "Let's count!", "history": history(params["history"])}
+
+
+def cases(quick: bool) -> Iterator[tuple[str, dict, Builder]]:
+    histories = (0, 20) if quick else (0, 20, 100)
+    items = (5,) if quick else (5, 50, 500)
+
+    for cache in ("cold", "warm"):
+        yield "auth", {"cache": cache}, auth_case
+    for cache, n in itertools.product(("cold", "warm"), items):
+        yield "memory_read", {"cache": cache, "items": n}, memory_read_case
+    for n in items:
+        yield "memory_append", {"items": n}, memory_append_case
+    # Every writer on one row, then spread over USERS rows
+    for rows in (1, USERS):
+        yield "memory_mutation", {"rows": rows}, memory_mutation_case
+    for turns, n in itertools.product(histories, items):
+        yield "chat", {"history": turns, "items": n}, chat_case
+    # An empty transcript skips reflection entirely
+    for turns in (max(1, t) for t in histories):
+        yield "reflection", {"history": turns}, reflection_case
+    for turns in histories:
+        yield (
+            "POST /chat",
+            {"history": turns},
+            endpoint_case("POST", "/chat", _chat_body),
+        )
+    yield (
+        "POST /chat/voice",
+        {},
+        endpoint_case("POST", "/chat/voice", lambda _: {"text": "Let's count!"}),
+    )
+    yield "GET /chat/wakeup", {}, endpoint_case("GET", "/chat/wakeup")
+    yield "GET /child/rewards", {}, endpoint_case("GET", "/child/rewards")
+
+
+async def run(args: argparse.Namespace) -> list[Result]:
+    results = []
+    only = set(args.case or [])
+    for case, params, build in cases(args.quick):
+        if only and case not in only:
+            continue
+        for concurrency in args.concurrency:
+            fakes = install_fakes(
+                db_latency=args.db_latency,
+                llm_latency=args.llm_latency,
+                tts_latency=args.tts_latency,
+                sticker_every=args.sticker_every,
+            )
+            op = build(fakes, params)
+            stats = await measure(op, args.requests, concurrency, args.warmup)
+            if isinstance(op, CountedOp):
+                stats["counters"] = op.counters()
+            result = Result(case, params, concurrency, args.requests, **stats)
+            results.append(result)
+            _print_row(result)
+    return results
+
+
+def _print_header() -> None:
+    print(
+        f"{'case':<20} {'params':<28} {'conc':>4} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}"
+    )
+
+
+def _print_row(result: Result) -> None:
+    params = " ".join(f"{k}={v}" for k, v in result.params.items())
+    latency = result.latency_ms
+    print(
+        f"{result.case:<20} {params:<28} {result.concurrency:>4} "
+        f"{result.throughput_rps:>9.1f} {latency['p50']:>8.2f} "
+        f"{latency['p95']:>8.2f} {latency['p99']:>8.2f} {result.errors:>6}"
+        + "".join(f"  {k}={v}" for k, v in result.counters.items()),
+        flush=True,
+    )
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def report(args: argparse.Namespace, results: list[Result]) -> dict:
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "config": {
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "concurrency": args.concurrency,
+                "db_latency": args.db_latency,
+                "llm_latency": args.llm_latency,
+                "tts_latency": args.tts_latency,
+                "sticker_every": args.sticker_every,
+            },
+        },
+        "results": [asdict(result) for result in results],
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda s: [int(c) for c in s.split(",")],
+        default=[1, 8, 32],
+        help="comma-separated levels (default 1,8,32)",
+    )
+    parser.add_argument("--db-latency", type=float, default=0.001)
+    parser.add_argument("--llm-latency", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.02)
+    parser.add_argument("--sticker-every", type=int, default=5)
+    parser.add_argument("--case", action="append", help="only run these cases")
+    parser.add_argument(
+        "--quick", action="store_true", help="fewer parameter values, for CI"
+    )
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    _print_header()
+    results = asyncio.run(run(args))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report(args, results), f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of per-turn prompt assembly cost for child and parent chat.
+
+Compares:
+  rebuild  - render the system prompt and rebuild the tool declaration trees,
+             as every turn used to
+  render   - render the prompt with the prebuilt tool declarations (a memo miss)
+  memoized - a repeat turn whose memories row version is unchanged
+
+Run from backend/:  python -m benchmarks.bench_prompt [--iterations N]
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "dummy")
+
+from google.genai import types
+
+from services import prompts
+from services.llm_service import (
+    _build_child_chat_config,
+    _build_parent_chat_config,
+)
+from services.memory_service import MemorySnapshot
+
+SNAPSHOT = MemorySnapshot(
+    identity={
+        "ai": {"name": "Linxy", "persona": "a curious space explorer"},
+        "user": {"name": "Tommy", "grade_level": "1st Grade"},
+    },
+    core_instructions=[f"Practice skill number {i} every session." for i in range(10)],
+    episodic_memory=[
+        {
+            "summary": f"Session {i}: talked about dinosaurs and counting.",
+            "interests": ["dinosaurs", "space", "drawing"],
+            "milestones": ["counted to 20", "asked a why question"],
+        }
+        for i in range(5)
+    ],
+    long_term_summary="Tommy loves space and dinosaurs. " * 20,
+    updated_at="2026-01-01T00:00:00+00:00",
+)
+
+
+def _rebuild(render, tool: types.Tool) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        system_instruction=render(SNAPSHOT),
+        temperature=0.7,
+        tools=[types.Tool.model_validate(tool.model_dump())],
+    )
+
+
+def _time(fn, iterations: int, clear_memo: bool = False) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if clear_memo:
+            prompts.prompt_cache.clear()
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    cases = (
+        (
+            "child",
+            lambda: _rebuild(
+                prompts.render_child_chat_prompt, prompts.AWARD_STICKER_TOOL
+            ),
+            lambda: _build_child_chat_config("bench-user", SNAPSHOT),
+        ),
+        (
+            "parent",
+            lambda: _rebuild(
+                prompts.render_parent_chat_prompt, prompts.PARENT_ARCHITECT_TOOL
+            ),
+            lambda: _build_parent_chat_config("bench-user", SNAPSHOT),
+        ),
+    )
+
+    print(f"{'prompt':<7} {'path':<9} {'us/turn':>9} {'speedup':>8}")
+    for kind, rebuild, build in cases:
+        baseline = _time(rebuild, args.iterations)
+        for path, seconds in (
+            ("rebuild", baseline),
+            ("render", _time(build, args.iterations, clear_memo=True)),
+            ("memoized", _time(build, args.iterations)),
+        ):
+            print(
+                f"{kind:<7} {path:<9} {seconds * 1e6:>9.1f} {baseline / seconds:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compares two result files written by bench_hot_paths, e.g. from the parent
+commit and from a change. For every case both runs measured, prints the
+change in p50/p95/p99 latency and throughput, and exits with status 1 when
+p95 or throughput got worse by more than --threshold.
+
+Run from backend/:  python -m benchmarks.compare BASE.json NEW.json [--threshold 0.15]
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.bench_hot_paths import result_key
+
+DEFAULT_THRESHOLD = 0.15
+
+
+def load(path: str) -> tuple[dict, dict[str, dict]]:
+    with open(path) as f:
+        report = json.load(f)
+    results = {
+        result_key(r["case"], r["params"], r["concurrency"]): r
+        for r in report["results"]
+    }
+    return report["meta"], results
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old if old else 0.0
+
+
+def compare(base: dict[str, dict], new: dict[str, dict], threshold: float) -> list:
+    """Rows of (key, p50, p95, p99, throughput changes, regressed)."""
+    rows = []
+    for key in base.keys() & new.keys():
+        old, cur = base[key], new[key]
+        latency = [
+            change(old["latency_ms"][p], cur["latency_ms"][p])
+            for p in ("p50", "p95", "p99")
+        ]
+        throughput = change(old["throughput_rps"], cur["throughput_rps"])
+        regressed = (
+            latency[1] > threshold
+            or throughput < -threshold
+            or cur["errors"] > old["errors"]
+        )
+        rows.append((key, *latency, throughput, regressed))
+    return sorted(rows)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    base_meta, base = load(args.base)
+    new_meta, new = load(args.new)
+    print(f"base {base_meta.get('commit')}  vs  new {new_meta.get('commit')}")
+    if base_meta.get("config") != new_meta.get("config"):
+        print("warning: the runs used different settings")
+
+    rows = compare(base, new, args.threshold)
+    print(f"{'case':<56} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8}")
+    for key, p50, p95, p99, throughput, regressed in rows:
+        print(
+            f"{key:<56} {p50:>+8.1%} {p95:>+8.1%} {p99:>+8.1%} "
+            f"{throughput:>+8.1%}{'  REGRESSED' if regressed else ''}"
+        )
+    for key in sorted(base.keys() ^ new.keys()):
+        print(f"{key:<56} only in {'base' if key in base else 'new'}")
+
+    regressions = sum(row[-1] for row in rows)
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,507 @@
+"""
+In-process stand-ins for Supabase, Gemini and ElevenLabs, and
+install_fakes(), which points the services at them. Each fake sleeps for a
+configurable latency per call, so benchmarks, load runs and tests exercise
+the app's own overhead and concurrency without leaving the process.
+
+FakeSupabase covers the queries that services.memory_service issues against
+`memories` and the child tables, and mirrors the database behaviour the
+service relies on:
+  - every write to a memories row bumps its `version` and `updated_at`
+    (the trigger from migrations 002/007)
+  - append_memory_item appends atomically (migrations 001/005)
+  - update().eq("version", v) only matches while the version is unchanged
+Its execute() sleeps outside the table lock, so concurrent callers
+interleave the way real round-trips do.
+"""
+
+import asyncio
+import base64
+import copy
+import itertools
+import json
+import os
+import threading
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from typing import Any, cast
+
+import jwt
+from google.genai import types
+from supabase import Client
+
+JWT_SECRET = b"fake-backend-jwt-secret-for-benchmarks"
+# Rough characters per token, for the usage_metadata the fakes report
+CHARS_PER_TOKEN = 4
+
+
+CHILD_TABLES = {
+    "episodic_memory": "episodes",
+    "rewards": "rewards",
+    "parent_reports": "parent_reports",
+}
+
+
+class FakeResponse:
+    def __init__(self, data: list[dict], count: int | None = None) -> None:
+        self.data = data
+        self.count = count
+
+
+Condition = tuple[str, str, Any]
+
+
+def _split_top_level(filters: str) -> list[str]:
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(filters):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(filters[start:i])
+            start = i + 1
+    parts.append(filters[start:])
+    return parts
+
+
+def _parse_filters(filters: str) -> list[Condition]:
+    """Parses PostgREST's or=(...) syntax: col.op.value, and(...), or(...)."""
+    conditions: list[Condition] = []
+    for part in _split_top_level(filters):
+        if part.startswith(("and(", "or(")):
+            op, _, inner = part.partition("(")
+            conditions.append((op, "", _parse_filters(inner[:-1])))
+            continue
+        column, op, value = part.split(".", 2)
+        value = value[1:-1] if value.startswith('"') else value
+        conditions.append((op, column, int(value) if value.isdigit() else value))
+    return conditions
+
+
+def _holds(row: dict, condition: Condition) -> bool:
+    op, column, value = condition
+    if op == "and":
+        return all(_holds(row, c) for c in value)
+    if op == "or":
+        return any(_holds(row, c) for c in value)
+    if op == "eq":
+        return row.get(column) == value
+    if op == "lt":
+        return row.get(column, "") < value
+    raise NotImplementedError(op)
+
+
+def _sort_key(value: Any) -> tuple[bool, Any]:
+    # Postgres' default order: NULLs last ascending, first descending
+    return value is None, value
+
+
+class FakeQuery:
+    def __init__(
+        self, db: "FakeSupabase", table: str, action: str, payload: Any = None
+    ):
+        self.db = db
+        self.table = table
+        self.action = action
+        self.payload = payload
+        self.filters: list[tuple[str, str, Any]] = []
+        self.columns = "*"
+        self.count: str | None = None
+        self.order_by: list[tuple[str, bool]] = []
+        self.limit_to: int | None = None
+        self.options: dict[str, Any] = {}
+
+    def select(self, columns: str = "*", count: str | None = None, head: bool = False):
+        self.action = "select"
+        self.columns = columns
+        self.count = count
+        return self
+
+    def eq(self, column: str, value: Any):
+        self.filters.append(("eq", column, value))
+        return self
+
+    def lt(self, column: str, value: Any):
+        self.filters.append(("lt", column, value))
+        return self
+
+    def or_(self, filters: str):
+        self.filters.append(("or", "", _parse_filters(filters)))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, count: int):
+        self.limit_to = count
+        return self
+
+    def execute(self) -> FakeResponse:
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            self.db.round_trips += 1
+            return getattr(self, f"_{self.action}")()
+
+    def _matches(self, row: dict) -> bool:
+        return all(_holds(row, condition) for condition in self.filters)
+
+    def _select(self) -> FakeResponse:
+        rows = [
+            r for r in self.db.tables.setdefault(self.table, []) if self._matches(r)
+        ]
+        for column, desc in reversed(self.order_by):
+            rows.sort(key=lambda r: _sort_key(r.get(column)), reverse=desc)
+        count = len(rows) if self.count else None
+        if self.limit_to is not None:
+            rows = rows[: self.limit_to]
+        if self.columns != "*":
+            names = self.columns.split(",")
+            rows = [{name: r.get(name) for name in names} for r in rows]
+        return FakeResponse(copy.deepcopy(rows), count)
+
+    def _update(self) -> FakeResponse:
+        updated = []
+        for row in self.db.tables.setdefault(self.table, []):
+            if self._matches(row):
+                row.update(copy.deepcopy(self.payload))
+                self.db.touch(row)
+                updated.append(copy.deepcopy(row))
+        return FakeResponse(updated)
+
+    def _upsert(self) -> FakeResponse:
+        rows = self.db.tables.setdefault(self.table, [])
+        existing = next(
+            (r for r in rows if r["user_id"] == self.payload["user_id"]), None
+        )
+        if existing is None:
+            row = {"version": 0, **copy.deepcopy(self.payload)}
+            row["updated_at"] = self.db.now()
+            rows.append(row)
+            return FakeResponse([copy.deepcopy(row)])
+        if self.options.get("ignore_duplicates"):
+            return FakeResponse([])
+        existing.update(copy.deepcopy(self.payload))
+        self.db.touch(existing)
+        return FakeResponse([copy.deepcopy(existing)])
+
+    def _rpc(self) -> FakeResponse:
+        return self.db.call(self.table, self.payload)
+
+
+class FakeTable:
+    def __init__(self, db: "FakeSupabase", name: str) -> None:
+        self.db = db
+        self.name = name
+
+    def select(self, columns: str = "*", count: str | None = None, head: bool = False):
+        return FakeQuery(self.db, self.name, "select").select(columns, count, head)
+
+    def update(self, values: dict):
+        return FakeQuery(self.db, self.name, "update", values)
+
+    def upsert(
+        self, values: dict, on_conflict: str = "", ignore_duplicates: bool = False
+    ):
+        query = FakeQuery(self.db, self.name, "upsert", values)
+        query.options["ignore_duplicates"] = ignore_duplicates
+        return query
+
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.tables: dict[str, list[dict]] = {}
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def now() -> str:
+        return datetime.now(UTC).isoformat()
+
+    def touch(self, row: dict) -> None:
+        row["version"] = row.get("version", 0) + 1
+        row["updated_at"] = self.now()
+
+    def table(self, name: str) -> FakeTable:
+        return FakeTable(self, name)
+
+    def rpc(self, name: str, params: dict) -> FakeQuery:
+        return FakeQuery(self, name, "rpc", params)
+
+    def memories_row(self, user_id: str) -> dict | None:
+        for row in self.tables.get("memories", []):
+            if row["user_id"] == user_id:
+                return row
+        return None
+
+    def call(self, name: str, params: dict) -> FakeResponse:
+        if name != "append_memory_item":
+            raise NotImplementedError(name)
+        user_id, field, item = params["p_user_id"], params["p_field"], params["p_item"]
+        if field in CHILD_TABLES:
+            row = {
+                "id": next(self._ids),
+                "user_id": user_id,
+                "created_at": item.get("timestamp") or self.now(),
+            }
+            if field == "rewards":
+                row.update(sticker=item["sticker"], reason=item.get("reason", ""))
+            else:
+                row["episode" if field == "episodic_memory" else "report"] = item
+            self.tables.setdefault(CHILD_TABLES[field], []).append(row)
+            if field != "episodic_memory":
+                return FakeResponse([])
+        memories = self.memories_row(user_id)
+        if memories is None:
+            memories = {"user_id": user_id, "version": 0, "updated_at": self.now()}
+            self.tables.setdefault("memories", []).append(memories)
+        else:
+            self.touch(memories)
+        memories[field] = [*(memories.get(field) or []), copy.deepcopy(item)]
+        return FakeResponse([])
+
+
+def _text_of(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "".join(_text_of(item) for item in value)
+    parts = getattr(value, "parts", None) or []
+    return "".join(part.text or "" for part in parts)
+
+
+class FakeModels:
+    """client.aio.models: canned replies shaped after the requested schema."""
+
+    def __init__(self, owner: "FakeGenai") -> None:
+        self.owner = owner
+
+    def _reply(self, config: types.GenerateContentConfig | None) -> list[types.Part]:
+        n = next(self.owner.calls)
+        schema = getattr(config, "response_schema", None)
+        schema_name = getattr(schema, "__name__", "")
+        if schema_name == "ReflectionOutput":
+            body = {
+                "summary": f"Talked about rockets and counting ({n}).",
+                "interests": ["rockets", "counting"],
+                "milestones": ["counted to 20"],
+            }
+            return [types.Part.from_text(text=json.dumps(body))]
+        if schema_name == "ParentReportOutput":
+            body = {
+                "themes": ["Interest in space"],
+                "emotional_trends": ["Curious"],
+                "growth_areas": ["Counting"],
+                "parent_action_suggestions": ["Count stars together tonight."],
+            }
+            return [types.Part.from_text(text=json.dumps(body))]
+
+        # Numbered so speech for every reply is synthesized, not cached
+        parts = [
+            types.Part.from_text(
+                text=f"Wow, that is so cool! Reply number {n}. "
+                "Want to count the rockets with me? Let's go!"
+            )
+        ]
+        # Only chat turns can call tools: inline, or through the cached prefix
+        chat = getattr(config, "tools", None) or getattr(config, "cached_content", None)
+        every = self.owner.sticker_every
+        if chat and every and n % every == 0:
+            parts.append(
+                types.Part.from_function_call(
+                    name="award_sticker",
+                    args={"sticker": "Star", "reason": "Counted rockets"},
+                )
+            )
+        return parts
+
+    def _usage(self, contents: Any, config: Any, parts: list[types.Part]):
+        prompt = _text_of(contents) + str(getattr(config, "system_instruction", ""))
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=len(prompt) // CHARS_PER_TOKEN,
+            candidates_token_count=len(_text_of(parts)) // CHARS_PER_TOKEN,
+        )
+
+    def _response(self, parts: list[types.Part], usage=None):
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(content=types.Content(role="model", parts=parts))
+            ],
+            usage_metadata=usage,
+        )
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None):
+        await asyncio.sleep(self.owner.latency)
+        parts = self._reply(config)
+        return self._response(parts, self._usage(contents, config, parts))
+
+    async def generate_content_stream(
+        self, model: str, contents: Any, config: Any = None
+    ):
+        await asyncio.sleep(self.owner.latency)
+        parts = self._reply(config)
+        usage = self._usage(contents, config, parts)
+
+        async def chunks():
+            for i, part in enumerate(parts):
+                if i:
+                    await asyncio.sleep(self.owner.chunk_delay)
+                last = i == len(parts) - 1
+                yield self._response([part], usage if last else None)
+
+        return chunks()
+
+
+class FakeGenai:
+    """
+    Stand-in for genai.Client. Every call takes `latency` seconds; streamed
+    replies then deliver one part every `chunk_delay` seconds. Every
+    `sticker_every`-th chat reply awards a sticker (0 never does).
+    """
+
+    def __init__(
+        self, latency: float = 0.0, chunk_delay: float = 0.0, sticker_every: int = 0
+    ) -> None:
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.sticker_every = sticker_every
+        self.calls = itertools.count(1)
+        self.aio = SimpleNamespace(models=FakeModels(self))
+
+
+class FakeTextToSpeech:
+    def __init__(self, owner: "FakeElevenLabs") -> None:
+        self.owner = owner
+
+    async def _audio(self, text: str) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.owner.latency)
+        audio = b"\xff" * (len(text) * self.owner.bytes_per_char)
+        for start in range(0, len(audio), self.owner.chunk_size):
+            yield audio[start : start + self.owner.chunk_size]
+
+    def convert(self, text: str, voice_id: str, model_id: str):
+        return self._audio(text)
+
+    def stream(self, text: str, voice_id: str, model_id: str):
+        return self._audio(text)
+
+
+class FakeElevenLabs:
+    """Stand-in for AsyncElevenLabs: `latency` seconds to the first audio byte."""
+
+    def __init__(
+        self, latency: float = 0.0, bytes_per_char: int = 160, chunk_size: int = 4096
+    ):
+        self.latency = latency
+        self.bytes_per_char = bytes_per_char
+        self.chunk_size = chunk_size
+        self.text_to_speech = FakeTextToSpeech(self)
+
+
+@dataclass
+class Fakes:
+    db: FakeSupabase
+    gemini: FakeGenai
+    elevenlabs: FakeElevenLabs
+
+
+def install_fakes(
+    db_latency: float = 0.0,
+    llm_latency: float = 0.0,
+    tts_latency: float = 0.0,
+    chunk_delay: float = 0.0,
+    sticker_every: int = 0,
+) -> Fakes:
+    """
+    Points the services at fresh fakes and resets the per-process caches,
+    so every run starts cold. Also sets the HS256 secret make_token signs
+    with, so get_current_user verifies its tokens for real.
+    """
+    os.environ["SUPABASE_JWT_SECRET"] = base64.b64encode(JWT_SECRET).decode()
+    # Synthesized speech stays in memory; no disk tier
+    os.environ["TTS_CACHE_DIR"] = ""
+    os.environ.setdefault("GEMINI_API_KEY", "dummy")
+
+    from services import (
+        auth_service,
+        llm_service,
+        memory_cache,
+        memory_service,
+        session_store,
+        tts_cache,
+        voice_service,
+    )
+
+    fakes = Fakes(
+        db=FakeSupabase(latency=db_latency),
+        gemini=FakeGenai(llm_latency, chunk_delay, sticker_every),
+        elevenlabs=FakeElevenLabs(tts_latency),
+    )
+
+    def fake_supabase_client() -> Client:
+        # FakeSupabase answers the part of the client API the services use
+        return cast(Client, fakes.db)
+
+    memory_service.get_supabase_client = fake_supabase_client
+    llm_service.client = fakes.gemini  # type: ignore[assignment]
+    llm_service.wakeup_messages.clear()
+    voice_service._elevenlabs_client = fakes.elevenlabs  # type: ignore[assignment]
+    memory_cache._memory_cache = None
+    session_store._session_store = None
+    tts_cache._tts_cache = None
+    auth_service._token_cache.clear()
+    return fakes
+
+
+def seed_user(db: FakeSupabase, user_id: str, items: int) -> None:
+    """A memories row whose arrays hold `items` entries each."""
+    db.tables.setdefault("memories", []).append(
+        {
+            "user_id": user_id,
+            "version": 0,
+            "identity": {
+                "ai": {"name": "Linxy", "persona": "a curious space explorer"},
+                "user": {"name": "Tommy", "grade_level": "1st Grade"},
+            },
+            "core_instructions": [
+                f"Practice skill number {i} every session." for i in range(items)
+            ],
+            "episodic_memory": [
+                {
+                    "timestamp": f"2026-01-01T00:00:{i % 60:02d}+00:00",
+                    "summary": f"Session {i}: talked about dinosaurs and counting.",
+                    "interests": ["dinosaurs", "space"],
+                    "milestones": ["counted to 20"],
+                }
+                for i in range(items)
+            ],
+            "long_term_summary": "Tommy loves space and dinosaurs. " * 10,
+            "current_state": "Was counting rockets.",
+        }
+    )
+
+
+def make_token(user_id: str, ttl: float = 3600) -> str:
+    """An HS256 token that get_current_user accepts once install_fakes ran."""
+    claims = {"sub": user_id, "aud": "authenticated", "exp": int(time.time() + ttl)}
+    return jwt.encode(claims, JWT_SECRET, algorithm="HS256")
+
+
+def history(turns: int) -> list[dict]:
+    """A transcript of `turns` user/model exchanges."""
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Can we count to {i + 10}?"})
+        messages.append({"role": "model", "content": f"Sure! 1, 2, 3... {i + 10}!"})
+    return messages
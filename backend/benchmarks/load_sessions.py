@@ -0,0 +1,364 @@
+"""
+Load driver that replays child/parent sessions against the FastAPI app with
+faked backends (benchmarks.fakes), to find how many concurrent children one
+worker serves before it saturates.
+
+Each simulated child repeats this session until its step ends:
+
+  GET /chat/wakeup, --turns x POST /chat (the server keeps the growing
+  history under the returned session_id; the fake model awards a sticker
+  every --sticker-every replies), POST /chat/reflect, then the parent's
+  GET /parent/reports?summary=true
+
+with --think-time seconds (+/-50%) between requests. Every step ramps to the
+next --children level and runs for --duration seconds. Tokens are HS256
+JWTs that get_current_user verifies.
+
+A step counts as saturated once per-child throughput drops below
+--min-efficiency of the first step's, p95 latency grows past
+--max-p95-growth times the first step's, or more than --max-error-rate of
+requests fail. The curves go to --output as JSON.
+
+By default the app runs in this process (lifespan included, so reflection
+jobs are worked off too), which shares the event loop with the driver. To
+measure a real single uvicorn worker, start one with fakes installed and
+point the driver at it:
+
+  python -m benchmarks.load_sessions --serve --port 8800
+  python -m benchmarks.load_sessions --url http://127.0.0.1:8800
+
+Run from backend/:  python -m benchmarks.load_sessions [--children 1,10,50] [--duration 20]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+os.environ.setdefault("GEMINI_API_KEY", "dummy")
+# The app logs every failed request; keep the driver's table readable
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+
+from benchmarks.bench_hot_paths import _git_commit, percentile
+from benchmarks.fakes import install_fakes, make_token, seed_user
+
+DEFAULT_OUTPUT = "data/load_sessions.json"
+ENDPOINTS = ("wakeup", "chat", "reflect", "reports")
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    seconds: float
+    ok: bool
+
+
+@dataclass
+class Step:
+    children: int
+    duration: float
+    requests: int
+    errors: int
+    error_rate: float
+    throughput_rps: float
+    sessions: int
+    stickers: int
+    latency_ms: dict[str, float]
+    endpoints: dict[str, dict[str, float]]
+    saturated: bool = False
+    reasons: list[str] = field(default_factory=list)
+
+
+def _latency(seconds: list[float]) -> dict[str, float]:
+    ms = sorted(value * 1000 for value in seconds)
+    return {
+        "p50": round(percentile(ms, 0.50), 2),
+        "p95": round(percentile(ms, 0.95), 2),
+        "p99": round(percentile(ms, 0.99), 2),
+    }
+
+
+class Child:
+    """One simulated child, replaying sessions until the deadline."""
+
+    def __init__(
+        self, client: httpx.AsyncClient, n: int, args: argparse.Namespace
+    ) -> None:
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {make_token(child_id(n))}"}
+        self.args = args
+        self.samples: list[Sample] = []
+        self.sessions = 0
+        self.stickers = 0
+
+    async def _think(self) -> None:
+        if self.args.think_time:
+            await asyncio.sleep(self.args.think_time * random.uniform(0.5, 1.5))
+
+    async def _request(
+        self, endpoint: str, method: str, path: str, **kwargs: Any
+    ) -> dict | None:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(
+                method, path, headers=self.headers, **kwargs
+            )
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.samples.append(Sample(endpoint, time.perf_counter() - started, ok))
+        return response.json() if ok and response is not None else None
+
+    async def run(self, deadline: float) -> None:
+        # Requests are only started before the deadline; the step waits for
+        # the ones in flight
+        def running() -> bool:
+            return time.monotonic() < deadline
+
+        while running():
+            await self._request("wakeup", "GET", "/chat/wakeup")
+            session_id = None
+            for turn in range(self.args.turns):
+                await self._think()
+                if not running():
+                    return
+                body = {"message": f"Can we count to {10 * (turn + 1)}?"}
+                if session_id:
+                    body["session_id"] = session_id
+                reply = await self._request("chat", "POST", "/chat", json=body)
+                if reply:
+                    session_id = reply.get("session_id") or session_id
+                    self.stickers += bool(reply.get("awarded_sticker"))
+            if not running():
+                return
+            await self._request(
+                "reflect", "POST", "/chat/reflect", json={"session_id": session_id}
+            )
+            await self._request(
+                "reports", "GET", "/parent/reports", params={"summary": "true"}
+            )
+            self.sessions += 1
+            await self._think()
+
+
+def child_id(n: int) -> str:
+    return f"load-child-{n}"
+
+
+async def run_step(
+    client: httpx.AsyncClient, children: int, args: argparse.Namespace
+) -> Step:
+    crowd = [Child(client, n, args) for n in range(children)]
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(*(child.run(deadline) for child in crowd))
+    elapsed = time.monotonic() - started
+
+    samples = [sample for child in crowd for sample in child.samples]
+    by_endpoint: dict[str, list[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+    errors = sum(not sample.ok for sample in samples)
+    return Step(
+        children=children,
+        duration=round(elapsed, 2),
+        requests=len(samples),
+        errors=errors,
+        error_rate=round(errors / len(samples), 4) if samples else 0.0,
+        throughput_rps=round(len(samples) / elapsed, 2),
+        sessions=sum(child.sessions for child in crowd),
+        stickers=sum(child.stickers for child in crowd),
+        latency_ms=_latency([s.seconds for s in samples if s.ok]),
+        endpoints={
+            name: {
+                "requests": len(group),
+                "errors": sum(not s.ok for s in group),
+                **_latency([s.seconds for s in group if s.ok]),
+            }
+            for name, group in sorted(by_endpoint.items())
+        },
+    )
+
+
+def mark_saturation(steps: list[Step], args: argparse.Namespace) -> int | None:
+    """
+    Flags the saturated steps against the first one, the least loaded.
+    Returns the most children served before the first saturated step.
+    """
+    if not steps:
+        return None
+    base = steps[0]
+    base_per_child = base.throughput_rps / base.children
+    for step in steps:
+        if base_per_child and step.throughput_rps / step.children < (
+            args.min_efficiency * base_per_child
+        ):
+            step.reasons.append("throughput per child fell")
+        if base.latency_ms["p95"] and step.latency_ms["p95"] > (
+            args.max_p95_growth * base.latency_ms["p95"]
+        ):
+            step.reasons.append("p95 latency grew")
+        if step.error_rate > args.max_error_rate:
+            step.reasons.append("error rate")
+        step.saturated = bool(step.reasons)
+
+    served = None
+    for step in steps:
+        if step.saturated:
+            break
+        served = step.children
+    return served
+
+
+@contextlib.asynccontextmanager
+async def _client(args: argparse.Namespace) -> AsyncIterator[httpx.AsyncClient]:
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            yield client
+        return
+
+    _install(args)
+    from main import app
+
+    # Runs the lifespan too, so the job queue works off the reflections
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://load", timeout=timeout
+        ) as client:
+            yield client
+
+
+def _install(args: argparse.Namespace) -> None:
+    if not os.environ.get("JOB_QUEUE_PATH"):
+        # A throwaway queue, not the one local dev runs use
+        jobs = tempfile.mkdtemp(prefix="linxy-load-")
+        os.environ["JOB_QUEUE_PATH"] = os.path.join(jobs, "jobs.sqlite3")
+    fakes = install_fakes(
+        db_latency=args.db_latency,
+        llm_latency=args.llm_latency,
+        tts_latency=args.tts_latency,
+        sticker_every=args.sticker_every,
+    )
+    for n in range(max(args.children)):
+        seed_user(fakes.db, child_id(n), args.memory_items)
+
+
+async def run(args: argparse.Namespace) -> tuple[list[Step], int | None]:
+    steps = []
+    async with _client(args) as client:
+        for children in args.children:
+            step = await run_step(client, children, args)
+            steps.append(step)
+            mark_saturation(steps, args)
+            _print_row(step)
+    return steps, mark_saturation(steps, args)
+
+
+def serve(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    _install(args)
+    from main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+def _print_header() -> None:
+    columns = "".join(f"{name + ' p95':>13}" for name in ENDPOINTS)
+    print(
+        f"{'children':>8} {'req/s':>8} {'sessions':>8} {'err %':>6} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}{columns}"
+    )
+
+
+def _print_row(step: Step) -> None:
+    columns = "".join(
+        f"{step.endpoints.get(name, {}).get('p95', 0):>13.1f}" for name in ENDPOINTS
+    )
+    latency = step.latency_ms
+    print(
+        f"{step.children:>8} {step.throughput_rps:>8.1f} {step.sessions:>8} "
+        f"{step.error_rate:>6.1%} {latency['p50']:>8.1f} {latency['p95']:>8.1f} "
+        f"{latency['p99']:>8.1f}{columns}"
+        f"{'  saturated: ' + ', '.join(step.reasons) if step.saturated else ''}",
+        flush=True,
+    )
+
+
+def report(args: argparse.Namespace, steps: list[Step], served: int | None) -> dict:
+    config = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "serve", "host", "port")
+    }
+    return {
+        "meta": {"commit": _git_commit(), "config": config},
+        "max_children_before_saturation": served,
+        "steps": [asdict(step) for step in steps],
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--children",
+        type=lambda s: [int(c) for c in s.split(",")],
+        default=[1, 10, 25, 50, 100, 200],
+        help="comma-separated concurrent children per step",
+    )
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--think-time", type=float, default=1.0)
+    parser.add_argument("--sticker-every", type=int, default=5)
+    parser.add_argument("--memory-items", type=int, default=20)
+    parser.add_argument("--db-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.6)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--min-efficiency", type=float, default=0.8)
+    parser.add_argument("--max-p95-growth", type=float, default=2.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--url", help="drive a running server instead")
+    parser.add_argument(
+        "--serve", action="store_true", help="run a faked-backend server only"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    if args.serve:
+        serve(args)
+        return
+
+    _print_header()
+    steps, served = asyncio.run(run(args))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report(args, steps, served), f, indent=2)
+    if served is None:
+        print("\nSaturated at the first step; start lower")
+    elif served == args.children[-1]:
+        print(f"\nNot saturated up to {served} children")
+    else:
+        print(f"\nServed {served} concurrent children before saturating")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,3 +6,51 @@ import pytest
 def set_dummy_env():
     if "GEMINI_API_KEY" not in os.environ:
         os.environ["GEMINI_API_KEY"] = "dummy"
+
+
+@pytest.fixture
+def anyio_backend():
+    # The API only ever runs under uvicorn's asyncio loop
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def fresh_memory_cache(monkeypatch):
+    # Each test starts with an empty memory cache instead of rows left by others
+    monkeypatch.setattr("services.memory_cache._memory_cache", None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_wakeup_messages():
+    # A greeting kept by one test must not answer another test's wakeup
+    from services import llm_service
+
+    llm_service.wakeup_messages.clear()
+
+
+@pytest.fixture
+def restore_services(monkeypatch, tmp_path):
+    # benchmarks.fakes.install_fakes() swaps these out; put them back afterwards
+    from services import (
+        job_queue,
+        llm_service,
+        memory_cache,
+        memory_service,
+        session_store,
+        tts_cache,
+        voice_service,
+    )
+
+    for module, name in (
+        (memory_service, "get_supabase_client"),
+        (llm_service, "client"),
+        (voice_service, "_elevenlabs_client"),
+        (memory_cache, "_memory_cache"),
+        (session_store, "_session_store"),
+        (tts_cache, "_tts_cache"),
+        (job_queue, "_job_queue"),
+    ):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    for var in ("SUPABASE_JWT_SECRET", "TTS_CACHE_DIR"):
+        monkeypatch.setenv(var, os.environ.get(var, ""))
+    monkeypatch.setenv("JOB_QUEUE_PATH", str(tmp_path / "jobs.sqlite3"))
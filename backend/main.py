@@ -3,27 +3,82 @@ from dotenv import load_dotenv
 # Load environment variables FIRST before any other local imports
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, Depends  # noqa: E402
-from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
-from pydantic import BaseModel  # noqa: E402
-from services.auth_service import get_current_user  # noqa: E402
-from services.llm_service import (  # noqa: E402
+import hashlib
+import json
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, HTTPException, Query, status
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from routers.sse import sse_response
+from routers.voice import router as voice_router
+from services.auth_service import get_current_user
+from services.job_queue import close_job_queue, get_job_queue
+from services.jwks import close_jwks_manager
+from services.llm_service import (
+    REFLECTION_JOB,
+    describe_child_context,
     generate_chat_response,
-    run_session_reflection,
     generate_parent_chat_response,
     generate_wakeup_message,
+    run_reflection_job,
+    stream_chat_response,
+    stream_parent_chat_response,
 )
-from services.memory_service import (  # noqa: E402
+from services.memory_cache import close_memory_cache
+from services.memory_service import (
+    HistoryCursor,
     add_core_instruction,
-    add_episodic_memory,
-    get_rewards,
-    get_parent_reports,
     get_all_memories,
+    get_parent_reports,
+    get_parent_reports_summary,
+    get_rewards,
+    get_rewards_summary,
     update_identity_dict,
 )
-from routers.voice import router as voice_router  # noqa: E402
+from services.metrics import MetricsMiddleware, render_metrics
+from services.session_store import get_session_store
+from services.structured_logging import (
+    RequestIdMiddleware,
+    close_logging,
+    configure_logging,
+)
+from services.tracing import (
+    TracingMiddleware,
+    close_tracing,
+    configure_tracing,
+)
+from services.voice_service import (
+    close_elevenlabs_client,
+    get_elevenlabs_client,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    configure_logging()
+    configure_tracing()
+    # Open the pooled TTS connection once instead of per request
+    get_elevenlabs_client()
+    job_queue = get_job_queue()
+    job_queue.register(REFLECTION_JOB, run_reflection_job)
+    await job_queue.start()
+    yield
+    await close_job_queue()
+    await close_memory_cache()
+    await close_elevenlabs_client()
+    await close_jwks_manager()
+    close_tracing()
+    close_logging()
 
-app = FastAPI(title="Linxy API")
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Linxy API", lifespan=lifespan)
 
 app.include_router(voice_router)
 
@@ -34,6 +89,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so they wrap CORS too and see the whole request; the request
+# span is outside the metrics work, and the request id outside both
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 
 class ChatMessage(BaseModel):
@@ -43,23 +103,66 @@ class ChatMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
+    # Send session_id to continue a server-side session. history is only
+    # needed by clients that do not track sessions yet.
+    session_id: str | None = None
     history: list[ChatMessage] = []
 
 
 class ChatResponse(BaseModel):
     reply: str
     awarded_sticker: dict | None = None
+    session_id: str | None = None
 
 
 class ParentCommandRequest(BaseModel):
     command: str
 
 
+async def _open_session(user_id: str, req: ChatRequest) -> tuple[str, list[dict]]:
+    """
+    Returns the session id and prior transcript for a chat turn.
+    A request without a known session starts a new one, seeded with
+    whatever history the client sent.
+    """
+    store = get_session_store()
+    if req.session_id:
+        history = await store.get_history(user_id, req.session_id)
+        if history or not req.history:
+            return req.session_id, history
+        session_id = req.session_id
+    else:
+        session_id = store.new_session_id()
+
+    history = [{"role": msg.role, "content": msg.content} for msg in req.history]
+    if history:
+        await store.add_messages(user_id, session_id, history)
+    return session_id, history
+
+
+async def _persist_parent_chat_result(user_id: str, result: dict) -> None:
+    saved_instruction = result.get("saved_instruction")
+    updated_identity = result.get("updated_identity")
+
+    if saved_instruction:
+        await add_core_instruction(user_id, saved_instruction.strip())
+
+    if updated_identity:
+        await update_identity_dict(user_id, updated_identity)
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Linxy API - The Digital Bridge"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus scrape target: latencies, stage timings, tokens, cache hits."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/chat/wakeup")
 async def wakeup_endpoint(user_id: str = Depends(get_current_user)):
     try:
@@ -69,11 +172,50 @@ async def wakeup_endpoint(user_id: str = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Page sizes for the reward and report history endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Entries listed by summary mode
+DEFAULT_SUMMARY_LATEST = 5
+MAX_SUMMARY_LATEST = 50
+
+
+def _history_cursor(before: str | None) -> HistoryCursor | None:
+    if before is None:
+        return None
+    try:
+        return HistoryCursor.parse(before)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from None
+
+
+def _next_before(page: list[dict], limit: int) -> str | None:
+    """Cursor for the next (older) page, or None on the last page."""
+    if len(page) < limit or not page:
+        return None
+    oldest = page[0]
+    return str(HistoryCursor(oldest["created_at"], oldest["id"]))
+
+
 @app.get("/child/rewards")
-async def rewards_endpoint(user_id: str = Depends(get_current_user)):
+async def rewards_endpoint(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: str | None = None,
+    summary: bool = False,
+    latest: int = Query(DEFAULT_SUMMARY_LATEST, ge=0, le=MAX_SUMMARY_LATEST),
+    user_id: str = Depends(get_current_user),
+):
+    """
+    One page of stickers, oldest first, from the newest `limit` earned
+    before `before`. Pass next_before back as `before` for the next page.
+    With summary=true, returns counts by sticker and the `latest` stickers.
+    """
+    cursor = _history_cursor(before)
     try:
-        rewards = await get_rewards(user_id)
-        return {"rewards": rewards}
+        if summary:
+            return await get_rewards_summary(user_id, latest)
+        rewards = await get_rewards(user_id, limit=limit, before=cursor)
+        return {"rewards": rewards, "next_before": _next_before(rewards, limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -81,53 +223,166 @@ async def rewards_endpoint(user_id: str = Depends(get_current_user)):
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(req: ChatRequest, user_id: str = Depends(get_current_user)):
     try:
-        # Convert Pydantic model history to list of dicts for LLM service
-        history_dicts = [
-            {"role": msg.role, "content": msg.content} for msg in req.history
-        ]
+        session_id, history_dicts = await _open_session(user_id, req)
         result = await generate_chat_response(user_id, req.message, history_dicts)
 
         # Handle dict response
         if isinstance(result, dict):
-            return ChatResponse(
-                reply=result.get("reply", ""),
-                awarded_sticker=result.get("awarded_sticker"),
-            )
+            reply = result.get("reply", "")
+            awarded_sticker = result.get("awarded_sticker")
         else:
             # Fallback if service returns str (should not happen with updated service)
-            return ChatResponse(reply=str(result))
+            reply, awarded_sticker = str(result), None
+
+        await get_session_store().add_turn(user_id, session_id, req.message, reply)
+        return ChatResponse(
+            reply=reply, awarded_sticker=awarded_sticker, session_id=session_id
+        )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(
+    req: ChatRequest, user_id: str = Depends(get_current_user)
+):
+    session_id, history_dicts = await _open_session(user_id, req)
+
+    async def events() -> AsyncIterator[dict]:
+        async for item in stream_chat_response(user_id, req.message, history_dicts):
+            if item["event"] == "done":
+                await get_session_store().add_turn(
+                    user_id, session_id, req.message, item["data"]["reply"]
+                )
+                item["data"]["session_id"] = session_id
+            yield item
+
+    return sse_response(events())
+
+
+# How long a repeated End Session maps onto the job it already queued
+REFLECTION_DEDUP_SECONDS = 600
+
+
 class ReflectionRequest(BaseModel):
-    history: list[ChatMessage]
+    # With session_id the transcript comes from the session store, and the
+    # session is closed. history is the fallback for sessionless clients.
+    session_id: str | None = None
+    history: list[ChatMessage] = []
+
+
+class ReflectionAccepted(BaseModel):
+    status: str
+    job_id: str
 
 
-@app.post("/chat/reflect")
+class JobStatusResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    completed_stages: list[str]
+    # Best-effort stages that gave up, e.g. the parent report
+    failed_stages: list[str] = []
+    result: dict | None = None
+    error: str | None = None
+
+
+def _reflection_key(user_id: str, session_id: str | None, history: list[dict]) -> str:
+    if session_id:
+        return f"{REFLECTION_JOB}:{user_id}:{session_id}"
+    digest = hashlib.sha256(json.dumps(history, sort_keys=True).encode()).hexdigest()
+    return f"{REFLECTION_JOB}:{user_id}:{digest}"
+
+
+@app.post(
+    "/chat/reflect",
+    response_model=ReflectionAccepted,
+    status_code=status.HTTP_202_ACCEPTED,
+)
 async def reflect_endpoint(
     req: ReflectionRequest, user_id: str = Depends(get_current_user)
 ):
+    """Queues the end-of-session reflection; poll /jobs/{job_id} for the outcome."""
     try:
-        history_dicts = [
-            {"role": msg.role, "content": msg.content} for msg in req.history
-        ]
-        reflection_result = await run_session_reflection(user_id, history_dicts)
-        await add_episodic_memory(user_id, reflection_result)
-        return {"status": "success", "reflection": reflection_result}
+        store = get_session_store()
+        history_dicts = []
+        if req.session_id:
+            history_dicts = await store.get_history(user_id, req.session_id)
+        if not history_dicts:
+            history_dicts = [
+                {"role": msg.role, "content": msg.content} for msg in req.history
+            ]
+        job = await get_job_queue().enqueue(
+            REFLECTION_JOB,
+            user_id,
+            {"history": history_dicts},
+            idempotency_key=_reflection_key(user_id, req.session_id, history_dicts),
+            # A repeated End Session reuses the job for this long after it was
+            # queued; a later identical session is reflected on again
+            dedup_seconds=REFLECTION_DEDUP_SECONDS,
+        )
+        # Only once the job holds the transcript, so a failed enqueue loses
+        # nothing and the client can retry
+        if req.session_id:
+            await store.end_session(user_id, req.session_id)
+        return ReflectionAccepted(status=job.status, job_id=job.id)
     except Exception as e:
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Request failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _failed(stage_output: object) -> bool:
+    return isinstance(stage_output, dict) and "error" in stage_output
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def job_status_endpoint(job_id: str, user_id: str = Depends(get_current_user)):
+    job = await get_job_queue().get(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatusResponse(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        # Stage outputs stay server-side; only which stages finished is shown
+        completed_stages=[
+            stage for stage, value in job.progress.items() if not _failed(value)
+        ],
+        failed_stages=[
+            stage for stage, value in job.progress.items() if _failed(value)
+        ],
+        result=job.result,
+        error=job.error,
+    )
+
+
 @app.get("/parent/reports")
-async def parent_reports_endpoint(user_id: str = Depends(get_current_user)):
+async def parent_reports_endpoint(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: str | None = None,
+    summary: bool = False,
+    latest: int = Query(DEFAULT_SUMMARY_LATEST, ge=0, le=MAX_SUMMARY_LATEST),
+    user_id: str = Depends(get_current_user),
+):
+    """Paged like /child/rewards; summary=true returns the count and latest reports."""
+    cursor = _history_cursor(before)
     try:
-        reports = await get_parent_reports(user_id)
-        return {"status": "success", "reports": reports}
+        if summary:
+            return {
+                "status": "success",
+                **await get_parent_reports_summary(user_id, latest),
+            }
+        reports = await get_parent_reports(user_id, limit=limit, before=cursor)
+        return {
+            "status": "success",
+            "reports": reports,
+            "next_before": _next_before(reports, limit),
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -137,29 +392,41 @@ async def parent_chat_endpoint(
     req: ChatRequest, user_id: str = Depends(get_current_user)
 ):
     try:
-        history_dicts = [
-            {"role": msg.role, "content": msg.content} for msg in req.history
-        ]
+        session_id, history_dicts = await _open_session(user_id, req)
         result = await generate_parent_chat_response(
             user_id, req.message, history_dicts
         )
 
+        await _persist_parent_chat_result(user_id, result)
+
         reply = result.get("reply", "")
-        saved_instruction = result.get("saved_instruction")
-        updated_identity = result.get("updated_identity")
+        await get_session_store().add_turn(user_id, session_id, req.message, reply)
+        return ChatResponse(reply=reply, session_id=session_id)
+    except Exception as e:
+        logger.exception("Request failed")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if saved_instruction:
-            await add_core_instruction(user_id, saved_instruction.strip())
 
-        if updated_identity:
-            await update_identity_dict(user_id, updated_identity)
+@app.post("/parent/chat/stream")
+async def parent_chat_stream_endpoint(
+    req: ChatRequest, user_id: str = Depends(get_current_user)
+):
+    session_id, history_dicts = await _open_session(user_id, req)
 
-        return ChatResponse(reply=reply)
-    except Exception as e:
-        import traceback
+    async def events() -> AsyncIterator[dict]:
+        async for item in stream_parent_chat_response(
+            user_id, req.message, history_dicts
+        ):
+            if item["event"] == "done":
+                # Persist before telling the client the turn is complete
+                await _persist_parent_chat_result(user_id, item["data"])
+                await get_session_store().add_turn(
+                    user_id, session_id, req.message, item["data"]["reply"]
+                )
+                item["data"]["session_id"] = session_id
+            yield item
 
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    return sse_response(events())
 
 
 @app.post("/parent/command")
@@ -173,6 +440,20 @@ async def parent_command_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/debug/context")
+async def debug_context(
+    session_id: str | None = None, user_id: str = Depends(get_current_user)
+):
+    """Per-section token counts the budgeter would choose for the next turn."""
+    try:
+        history = []
+        if session_id:
+            history = await get_session_store().get_history(user_id, session_id)
+        return await describe_child_context(user_id, history)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/debug/memories")
 async def debug_memories(user_id: str = Depends(get_current_user)):
     try:
@@ -0,0 +1,31 @@
+-- Atomic, single round-trip append to the JSONB array columns of `memories`.
+-- Replaces the read-modify-upsert pattern, which costs two round-trips and
+-- silently drops one of two concurrent appends.
+
+CREATE OR REPLACE FUNCTION append_memory_item(
+    p_user_id UUID,
+    p_field TEXT,
+    p_item JSONB
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY INVOKER
+AS $$
+BEGIN
+    IF p_field NOT IN ('core_instructions', 'episodic_memory', 'rewards', 'parent_reports') THEN
+        RAISE EXCEPTION 'append_memory_item: unsupported field %', p_field;
+    END IF;
+
+    -- jsonb_build_array wraps the item so objects are appended, not merged
+    EXECUTE format(
+        'INSERT INTO memories (user_id, %1$I)
+         VALUES ($1, jsonb_build_array($2))
+         ON CONFLICT (user_id) DO UPDATE
+         SET %1$I = COALESCE(memories.%1$I, ''[]''::jsonb) || jsonb_build_array($2),
+             updated_at = TIMEZONE(''utc''::text, NOW())',
+        p_field
+    ) USING p_user_id, p_item;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION append_memory_item(UUID, TEXT, JSONB) TO authenticated;
@@ -0,0 +1,18 @@
+-- Keep memories.updated_at current on every write. The backend treats it as
+-- the row version, e.g. to know when a memoized system prompt is stale.
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- clock_timestamp() so two writes in one transaction still differ
+    NEW.updated_at = clock_timestamp();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS memories_touch_updated_at ON memories;
+CREATE TRIGGER memories_touch_updated_at
+BEFORE UPDATE ON memories
+FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
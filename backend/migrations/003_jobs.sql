@@ -0,0 +1,52 @@
+-- Durable background jobs (JOB_QUEUE_BACKEND=postgres). Mirrors the SQLite
+-- table in services/job_queue.py. Times are epoch seconds, as the workers
+-- schedule retries against their own clock.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id UUID NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at DOUBLE PRECISION NOT NULL,
+    locked_until DOUBLE PRECISION,
+    idempotency_key TEXT UNIQUE,
+    progress JSONB NOT NULL DEFAULT '{}'::jsonb,
+    result JSONB,
+    error TEXT,
+    created_at DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (status, run_at);
+
+-- No policies: only the backend's service-role key touches jobs, and clients
+-- read status through /jobs/{id}
+ALTER TABLE jobs ENABLE ROW LEVEL SECURITY;
+
+-- Claims the next due job, or one whose worker's lease ran out. SKIP LOCKED
+-- lets several API instances poll the table without handing out a job twice.
+CREATE OR REPLACE FUNCTION claim_job(
+    p_now DOUBLE PRECISION,
+    p_lease_seconds DOUBLE PRECISION
+)
+RETURNS SETOF jobs
+LANGUAGE sql
+AS $$
+    UPDATE jobs
+    SET status = 'running',
+        attempts = attempts + 1,
+        locked_until = p_now + p_lease_seconds,
+        updated_at = p_now
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE (status = 'queued' AND run_at <= p_now)
+           OR (status = 'running' AND locked_until < p_now)
+        ORDER BY run_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *;
+$$;
@@ -0,0 +1,6 @@
+-- Structured long-term summary (interests, milestones and themes, with counts
+-- and recency) that each new episode is folded into. long_term_summary keeps
+-- the rendered text that the prompts read.
+
+ALTER TABLE memories
+ADD COLUMN IF NOT EXISTS long_term_state JSONB DEFAULT '{}'::jsonb;
@@ -0,0 +1,103 @@
+-- Append-only child tables for episodes, rewards and parent reports. The JSONB
+-- arrays on `memories` grew with account age and were read and rewritten in
+-- full; these rows are read by indexed range queries instead.
+--
+-- After applying, copy the existing arrays over with
+--   python -m scripts.backfill_child_tables
+-- memories.episodic_memory stays as the short recent window used in prompts.
+
+CREATE TABLE IF NOT EXISTS episodes (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    episode JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp() NOT NULL,
+    -- Position in the legacy JSONB array, so the backfill can be re-run
+    legacy_position INTEGER,
+    UNIQUE (user_id, legacy_position)
+);
+
+CREATE TABLE IF NOT EXISTS rewards (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    sticker TEXT NOT NULL,
+    reason TEXT NOT NULL DEFAULT '',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp() NOT NULL,
+    legacy_position INTEGER,
+    UNIQUE (user_id, legacy_position)
+);
+
+CREATE TABLE IF NOT EXISTS parent_reports (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    report JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp() NOT NULL,
+    legacy_position INTEGER,
+    UNIQUE (user_id, legacy_position)
+);
+
+-- Newest-first range scans per user
+CREATE INDEX IF NOT EXISTS episodes_user_created ON episodes (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS rewards_user_created ON rewards (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS parent_reports_user_created ON parent_reports (user_id, created_at DESC, id DESC);
+
+ALTER TABLE episodes ENABLE ROW LEVEL SECURITY;
+ALTER TABLE rewards ENABLE ROW LEVEL SECURITY;
+ALTER TABLE parent_reports ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own episodes"
+ON episodes FOR SELECT USING (auth.uid() = user_id);
+CREATE POLICY "Users can insert their own episodes"
+ON episodes FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can view their own rewards"
+ON rewards FOR SELECT USING (auth.uid() = user_id);
+CREATE POLICY "Users can insert their own rewards"
+ON rewards FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can view their own parent reports"
+ON parent_reports FOR SELECT USING (auth.uid() = user_id);
+CREATE POLICY "Users can insert their own parent reports"
+ON parent_reports FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+-- Appends now insert one row into the matching child table. Episodes are also
+-- appended to the recent window in memories.episodic_memory, and core
+-- instructions stay on the memories row.
+CREATE OR REPLACE FUNCTION append_memory_item(
+    p_user_id UUID,
+    p_field TEXT,
+    p_item JSONB
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY INVOKER
+AS $$
+DECLARE
+    v_created_at TIMESTAMP WITH TIME ZONE :=
+        COALESCE((p_item->>'timestamp')::TIMESTAMP WITH TIME ZONE, clock_timestamp());
+BEGIN
+    IF p_field = 'rewards' THEN
+        INSERT INTO rewards (user_id, sticker, reason, created_at)
+        VALUES (p_user_id, p_item->>'sticker', COALESCE(p_item->>'reason', ''), v_created_at);
+        RETURN;
+    ELSIF p_field = 'parent_reports' THEN
+        INSERT INTO parent_reports (user_id, report, created_at)
+        VALUES (p_user_id, p_item, v_created_at);
+        RETURN;
+    ELSIF p_field = 'episodic_memory' THEN
+        INSERT INTO episodes (user_id, episode, created_at)
+        VALUES (p_user_id, p_item, v_created_at);
+    ELSIF p_field <> 'core_instructions' THEN
+        RAISE EXCEPTION 'append_memory_item: unsupported field %', p_field;
+    END IF;
+
+    -- jsonb_build_array wraps the item so objects are appended, not merged
+    EXECUTE format(
+        'INSERT INTO memories (user_id, %1$I)
+         VALUES ($1, jsonb_build_array($2))
+         ON CONFLICT (user_id) DO UPDATE
+         SET %1$I = COALESCE(memories.%1$I, ''[]''::jsonb) || jsonb_build_array($2),
+             updated_at = TIMEZONE(''utc''::text, NOW())',
+        p_field
+    ) USING p_user_id, p_item;
+END;
+$$;
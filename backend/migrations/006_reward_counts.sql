@@ -0,0 +1,17 @@
+-- Sticker counts for the rewards summary, grouped in the database so the
+-- dashboard does not have to download every reward to count them.
+
+CREATE INDEX IF NOT EXISTS rewards_user_sticker ON rewards (user_id, sticker);
+
+CREATE OR REPLACE FUNCTION reward_counts(p_user_id UUID)
+RETURNS TABLE (sticker TEXT, count BIGINT)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    SELECT sticker, COUNT(*) AS count
+    FROM rewards
+    WHERE user_id = p_user_id
+    GROUP BY sticker
+    ORDER BY count DESC, sticker;
+$$;
@@ -0,0 +1,21 @@
+-- Row version for optimistic concurrency on memories. Every write bumps it,
+-- and read-modify-write callers update only while it is still the version
+-- they read (memory_service.update_memory_row), so concurrent writers
+-- retry instead of overwriting each other.
+
+ALTER TABLE memories
+ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+-- Extends the trigger function from 002, so upserts and append_memory_item
+-- bump the version too
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- clock_timestamp() so two writes in one transaction still differ
+    NEW.updated_at = clock_timestamp();
+    NEW.version = OLD.version + 1;
+    RETURN NEW;
+END;
+$$;
@@ -0,0 +1,8 @@
+-- Finished jobs no longer keep their payload (services/job_queue.py clears
+-- it when a job succeeds or fails for good), as a reflection job's payload
+-- is the child's raw transcript. Clears the payloads stored before that.
+
+UPDATE jobs
+SET payload = '{}'::jsonb
+WHERE status IN ('succeeded', 'failed')
+  AND payload <> '{}'::jsonb;
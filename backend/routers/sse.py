@@ -0,0 +1,26 @@
+import json
+from collections.abc import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """Formats service events as Server-Sent Events, ending with "error" on failure."""
+    try:
+        async for item in events:
+            yield _sse(item["event"], item["data"])
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+
+
+def sse_response(events: AsyncIterator[dict]) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream and defeating the point of it
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
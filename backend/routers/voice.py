@@ -1,9 +1,12 @@
+import base64
+
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-import base64
+
+from routers.sse import sse_response
 from services.auth_service import get_current_user
-from services.llm_service import generate_chat_response
-from services.voice_service import generate_speech
+from services.llm_service import generate_chat_response, stream_chat_response
+from services.voice_service import generate_speech, stream_reply_events
 
 router = APIRouter()
 
@@ -39,3 +42,21 @@ async def process_voice(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/chat/voice/stream")
+async def process_voice_stream(
+    request: VoiceRequest, user_id: str = Depends(get_current_user)
+):
+    """
+    Streams the reply as Server-Sent Events: the "token" and "sticker"
+    events of /chat/stream, interleaved with "audio" events carrying base64
+    MPEG chunks, then "done" with the full reply. Synthesis starts on the
+    first complete sentence while the LLM is still generating the rest.
+    """
+    if not request.text or not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+
+    return sse_response(
+        stream_reply_events(stream_chat_response(user_id, request.text))
+    )
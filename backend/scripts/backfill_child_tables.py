@@ -0,0 +1,166 @@
+"""
+Copies the legacy JSONB arrays on `memories` into the child tables.
+
+Run once from backend/, right after applying migrations/005_child_tables.sql
+and with a service-role SUPABASE_KEY (the tables have row level security):
+
+    python -m scripts.backfill_child_tables [--dry-run] [--batch-size N]
+
+  memories.episodic_memory -> episodes
+  memories.rewards         -> rewards
+  memories.parent_reports  -> parent_reports
+
+Rewards and parent reports keep their array position in legacy_position,
+so re-running the script skips rows that were already copied. Those arrays
+no longer change once the migration is applied. The episode window does:
+new episodes land in both the array and the table, and reflection trims
+the oldest ones. Episodes are therefore matched on their content instead,
+and only those not yet in the table are copied. Items without a usable
+timestamp are dated at the memories row's created_at.
+"""
+
+import argparse
+import json
+from collections import Counter
+from datetime import datetime
+from typing import Any
+
+from services.supabase_client import get_supabase_client
+
+LEGACY_FIELDS = {
+    "episodic_memory": "episodes",
+    "rewards": "rewards",
+    "parent_reports": "parent_reports",
+}
+DEFAULT_BATCH_SIZE = 200
+
+
+def _created_at(item: Any, fallback: str) -> str:
+    timestamp = item.get("timestamp") if isinstance(item, dict) else None
+    if isinstance(timestamp, str):
+        try:
+            datetime.fromisoformat(timestamp)
+            return timestamp
+        except ValueError:
+            pass
+    return fallback
+
+
+def child_rows(memories_row: dict) -> dict[str, list[dict]]:
+    """The child table rows for one memories row, per table."""
+    user_id = memories_row["user_id"]
+    fallback = memories_row["created_at"]
+    rows: dict[str, list[dict]] = {}
+    for field, table in LEGACY_FIELDS.items():
+        items = memories_row.get(field)
+        if not isinstance(items, list):
+            continue
+        for position, item in enumerate(items):
+            row = {"user_id": user_id, "created_at": _created_at(item, fallback)}
+            if table == "rewards":
+                if not isinstance(item, dict) or not item.get("sticker"):
+                    continue
+                row["sticker"] = item["sticker"]
+                row["reason"] = item.get("reason") or ""
+            elif table == "episodes":
+                row["episode"] = item
+            else:
+                row["report"] = item
+            if table != "episodes":
+                row["legacy_position"] = position
+            rows.setdefault(table, []).append(row)
+    return rows
+
+
+def _episode_key(episode: Any) -> str:
+    return json.dumps(episode, sort_keys=True)
+
+
+def uncopied_episodes(rows: list[dict], copied: Counter[str]) -> list[dict]:
+    """
+    The episode rows whose content is not in the table yet. Each copied
+    episode accounts for one array item, so repeated episodes still count.
+    """
+    remaining = Counter(copied)
+    fresh = []
+    for row in rows:
+        key = _episode_key(row["episode"])
+        if remaining[key]:
+            remaining[key] -= 1
+            continue
+        fresh.append(row)
+    return fresh
+
+
+def _copied_episodes(client: Any, user_id: str, batch_size: int) -> Counter[str]:
+    copied: Counter[str] = Counter()
+    offset = 0
+    while True:
+        response = (
+            client.table("episodes")
+            .select("episode")
+            .eq("user_id", user_id)
+            .order("id")
+            .range(offset, offset + batch_size - 1)
+            .execute()
+        )
+        batch = [row for row in response.data or [] if isinstance(row, dict)]
+        copied.update(_episode_key(row["episode"]) for row in batch)
+        if len(batch) < batch_size:
+            return copied
+        offset += batch_size
+
+
+def backfill(batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False) -> dict:
+    client = get_supabase_client()
+    columns = ",".join(["user_id", "created_at", *LEGACY_FIELDS])
+    copied = {table: 0 for table in LEGACY_FIELDS.values()}
+    offset = 0
+    while True:
+        response = (
+            client.table("memories")
+            .select(columns)
+            .order("user_id")
+            .range(offset, offset + batch_size - 1)
+            .execute()
+        )
+        batch = [row for row in response.data or [] if isinstance(row, dict)]
+        for memories_row in batch:
+            for table, rows in child_rows(memories_row).items():
+                if table == "episodes":
+                    # Read after the array, so an episode appended meanwhile
+                    # is already in the table
+                    rows = uncopied_episodes(
+                        rows,
+                        _copied_episodes(client, memories_row["user_id"], batch_size),
+                    )
+                copied[table] += len(rows)
+                if dry_run or not rows:
+                    continue
+                if table == "episodes":
+                    client.table(table).insert(rows).execute()
+                    continue
+                client.table(table).upsert(
+                    rows,
+                    on_conflict="user_id,legacy_position",
+                    ignore_duplicates=True,
+                ).execute()
+        if len(batch) < batch_size:
+            return copied
+        offset += batch_size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    copied = backfill(args.batch_size, args.dry_run)
+    verb = "Would copy" if args.dry_run else "Copied"
+    for table, count in copied.items():
+        print(f"{verb} {count} rows into {table}")
+
+
+if __name__ == "__main__":
+    main()
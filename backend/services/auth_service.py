@@ -1,52 +1,81 @@
+import logging
 import os
 import jwt
 import base64
-import httpx
+import hashlib
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from services.jwks import get_jwks_manager
+from services.metrics import AUTH_TOKEN_CACHE
+from services.structured_logging import sampled
+from services.tracing import start_span
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
-# Cache for JWKS
-_jwks_cache = None
+# Verified-token cache sizing: AUTH_TOKEN_CACHE_SIZE entries, each kept for at
+# most AUTH_TOKEN_CACHE_TTL seconds and never past the token's own exp.
+DEFAULT_TOKEN_CACHE_SIZE = 1024
+DEFAULT_TOKEN_CACHE_TTL = 300
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU from token digest to user id for tokens that already passed
+    signature verification. Only the SHA-256 digest of a token is stored.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[bytes, tuple[str, float]] = OrderedDict()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> str | None:
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[digest]
+            return None
+        self._entries.move_to_end(digest)
+        return user_id
+
+    def put(self, token: str, user_id: str, exp: Any = None) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        digest = self._digest(token)
+        self._entries[digest] = (user_id, expires_at)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_token_cache = VerifiedTokenCache(
+    max_entries=int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", DEFAULT_TOKEN_CACHE_SIZE)),
+    ttl_seconds=float(os.environ.get("AUTH_TOKEN_CACHE_TTL", DEFAULT_TOKEN_CACHE_TTL)),
+)
 
 
 async def fetch_jwks():
-    """Fetch JWKS from Supabase."""
-    global _jwks_cache
-    if _jwks_cache:
-        return _jwks_cache
-
-    supabase_url = os.environ.get("SUPABASE_URL", "")
-    supabase_key = os.environ.get("SUPABASE_KEY", "")
-    if not supabase_url:
-        raise ValueError("SUPABASE_URL not configured")
-
-    # Try multiple possible JWKS endpoints
-    possible_urls = [
-        f"{supabase_url}/.well-known/jwks.json",
-        f"{supabase_url}/auth/v1/.well-known/jwks.json",
-    ]
-
-    headers = {}
-    if supabase_key:
-        headers["apikey"] = supabase_key
-        headers["Authorization"] = f"Bearer {supabase_key}"
-
-    async with httpx.AsyncClient() as client:
-        for jwks_url in possible_urls:
-            try:
-                print(f"[Auth] Trying JWKS URL: {jwks_url}")
-                response = await client.get(jwks_url, headers=headers)
-                if response.status_code == 200:
-                    _jwks_cache = response.json()
-                    print(f"[Auth] Successfully fetched JWKS from: {jwks_url}")
-                    return _jwks_cache
-            except Exception as e:
-                print(f"[Auth] Failed to fetch from {jwks_url}: {e}")
-                continue
-
-        raise ValueError("Could not fetch JWKS from any known endpoint")
+    """Fetch JWKS from Supabase, served from the shared JWKS manager's cache."""
+    return await get_jwks_manager().get_jwks()
 
 
 def get_key_from_jwks(jwks, kid):
@@ -62,7 +91,11 @@ def get_jwt_secret() -> str | bytes:
     secret = os.environ.get("SUPABASE_JWT_SECRET", "")
     if not secret:
         raise ValueError("SUPABASE_JWT_SECRET not found in environment.")
+    return _decode_jwt_secret(secret)
+
 
+@lru_cache(maxsize=4)
+def _decode_jwt_secret(secret: str) -> str | bytes:
     # Try to decode as base64 first (Supabase stores it base64 encoded)
     try:
         # Add padding if needed
@@ -74,90 +107,92 @@ def get_jwt_secret() -> str | bytes:
         return secret
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-) -> str:
-    token = credentials.credentials
+async def verify_token(token: str) -> str:
+    """Verifies a bearer token's signature and claims, returning its sub."""
+    # Get unverified header to check algorithm
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg")
+    kid = header.get("kid")
 
-    try:
-        # Get unverified header to check algorithm
-        header = jwt.get_unverified_header(token)
-        alg = header.get("alg")
-        kid = header.get("kid")
-
-        print(f"[Auth] Token algorithm: {alg}, key ID: {kid}")
-
-        if alg == "HS256":
-            # Symmetric - use JWT secret
-            secret = get_jwt_secret()
-            payload = jwt.decode(
-                token, secret, algorithms=["HS256"], audience="authenticated"
-            )
-        elif alg in ["RS256", "ES256"]:
-            # Asymmetric - fetch public key from JWKS
-            jwks = await fetch_jwks()
-            key_data = get_key_from_jwks(jwks, kid)
-
-            if not key_data:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail=f"Public key not found for kid: {kid}",
-                )
-
-            # Convert JWK to PEM format for PyJWT
-            if alg == "RS256":
-                from jwt.algorithms import RSAAlgorithm
-
-                public_key = RSAAlgorithm.from_jwk(key_data)
-            elif alg == "ES256":
-                from jwt.algorithms import ECAlgorithm
-
-                public_key = ECAlgorithm.from_jwk(key_data)
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail=f"Unsupported algorithm: {alg}",
-                )
-
-            payload = jwt.decode(
-                token,
-                public_key,  # type: ignore
-                algorithms=[alg],
-                audience="authenticated",
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=f"Unsupported algorithm: {alg}",
-            )
+    if alg == "HS256":
+        # Symmetric - use JWT secret
+        secret = get_jwt_secret()
+        payload = jwt.decode(
+            token, secret, algorithms=["HS256"], audience="authenticated"
+        )
+    elif alg in ["RS256", "ES256"]:
+        # Asymmetric - use the key parsed from the JWKS
+        public_key = await get_jwks_manager().get_key(kid)
 
-        user_id = payload.get("sub")
-        if user_id is None:
+        if public_key is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid auth credentials: no sub claim",
+                detail=f"Public key not found for kid: {kid}",
             )
 
-        print(f"[Auth] Authenticated user: {user_id}")
-        return user_id
-
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
+        payload = jwt.decode(
+            token,
+            public_key,
+            algorithms=[alg],
+            audience="authenticated",
         )
-    except jwt.InvalidTokenError as e:
-        print(f"[Auth] Invalid token error: {e}")
+    else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid token: {str(e)}",
-            headers={"WWW-Authenticate": "Bearer"},
+            detail=f"Unsupported algorithm: {alg}",
         )
-    except Exception as e:
-        print(f"[Auth] Unexpected error: {e}")
+
+    user_id = payload.get("sub")
+    if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Could not validate credentials: {str(e)}",
-            headers={"WWW-Authenticate": "Bearer"},
+            detail="Invalid auth credentials: no sub claim",
         )
+
+    logger.debug(
+        "Verified token",
+        extra={"alg": alg, "kid": kid, "user_id": user_id, **sampled()},
+    )
+    _token_cache.put(token, user_id, payload.get("exp"))
+    return user_id
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> str:
+    with start_span("auth.get_current_user") as span:
+        token = credentials.credentials
+
+        # Fast path: this exact token was verified recently and has not expired
+        cached_user_id = _token_cache.get(token)
+        if cached_user_id is not None:
+            AUTH_TOKEN_CACHE.labels("hit").inc()
+            span.set_attribute("linxy.token_cache", "hit")
+            return cached_user_id
+        AUTH_TOKEN_CACHE.labels("miss").inc()
+        span.set_attribute("linxy.token_cache", "miss")
+
+        try:
+            return await verify_token(token)
+        except HTTPException:
+            raise
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has expired",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        except jwt.InvalidTokenError as e:
+            logger.info("Invalid token: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Invalid token: {str(e)}",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        except Exception as e:
+            logger.exception("Unexpected error validating token")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Could not validate credentials: {str(e)}",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
@@ -0,0 +1,158 @@
+import math
+import os
+import re
+from dataclasses import dataclass, field, replace
+
+from .memory_service import MemorySnapshot
+from .prompts import (
+    CHILD_STATIC_PREFIX,
+    render_child_session_context,
+    render_memory_context,
+)
+
+# Token budgets per section of a child chat turn, set via
+# CONTEXT_BUDGET_SYSTEM, CONTEXT_BUDGET_MEMORIES and CONTEXT_BUDGET_HISTORY.
+# The new message and the parent directives are never trimmed.
+DEFAULT_SYSTEM_BUDGET = 4000
+DEFAULT_MEMORIES_BUDGET = 1500
+DEFAULT_HISTORY_BUDGET = 6000
+# Per-message framing overhead (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximates Gemini's token count without a network call: roughly one
+    token per four characters, but never fewer than the number of words and
+    punctuation marks.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(_PIECES.findall(text)))
+
+
+STATIC_PREFIX_TOKENS = estimate_tokens(CHILD_STATIC_PREFIX)
+
+
+@dataclass
+class ContextBudget:
+    system_prompt: int = DEFAULT_SYSTEM_BUDGET
+    memories: int = DEFAULT_MEMORIES_BUDGET
+    history: int = DEFAULT_HISTORY_BUDGET
+
+    @classmethod
+    def from_env(cls) -> "ContextBudget":
+        return cls(
+            system_prompt=int(
+                os.environ.get("CONTEXT_BUDGET_SYSTEM", DEFAULT_SYSTEM_BUDGET)
+            ),
+            memories=int(
+                os.environ.get("CONTEXT_BUDGET_MEMORIES", DEFAULT_MEMORIES_BUDGET)
+            ),
+            history=int(
+                os.environ.get("CONTEXT_BUDGET_HISTORY", DEFAULT_HISTORY_BUDGET)
+            ),
+        )
+
+
+@dataclass
+class ContextPlan:
+    """What a child chat turn will send, trimmed to fit the budget."""
+
+    snapshot: MemorySnapshot
+    history: list[dict]
+    dropped_turns: int = 0
+    tokens: dict[str, int] = field(default_factory=dict)
+    # Tokens the system prompt ran over its budget, taken from the memories
+    # and history budgets instead
+    system_overflow: int = 0
+
+
+def _message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def _system_prompt_tokens(snapshot: MemorySnapshot) -> int:
+    """The system prompt without memories, which are budgeted separately."""
+    bare = replace(snapshot, episodic_memory=[], long_term_summary="")
+    return STATIC_PREFIX_TOKENS + estimate_tokens(render_child_session_context(bare))
+
+
+def _fit_memories(snapshot: MemorySnapshot, budget: int) -> tuple[list, str, int]:
+    """
+    Drops the oldest of the recent episodes, then shortens the long-term
+    summary, until the memory section fits.
+    """
+    # Only the last three episodes are ever rendered
+    episodes = list(snapshot.episodic_memory[-3:])
+    summary = snapshot.long_term_summary
+    tokens = estimate_tokens(render_memory_context(episodes, summary))
+    while tokens > budget and episodes:
+        episodes.pop(0)
+        tokens = estimate_tokens(render_memory_context(episodes, summary))
+    if tokens > budget and summary:
+        summary = summary[: max(0, budget * 4 - 40)].rstrip() + "..."
+        tokens = estimate_tokens(render_memory_context(episodes, summary))
+    return episodes, summary, tokens
+
+
+def _fit_history(history: list[dict], budget: int) -> tuple[list[dict], int, int]:
+    """Keeps the newest turns that fit."""
+    kept: list[dict] = []
+    tokens = 0
+    for message in reversed(history):
+        message_tokens = _message_tokens(message)
+        if tokens + message_tokens > budget:
+            break
+        kept.append(message)
+        tokens += message_tokens
+    kept.reverse()
+    return kept, len(history) - len(kept), tokens
+
+
+def plan_child_context(
+    snapshot: MemorySnapshot,
+    history: list[dict],
+    message: str,
+    budget: ContextBudget,
+) -> ContextPlan:
+    """
+    Fits a child chat turn into the budget. Memories and history are trimmed
+    on their own, oldest content first, and the token count chosen for each
+    section is recorded in the plan. Parent directives are always sent in
+    full: when they push the system prompt over its budget, the overflow is
+    taken from the memories budget, then from the history budget.
+    """
+    system_tokens = _system_prompt_tokens(snapshot)
+    overflow = max(0, system_tokens - budget.system_prompt)
+    memories_budget = max(0, budget.memories - overflow)
+    history_budget = max(
+        0, budget.history - (overflow - (budget.memories - memories_budget))
+    )
+    episodes, summary, memory_tokens = _fit_memories(snapshot, memories_budget)
+    kept, dropped_turns, history_tokens = _fit_history(history, history_budget)
+    message_tokens = estimate_tokens(message) + MESSAGE_OVERHEAD
+
+    # Trimming depends only on the snapshot and the budget, so the trimmed
+    # snapshot keeps its row version and its prompt stays memoizable
+    trimmed = replace(
+        snapshot,
+        episodic_memory=episodes,
+        long_term_summary=summary,
+    )
+
+    return ContextPlan(
+        snapshot=trimmed,
+        history=kept,
+        dropped_turns=dropped_turns,
+        tokens={
+            "system_prompt": system_tokens,
+            "memories": memory_tokens,
+            "history": history_tokens,
+            "message": message_tokens,
+            "total": system_tokens + memory_tokens + history_tokens + message_tokens,
+        },
+        system_overflow=overflow,
+    )
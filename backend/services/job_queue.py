@@ -0,0 +1,601 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field, fields
+from typing import Any, Protocol
+
+import anyio
+
+from .supabase_client import get_supabase_client, run_query
+
+logger = logging.getLogger(__name__)
+
+# JOB_QUEUE_BACKEND selects where jobs live: "sqlite" (JOB_QUEUE_PATH, the
+# default, for local runs) or "postgres" (the Supabase `jobs` table, see
+# migrations/003_jobs.sql). JOB_WORKERS sets how many jobs run concurrently in
+# this process and JOB_MAX_ATTEMPTS how often a failing job is tried.
+DEFAULT_BACKEND = "sqlite"
+DEFAULT_SQLITE_PATH = "data/jobs.sqlite3"
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 5
+# A claimed job whose worker has not finished within the lease is assumed to
+# have died with its process and becomes claimable again. A live worker
+# renews the lease every lease / LEASE_RENEWALS seconds.
+DEFAULT_LEASE_SECONDS = 300
+LEASE_RENEWALS = 3
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_MAX = 300.0
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_job_queue: "JobQueue | None" = None
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    user_id: str
+    payload: dict
+    status: str = QUEUED
+    attempts: int = 0
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    # Epoch seconds, so schedules survive a restart
+    run_at: float = 0.0
+    locked_until: float | None = None
+    idempotency_key: str | None = None
+    # Handlers record finished steps here, so a retry can skip them
+    progress: dict = field(default_factory=dict)
+    result: dict | None = None
+    error: str | None = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    @classmethod
+    def from_row(cls, row: dict[str, Any]) -> "Job":
+        values: dict[str, Any] = {f.name: row.get(f.name) for f in fields(cls)}
+        for name in ("payload", "progress", "result"):
+            value = values[name]
+            if isinstance(value, str):
+                values[name] = json.loads(value)
+        values["progress"] = values["progress"] or {}
+        return cls(**values)
+
+    def to_row(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+ProgressReporter = Callable[[str, Any], Awaitable[None]]
+Handler = Callable[[Job, ProgressReporter], Awaitable[dict | None]]
+
+
+class LeaseLostError(Exception):
+    """The job was claimed again after this worker's lease ran out."""
+
+
+class JobBackend(Protocol):
+    """
+    Durable job storage. claim() must hand each job to one worker at a time.
+    A claim is identified by the job's attempts count after claiming: save()
+    and renew() only write while that claim still holds the job, and return
+    False once the lease has expired and another worker claimed it.
+    """
+
+    async def enqueue(self, job: Job) -> Job:
+        """Stores job, or returns the existing job with the same idempotency key."""
+        ...
+
+    async def claim(self, now: float, lease_seconds: float) -> Job | None: ...
+
+    async def get(self, job_id: str) -> Job | None: ...
+
+    async def save(self, job: Job, attempt: int) -> bool: ...
+
+    async def renew(self, job: Job, attempt: int, locked_until: float) -> bool: ...
+
+    async def release_key(self, job: Job) -> None:
+        """Moves a finished job off its idempotency key, so a new job can take it."""
+        ...
+
+
+def _released_key(job: Job) -> str:
+    return f"{job.idempotency_key}#{job.id}"
+
+
+_JSON_COLUMNS = ("payload", "progress", "result")
+_COLUMNS = tuple(f.name for f in fields(Job))
+
+
+class SQLiteJobBackend:
+    """Jobs in a local SQLite file, for development and single-instance deploys."""
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # One connection shared by worker threads, so serialize its use
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    max_attempts INTEGER NOT NULL,
+                    run_at REAL NOT NULL,
+                    locked_until REAL,
+                    idempotency_key TEXT UNIQUE,
+                    progress TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (status, run_at)"
+            )
+
+    async def _run(self, fn: Callable[[], Any]) -> Any:
+        def locked() -> Any:
+            with self._lock, self._conn:
+                return fn()
+
+        return await anyio.to_thread.run_sync(locked)
+
+    @staticmethod
+    def _encode(job: Job) -> dict:
+        row = job.to_row()
+        for name in _JSON_COLUMNS:
+            if row[name] is not None:
+                row[name] = json.dumps(row[name])
+        return row
+
+    @staticmethod
+    def _decode(row: sqlite3.Row | None) -> Job | None:
+        return Job.from_row(dict(row)) if row is not None else None
+
+    async def enqueue(self, job: Job) -> Job:
+        row = self._encode(job)
+
+        def insert() -> sqlite3.Row | None:
+            self._conn.execute(
+                f"INSERT OR IGNORE INTO jobs ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + c for c in _COLUMNS)})",
+                row,
+            )
+            if job.idempotency_key is None:
+                return None
+            return self._conn.execute(
+                "SELECT * FROM jobs WHERE idempotency_key = ?",
+                (job.idempotency_key,),
+            ).fetchone()
+
+        existing = self._decode(await self._run(insert))
+        return existing or job
+
+    async def claim(self, now: float, lease_seconds: float) -> Job | None:
+        def claim_one() -> sqlite3.Row | None:
+            return self._conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, attempts = attempts + 1, locked_until = ?, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE (status = ? AND run_at <= ?)
+                       OR (status = ? AND locked_until < ?)
+                    ORDER BY run_at
+                    LIMIT 1
+                )
+                RETURNING *
+                """,
+                (RUNNING, now + lease_seconds, now, QUEUED, now, RUNNING, now),
+            ).fetchone()
+
+        return self._decode(await self._run(claim_one))
+
+    async def get(self, job_id: str) -> Job | None:
+        def select() -> sqlite3.Row | None:
+            return self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+
+        return self._decode(await self._run(select))
+
+    async def save(self, job: Job, attempt: int) -> bool:
+        row = self._encode(job)
+        assignments = ", ".join(f"{c} = :{c}" for c in _COLUMNS if c != "id")
+        claim = {"claimed_status": RUNNING, "claimed_attempt": attempt}
+
+        def update() -> int:
+            return self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = :id "
+                "AND status = :claimed_status AND attempts = :claimed_attempt",
+                {**row, **claim},
+            ).rowcount
+
+        return await self._run(update) == 1
+
+    async def renew(self, job: Job, attempt: int, locked_until: float) -> bool:
+        def update() -> int:
+            return self._conn.execute(
+                "UPDATE jobs SET locked_until = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND attempts = ?",
+                (locked_until, time.time(), job.id, RUNNING, attempt),
+            ).rowcount
+
+        return await self._run(update) == 1
+
+    async def release_key(self, job: Job) -> None:
+        def update() -> None:
+            self._conn.execute(
+                "UPDATE jobs SET idempotency_key = ? "
+                "WHERE id = ? AND idempotency_key = ?",
+                (_released_key(job), job.id, job.idempotency_key),
+            )
+
+        await self._run(update)
+
+
+class PostgresJobBackend:
+    """Jobs in the Supabase `jobs` table, shared by every API instance."""
+
+    def __init__(self, table: str = "jobs") -> None:
+        self.table = table
+
+    async def enqueue(self, job: Job) -> Job:
+        client = get_supabase_client()
+        row = job.to_row()
+        if job.idempotency_key is None:
+            await run_query(client.table(self.table).insert(row))
+            return job
+        await run_query(
+            client.table(self.table).upsert(
+                row, on_conflict="idempotency_key", ignore_duplicates=True
+            )
+        )
+        response = await run_query(
+            client.table(self.table)
+            .select("*")
+            .eq("idempotency_key", job.idempotency_key)
+            .limit(1)
+        )
+        return Job.from_row(response.data[0]) if response.data else job
+
+    async def claim(self, now: float, lease_seconds: float) -> Job | None:
+        # FOR UPDATE SKIP LOCKED inside the function keeps instances from
+        # claiming the same job
+        response = await run_query(
+            get_supabase_client().rpc(
+                "claim_job", {"p_now": now, "p_lease_seconds": lease_seconds}
+            )
+        )
+        return Job.from_row(response.data[0]) if response.data else None
+
+    async def get(self, job_id: str) -> Job | None:
+        response = await run_query(
+            get_supabase_client()
+            .table(self.table)
+            .select("*")
+            .eq("id", job_id)
+            .limit(1)
+        )
+        return Job.from_row(response.data[0]) if response.data else None
+
+    async def save(self, job: Job, attempt: int) -> bool:
+        row = job.to_row()
+        del row["id"]
+        return await self._update_claimed(job.id, attempt, row)
+
+    async def renew(self, job: Job, attempt: int, locked_until: float) -> bool:
+        return await self._update_claimed(
+            job.id, attempt, {"locked_until": locked_until, "updated_at": time.time()}
+        )
+
+    async def release_key(self, job: Job) -> None:
+        await run_query(
+            get_supabase_client()
+            .table(self.table)
+            .update({"idempotency_key": _released_key(job)})
+            .eq("id", job.id)
+            .eq("idempotency_key", job.idempotency_key)
+        )
+
+    async def _update_claimed(self, job_id: str, attempt: int, values: dict) -> bool:
+        response = await run_query(
+            get_supabase_client()
+            .table(self.table)
+            .update(values)
+            .eq("id", job_id)
+            .eq("status", RUNNING)
+            .eq("attempts", attempt)
+        )
+        return bool(response.data)
+
+
+class JobQueue:
+    """
+    Durable background jobs run by an in-process worker pool.
+
+    - Handlers are registered per job kind and return the job's result.
+    - Failed jobs are retried with exponential backoff and jitter until
+      max_attempts, then marked failed.
+    - Jobs enqueued with the same idempotency key are only stored once.
+      With dedup_seconds the key holds for that long after the job was
+      enqueued; a later enqueue of a finished job's key queues a new job.
+    - A finished job drops its payload, which may hold user content only
+      the handler needed; progress and result are kept.
+    - Handlers can persist progress while they run; a retry sees it in
+      job.progress and can skip the steps that already succeeded.
+    - A running job's lease is renewed while its handler works. Should the
+      lease lapse anyway and the job be claimed again, the stale worker's
+      writes are refused, so it cannot overwrite the newer attempt.
+    """
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        workers: int = DEFAULT_WORKERS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+    ) -> None:
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._handlers: dict[str, Handler] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        self._stopping = False
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    async def enqueue(
+        self,
+        kind: str,
+        user_id: str,
+        payload: dict,
+        idempotency_key: str | None = None,
+        dedup_seconds: float | None = None,
+    ) -> Job:
+        now = time.time()
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            user_id=user_id,
+            payload=payload,
+            max_attempts=self.max_attempts,
+            run_at=now,
+            idempotency_key=idempotency_key,
+            created_at=now,
+            updated_at=now,
+        )
+        stored = await self.backend.enqueue(job)
+        if (
+            dedup_seconds is not None
+            and stored.id != job.id
+            and stored.status in (SUCCEEDED, FAILED)
+            and stored.created_at <= now - dedup_seconds
+        ):
+            # A job still queued or running keeps its key, however old
+            await self.backend.release_key(stored)
+            stored = await self.backend.enqueue(job)
+        job = stored
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        return await self.backend.get(job_id)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))
+        ]
+
+    async def stop(self) -> None:
+        # The flag covers workers inside a thread call, which anyio shields
+        # from the cancellation below
+        self._stopping = True
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._wakeup = None
+        self._stopping = False
+
+    async def run_once(self) -> bool:
+        """Claims and runs one due job. Returns False if none was due."""
+        job = await self.backend.claim(time.time(), self.lease_seconds)
+        if job is None:
+            return False
+        if self._stopping:
+            await self._release(job, job.attempts)
+            return False
+        await self._run(job)
+        return True
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception:
+                logger.exception("Job worker error")
+            assert self._wakeup is not None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _run(self, job: Job) -> None:
+        # The claim this worker holds; a re-claim increments attempts
+        attempt = job.attempts
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            await self._finish(
+                job, attempt, FAILED, error=f"No handler for job kind {job.kind}"
+            )
+            return
+        if job.attempts > job.max_attempts:
+            # Its worker kept dying before the job could finish
+            await self._finish(
+                job, attempt, FAILED, error="Lease expired too many times"
+            )
+            return
+
+        async def report(key: str, value: Any) -> None:
+            job.progress[key] = value
+            job.updated_at = time.time()
+            if not await self.backend.save(job, attempt):
+                raise LeaseLostError(job.id)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job, attempt))
+        try:
+            result = await handler(job, report)
+        except asyncio.CancelledError:
+            await asyncio.shield(self._release(job, attempt))
+            raise
+        except LeaseLostError:
+            self._lost(job)
+            return
+        except Exception as e:
+            if job.attempts >= job.max_attempts:
+                logger.exception(
+                    "Job failed for good",
+                    extra={"job_kind": job.kind, "job_id": job.id},
+                )
+                await self._finish(job, attempt, FAILED, error=str(e))
+                return
+            delay = self._backoff(job.attempts)
+            logger.warning(
+                "Job failed, retrying in %.1fs: %s",
+                delay,
+                e,
+                extra={"job_kind": job.kind, "job_id": job.id},
+            )
+            job.status = QUEUED
+            job.error = str(e)
+            job.run_at = time.time() + delay
+            job.locked_until = None
+            job.updated_at = time.time()
+            if not await self.backend.save(job, attempt):
+                self._lost(job)
+            return
+        finally:
+            heartbeat.cancel()
+
+        await self._finish(job, attempt, SUCCEEDED, result=result)
+
+    async def _heartbeat(self, job: Job, attempt: int) -> None:
+        """Extends the lease of a running job until cancelled."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / LEASE_RENEWALS)
+            locked_until = time.time() + self.lease_seconds
+            try:
+                renewed = await self.backend.renew(job, attempt, locked_until)
+            except Exception:
+                # The next renewal may get through before the lease runs out
+                logger.exception("Could not renew job lease")
+                continue
+            if not renewed:
+                self._lost(job)
+                return
+            job.locked_until = locked_until
+
+    @staticmethod
+    def _lost(job: Job) -> None:
+        logger.warning(
+            "Job was claimed again by another worker; dropping this attempt",
+            extra={"job_kind": job.kind, "job_id": job.id},
+        )
+
+    async def _release(self, job: Job, attempt: int) -> None:
+        """Hands a claimed job back without spending an attempt, on shutdown."""
+        job.status = QUEUED
+        job.attempts -= 1
+        job.locked_until = None
+        job.updated_at = time.time()
+        await self.backend.save(job, attempt)
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        # Jitter so jobs that failed together don't retry in lockstep
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _finish(
+        self,
+        job: Job,
+        attempt: int,
+        status: str,
+        result: dict | None = None,
+        error: str | None = None,
+    ) -> None:
+        job.status = status
+        job.payload = {}
+        job.result = result
+        job.error = error
+        job.locked_until = None
+        job.updated_at = time.time()
+        if not await self.backend.save(job, attempt):
+            self._lost(job)
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is not None:
+        return _job_queue
+
+    backend_name = os.environ.get("JOB_QUEUE_BACKEND", DEFAULT_BACKEND)
+    backend: JobBackend
+    if backend_name == "postgres":
+        backend = PostgresJobBackend()
+    elif backend_name == "sqlite":
+        backend = SQLiteJobBackend(
+            os.environ.get("JOB_QUEUE_PATH", DEFAULT_SQLITE_PATH)
+        )
+    else:
+        raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend_name}")
+
+    _job_queue = JobQueue(
+        backend,
+        workers=int(os.environ.get("JOB_WORKERS", DEFAULT_WORKERS)),
+        max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+    )
+    return _job_queue
+
+
+async def close_job_queue() -> None:
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.stop()
+        _job_queue = None
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any
+
+import httpx
+import jwt
+from jwt.algorithms import ECAlgorithm, RSAAlgorithm
+
+logger = logging.getLogger(__name__)
+
+# Used when the JWKS response carries no Cache-Control max-age
+DEFAULT_TTL = 600
+# Refresh in the background once this fraction of the TTL has elapsed
+REFRESH_AT = 0.8
+# Minimum seconds between refetches triggered by an unknown kid, so a flood of
+# forged kids cannot turn into a flood of JWKS requests
+DEFAULT_MIN_REFETCH_INTERVAL = 30
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+_jwks_manager: "JWKSManager | None" = None
+
+
+def parse_jwks_keys(jwks: dict) -> dict[str, Any]:
+    """Converts every usable JWK into a PyJWT key object, keyed by kid."""
+    keys: dict[str, Any] = {}
+    for key_data in jwks.get("keys", []):
+        kid = key_data.get("kid")
+        try:
+            if key_data.get("kty") == "RSA":
+                keys[kid] = RSAAlgorithm.from_jwk(key_data)
+            elif key_data.get("kty") == "EC":
+                keys[kid] = ECAlgorithm.from_jwk(key_data)
+        except (jwt.InvalidKeyError, ValueError, KeyError) as e:
+            logger.warning("Skipping unusable JWK %s: %s", kid, e)
+    return keys
+
+
+def _max_age(response: httpx.Response) -> float | None:
+    cache_control = response.headers.get("cache-control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE.search(cache_control)
+    return float(match.group(1)) if match else None
+
+
+class JWKSManager:
+    """
+    Keeps the signing keys from a JWKS endpoint fresh.
+
+    - One shared HTTP client for every fetch.
+    - Keys expire after the response's Cache-Control max-age (or default_ttl)
+      and are refreshed in the background before that happens.
+    - Concurrent fetches are coalesced behind a single-flight lock.
+    - An unknown kid triggers one refetch, at most every min_refetch_interval
+      seconds, so key rotations are picked up without a restart.
+    - If a refresh fails, the previous keys keep being served.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        headers: dict[str, str] | None = None,
+        default_ttl: float = DEFAULT_TTL,
+        min_refetch_interval: float = DEFAULT_MIN_REFETCH_INTERVAL,
+    ) -> None:
+        self.urls = urls
+        self.headers = headers or {}
+        self.default_ttl = default_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.jwks: dict | None = None
+        self.keys: dict[str, Any] = {}
+        self._client: httpx.AsyncClient | None = None
+        self._lock = asyncio.Lock()
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._last_kid_refetch = float("-inf")
+        self._refresh_task: asyncio.Task | None = None
+
+    def _is_fresh(self) -> bool:
+        return self.jwks is not None and time.monotonic() < self._expires_at
+
+    async def get_jwks(self) -> dict:
+        if not self._is_fresh():
+            await self.refresh()
+        assert self.jwks is not None
+        return self.jwks
+
+    async def get_key(self, kid: str | None) -> Any:
+        """Returns the verification key for kid, or None if it is unknown."""
+        await self.get_jwks()
+        key = self.keys.get(kid) if kid else None
+        if key is not None or not kid:
+            return key
+
+        now = time.monotonic()
+        if now - self._last_kid_refetch < self.min_refetch_interval:
+            return None
+        self._last_kid_refetch = now
+        logger.info("Unknown kid %s, refetching JWKS", kid)
+        await self.refresh(force=True)
+        return self.keys.get(kid)
+
+    async def refresh(self, force: bool = False) -> None:
+        requested_at = time.monotonic()
+        async with self._lock:
+            # Whoever held the lock may have already fetched for us
+            if self._fetched_at >= requested_at or (not force and self._is_fresh()):
+                return
+            try:
+                await self._fetch()
+            except Exception:
+                if self.jwks is None:
+                    raise
+                logger.warning(
+                    "JWKS refresh failed, serving previous keys", exc_info=True
+                )
+                self._expires_at = time.monotonic() + self.min_refetch_interval
+                self._schedule_refresh(self.min_refetch_interval)
+
+    async def _fetch(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10)
+
+        for jwks_url in self.urls:
+            try:
+                response = await self._client.get(jwks_url, headers=self.headers)
+            except httpx.HTTPError as e:
+                logger.warning("Failed to fetch JWKS from %s: %s", jwks_url, e)
+                continue
+            if response.status_code != 200:
+                continue
+
+            jwks = response.json()
+            ttl = _max_age(response)
+            ttl = self.default_ttl if ttl is None else ttl
+
+            self.jwks = jwks
+            self.keys = parse_jwks_keys(jwks)
+            self._fetched_at = time.monotonic()
+            self._expires_at = self._fetched_at + ttl
+            logger.info(
+                "Fetched JWKS", extra={"jwks_url": jwks_url, "ttl_s": round(ttl)}
+            )
+            self._schedule_refresh(ttl * REFRESH_AT)
+            return
+
+        raise ValueError("Could not fetch JWKS from any known endpoint")
+
+    def _schedule_refresh(self, delay: float) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        if delay <= 0:
+            self._refresh_task = None
+            return
+        self._refresh_task = asyncio.create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Detach first so the refresh does not cancel the task running it
+        self._refresh_task = None
+        try:
+            await self.refresh(force=True)
+        except Exception:
+            logger.exception("Background JWKS refresh failed")
+
+    async def aclose(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def get_jwks_manager() -> JWKSManager:
+    global _jwks_manager
+    if _jwks_manager is not None:
+        return _jwks_manager
+
+    supabase_url = os.environ.get("SUPABASE_URL", "")
+    supabase_key = os.environ.get("SUPABASE_KEY", "")
+    if not supabase_url:
+        raise ValueError("SUPABASE_URL not configured")
+
+    # Try multiple possible JWKS endpoints
+    urls = [
+        f"{supabase_url}/.well-known/jwks.json",
+        f"{supabase_url}/auth/v1/.well-known/jwks.json",
+    ]
+
+    headers = {}
+    if supabase_key:
+        headers["apikey"] = supabase_key
+        headers["Authorization"] = f"Bearer {supabase_key}"
+
+    _jwks_manager = JWKSManager(
+        urls,
+        headers,
+        min_refetch_interval=float(
+            os.environ.get("JWKS_MIN_REFETCH_INTERVAL", DEFAULT_MIN_REFETCH_INTERVAL)
+        ),
+    )
+    return _jwks_manager
+
+
+async def close_jwks_manager() -> None:
+    global _jwks_manager
+    if _jwks_manager is not None:
+        await _jwks_manager.aclose()
+        _jwks_manager = None
@@ -0,0 +1,118 @@
+import os
+from typing import Any
+
+# The long-term summary is kept as structured state (memories.long_term_state)
+# that each new episode is folded into as soon as it is reflected on:
+#
+#   interests / milestones: {key: {"label", "count", "first_seen", "last_seen"}}
+#   themes: a short narrative of ongoing patterns, maintained by the LLM
+#   episodes: how many episodes have been folded in
+#   last_episode: timestamp of the newest folded episode, so folding is
+#       idempotent when a reflection is retried
+#   last_rewrite: the episode count at the last full rewrite of the themes
+#
+# Interests and milestones are counted locally. Only the themes need the LLM,
+# and between full rewrites (every SUMMARY_FULL_REWRITE_EVERY episodes) it is
+# only shown what changed.
+SECTIONS = ("interests", "milestones")
+DEFAULT_FULL_REWRITE_EVERY = 10
+# Entries kept per section; the least recently seen are pruned first
+MAX_SECTION_ENTRIES = 25
+# Entries listed per section in the rendered summary
+RENDERED_ENTRIES = 10
+
+FULL_REWRITE_EVERY = int(
+    os.environ.get("SUMMARY_FULL_REWRITE_EVERY", DEFAULT_FULL_REWRITE_EVERY)
+)
+
+
+def new_state(legacy_summary: str = "") -> dict:
+    """An empty state. A free-text summary from before carries over as themes."""
+    return {
+        "episodes": 0,
+        "last_episode": None,
+        "last_rewrite": 0,
+        "interests": {},
+        "milestones": {},
+        "themes": legacy_summary.strip(),
+    }
+
+
+def _key(label: str) -> str:
+    return " ".join(label.lower().split())
+
+
+def fold_episode(state: dict, episode: dict) -> dict[str, list[str]] | None:
+    """
+    Counts the episode's interests and milestones into state. Returns the
+    labels that were new or seen again, per section, or None if the episode
+    was already folded in (state is then left unchanged).
+    """
+    timestamp = episode.get("timestamp")
+    if timestamp is not None and timestamp == state.get("last_episode"):
+        return None
+
+    changed: dict[str, list[str]] = {}
+    for section in SECTIONS:
+        entries = state.setdefault(section, {})
+        seen = set()
+        for label in episode.get(section) or []:
+            if not isinstance(label, str) or not _key(label) or _key(label) in seen:
+                continue
+            seen.add(_key(label))
+            entry = entries.get(_key(label))
+            if entry is None:
+                entry = entries[_key(label)] = {
+                    "label": label.strip(),
+                    "count": 0,
+                    "first_seen": timestamp,
+                }
+            entry["count"] += 1
+            entry["last_seen"] = timestamp
+            changed.setdefault(section, []).append(entry["label"])
+        _prune(entries)
+
+    state["episodes"] = state.get("episodes", 0) + 1
+    state["last_episode"] = timestamp
+    return changed
+
+
+def _prune(entries: dict) -> None:
+    if len(entries) <= MAX_SECTION_ENTRIES:
+        return
+    ranked = sorted(entries.items(), key=_recency, reverse=True)
+    for key, _ in ranked[MAX_SECTION_ENTRIES:]:
+        del entries[key]
+
+
+def _recency(item: tuple[str, dict]) -> tuple[str, int]:
+    entry = item[1]
+    return entry.get("last_seen") or "", entry.get("count", 0)
+
+
+def rewrite_due(state: dict) -> bool:
+    return state.get("episodes", 0) - state.get("last_rewrite", 0) >= FULL_REWRITE_EVERY
+
+
+def _render_section(title: str, entries: dict[str, Any]) -> str:
+    ranked = sorted(entries.items(), key=_recency, reverse=True)[:RENDERED_ENTRIES]
+    if not ranked:
+        return ""
+    lines = [f"{title} (most recent first):"]
+    for _, entry in ranked:
+        last_seen = (entry.get("last_seen") or "")[:10]
+        seen = f", last {last_seen}" if last_seen else ""
+        lines.append(f"- {entry['label']} (x{entry['count']}{seen})")
+    return "\n".join(lines)
+
+
+def render_summary(state: dict) -> str:
+    """The text form stored in long_term_summary and shown in prompts."""
+    parts = []
+    if state.get("themes"):
+        parts.append(f"Themes: {state['themes']}")
+    for section in SECTIONS:
+        rendered = _render_section(section.capitalize(), state.get(section, {}))
+        if rendered:
+            parts.append(rendered)
+    return "\n\n".join(parts)
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, Protocol, TypeVar
+from urllib.parse import urlparse
+
+from redis import asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Read-through cache of each user's memories row. Entries live for at most
+# MEMORY_CACHE_TTL seconds (0 disables the cache). Without MEMORY_CACHE_URL
+# each worker keeps its own LRU of MEMORY_CACHE_SIZE rows; with a
+# redis://host:port/db URL all workers share one cache, so a write in one
+# worker is seen by the others on their next read.
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 300
+# Seconds to wait on the shared cache before falling back to the database,
+# and the most connections each worker opens to it
+DEFAULT_REDIS_TIMEOUT = 0.5
+DEFAULT_REDIS_POOL_SIZE = 16
+
+# Backend failures that are treated as cache misses
+BACKEND_ERRORS = (RedisError, TimeoutError, OSError)
+
+_memory_cache: "MemoryCache | None" = None
+
+
+class MemoryCacheBackend(Protocol):
+    """Storage for serialized rows, keyed by user id."""
+
+    async def get(self, key: str) -> str | None: ...
+
+    async def set(self, key: str, value: str, ttl: float) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class LocalCacheBackend:
+    """Per-process LRU with a TTL per entry."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def close(self) -> None:
+        self._entries.clear()
+
+
+class RedisCacheBackend:
+    """
+    Shared cache in Redis, using GET, SET PX and DEL through redis.asyncio
+    over a pool of connections. Every operation, reconnects and retries
+    included, is bounded by `timeout`; a connection interrupted mid-command
+    is dropped by the pool rather than reused.
+    """
+
+    def __init__(
+        self,
+        pool: aioredis.ConnectionPool,
+        prefix: str = "memories:",
+        timeout: float = DEFAULT_REDIS_TIMEOUT,
+    ) -> None:
+        self.prefix = prefix
+        self.timeout = timeout
+        self._pool = pool
+        self._client = aioredis.Redis(connection_pool=pool)
+
+    @classmethod
+    def from_url(
+        cls, url: str, max_connections: int = DEFAULT_REDIS_POOL_SIZE, **kwargs: Any
+    ) -> "RedisCacheBackend":
+        if urlparse(url).scheme not in ("redis", "rediss"):
+            raise ValueError(f"Unsupported memory cache URL: {url}")
+        # Waits for a free connection instead of failing; the wait counts
+        # against the operation's timeout. One immediate retry replaces a
+        # pooled connection that went stale (say, after a Redis restart).
+        pool = aioredis.BlockingConnectionPool.from_url(
+            url,
+            max_connections=max_connections,
+            timeout=None,
+            retry=Retry(NoBackoff(), 1),
+        )
+        return cls(pool, **kwargs)
+
+    async def get(self, key: str) -> str | None:
+        raw = await self._run(self._client.get(self.prefix + key))
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self._run(
+            self._client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+        )
+
+    async def delete(self, key: str) -> None:
+        await self._run(self._client.delete(self.prefix + key))
+
+    async def close(self) -> None:
+        await self._client.aclose()
+        await self._pool.aclose()
+
+    async def _run(self, command: Awaitable[T]) -> T:
+        return await asyncio.wait_for(command, self.timeout)
+
+
+class _Fetch:
+    """Fetches of one user's row that are in flight."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.stale = False
+
+
+class MemoryCache:
+    """
+    Read-through cache in front of the memories table. Writers call
+    invalidate() after every write, so the next read goes to the database.
+
+    A row fetched while a write to it was in progress is returned but not
+    stored, so it cannot outlive the invalidation in this process. Across
+    workers sharing a backend, such a row is bounded by the TTL.
+
+    Rows are stored as JSON, so every read gets its own copy to modify.
+    Backend errors are logged and treated as misses: the database stays the
+    source of truth.
+    """
+
+    def __init__(self, backend: MemoryCacheBackend, ttl: float) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self._fetches: dict[str, _Fetch] = {}
+
+    async def get_row(self, user_id: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        if self.ttl <= 0:
+            return await fetch()
+        try:
+            cached = await self.backend.get(user_id)
+        except BACKEND_ERRORS as e:
+            logger.warning("Cache read failed, using the database: %s", e)
+            cached = None
+        if cached is not None:
+            return json.loads(cached)
+
+        pending = self._fetches.setdefault(user_id, _Fetch())
+        pending.count += 1
+        try:
+            row = await fetch()
+        finally:
+            pending.count -= 1
+            if pending.count == 0:
+                self._fetches.pop(user_id, None)
+        if not pending.stale:
+            try:
+                await self.backend.set(
+                    user_id, json.dumps(row, separators=(",", ":")), self.ttl
+                )
+            except BACKEND_ERRORS as e:
+                logger.warning("Cache write failed: %s", e)
+        return row
+
+    async def invalidate(self, user_id: str) -> None:
+        pending = self._fetches.get(user_id)
+        if pending is not None:
+            pending.stale = True
+        try:
+            await self.backend.delete(user_id)
+        except BACKEND_ERRORS as e:
+            logger.warning("Could not invalidate %s: %s", user_id, e)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def get_memory_cache() -> MemoryCache:
+    global _memory_cache
+    if _memory_cache is not None:
+        return _memory_cache
+
+    url = os.environ.get("MEMORY_CACHE_URL", "")
+    backend: MemoryCacheBackend
+    if url:
+        backend = RedisCacheBackend.from_url(url)
+    else:
+        backend = LocalCacheBackend(
+            int(os.environ.get("MEMORY_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        )
+    _memory_cache = MemoryCache(
+        backend, float(os.environ.get("MEMORY_CACHE_TTL", DEFAULT_CACHE_TTL))
+    )
+    return _memory_cache
+
+
+async def close_memory_cache() -> None:
+    global _memory_cache
+    if _memory_cache is None:
+        return
+    cache, _memory_cache = _memory_cache, None
+    await cache.close()
@@ -1,30 +1,193 @@
-from typing import Any
+import asyncio
 import json
-from datetime import datetime
-from services.supabase_client import get_supabase_client
+import logging
+import random
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field as dataclass_field
+from datetime import UTC, datetime
+from typing import Any
 
+import anyio
+from opentelemetry.trace import Span
+from postgrest import CountMethod
 
-async def read_db_field(user_id: str, field: str, default: Any = "") -> Any:
+from services.memory_cache import get_memory_cache
+from services.supabase_client import get_supabase_client, run_query
+from services.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+# Every column a MemorySnapshot knows how to hold.
+SNAPSHOT_FIELDS: tuple[str, ...] = (
+    "identity",
+    "core_instructions",
+    "episodic_memory",
+    "long_term_summary",
+    "current_state",
+    "updated_at",
+    "version",
+)
+
+# Columns served from the memory cache; other columns are read directly.
+CACHED_FIELDS: tuple[str, ...] = SNAPSHOT_FIELDS + ("long_term_state",)
+
+# Conditional writes: attempts before giving up, and the cap and base of the
+# jittered backoff (seconds) between them
+DEFAULT_WRITE_ATTEMPTS = 8
+WRITE_BACKOFF_BASE = 0.01
+WRITE_BACKOFF_MAX = 0.5
+
+
+class MemoryConflictError(Exception):
+    """The memories row kept changing under a conditional write."""
+
+
+# Rows returned by a history read when the caller does not pass a limit
+DEFAULT_HISTORY_LIMIT = 100
+
+
+async def _fetch_memory_row(user_id: str) -> dict:
     client = get_supabase_client()
-    try:
-        response = (
-            client.table("memories").select(field).eq("user_id", user_id).execute()
+    response = await run_query(
+        client.table("memories").select(",".join(CACHED_FIELDS)).eq("user_id", user_id)
+    )
+    if response.data and isinstance(response.data[0], dict):
+        return response.data[0]
+    # No row yet; cached too, and the first write invalidates it
+    return {}
+
+
+async def read_memory_row(user_id: str) -> dict:
+    """The user's CACHED_FIELDS, through the read-through memory cache."""
+    with start_span("memories.read_row"):
+        return await get_memory_cache().get_row(
+            user_id, lambda: _fetch_memory_row(user_id)
         )
-        if response.data and len(response.data) > 0:
-            item = response.data[0]
-            if isinstance(item, dict):
-                return item.get(field, default)
-            return default
-    except Exception as e:
-        print(f"Error fetching all memories: {e}")
-        pass
-    return default
+
+
+async def read_db_field(user_id: str, field: str, default: Any = "") -> Any:
+    with start_span("memories.read_field", {"db.field": field}):
+        if field in CACHED_FIELDS:
+            try:
+                row = await read_memory_row(user_id)
+            except Exception:
+                logger.exception("Could not fetch memories")
+                return default
+            return row.get(field, default)
+
+        client = get_supabase_client()
+        try:
+            response = await run_query(
+                client.table("memories").select(field).eq("user_id", user_id)
+            )
+            if response.data and len(response.data) > 0:
+                item = response.data[0]
+                if isinstance(item, dict):
+                    return item.get(field, default)
+                return default
+        except Exception:
+            logger.exception("Could not fetch memories.%s", field)
+        return default
+
+
+async def update_memory_row(
+    user_id: str,
+    mutate: Callable[[dict], dict[str, Any] | None],
+    attempts: int = DEFAULT_WRITE_ATTEMPTS,
+) -> dict[str, Any] | None:
+    """
+    Read-modify-write of the user's memories row with optimistic concurrency.
+
+    mutate gets the current row (CACHED_FIELDS) and returns the columns to
+    change, or None to leave the row alone. The update only lands if the
+    row's version (bumped by the database on every write, migration 007) is
+    still the one read. Otherwise the row is re-read and mutate runs again
+    after a jittered backoff. Returns the columns written.
+    """
+    with start_span("memories.update_row") as span:
+        return await _update_memory_row(user_id, mutate, attempts, span)
+
+
+async def _update_memory_row(
+    user_id: str,
+    mutate: Callable[[dict], dict[str, Any] | None],
+    attempts: int,
+    span: Span,
+) -> dict[str, Any] | None:
+    client = get_supabase_client()
+    row = await read_memory_row(user_id)
+    for attempt in range(attempts):
+        span.set_attribute("linxy.attempts", attempt + 1)
+        changes = mutate(row)
+        if not changes:
+            return None
+        if row.get("version") is None:
+            # No row yet; the insert loses to a concurrent first write
+            query = client.table("memories").upsert(
+                {"user_id": user_id, **changes},
+                on_conflict="user_id",
+                ignore_duplicates=True,
+            )
+        else:
+            query = (
+                client.table("memories")
+                .update(changes)
+                .eq("user_id", user_id)
+                .eq("version", row["version"])
+            )
+        try:
+            response = await run_query(query)
+        finally:
+            await get_memory_cache().invalidate(user_id)
+        if response.data:
+            return changes
+
+        delay = min(WRITE_BACKOFF_MAX, WRITE_BACKOFF_BASE * 2**attempt)
+        await anyio.sleep(random.uniform(0, delay))
+        row = await _fetch_memory_row(user_id)
+    raise MemoryConflictError(
+        f"memories row of {user_id} changed under {attempts} write attempts"
+    )
 
 
 async def write_db_field(user_id: str, field: str, value: Any) -> None:
+    await write_db_fields(user_id, {field: value})
+
+
+async def write_db_fields(user_id: str, values: dict[str, Any]) -> None:
+    """
+    Overwrites several columns of the user's row in one upsert. Use
+    update_memory_row when the new values are derived from the old ones.
+    """
+    client = get_supabase_client()
+    data = {"user_id": user_id, **values}
+    with start_span("memories.write_fields", {"db.fields": list(values)}):
+        try:
+            await run_query(
+                client.table("memories").upsert(data, on_conflict="user_id")
+            )
+        finally:
+            # Also after a failure: the write may have landed before it surfaced
+            await get_memory_cache().invalidate(user_id)
+
+
+async def append_db_field(user_id: str, field: str, item: Any) -> None:
+    """
+    Appends one item in a single atomic round-trip, backed by the
+    append_memory_item function in migrations/. Rewards, parent reports and
+    episodes go to their own tables; core instructions (and the recent
+    episode window) to a JSONB array column.
+    """
     client = get_supabase_client()
-    data = {"user_id": user_id, field: value}
-    client.table("memories").upsert(data, on_conflict="user_id").execute()
+    params = {"p_user_id": user_id, "p_field": field, "p_item": item}
+    with start_span("memories.append", {"db.field": field}):
+        try:
+            await run_query(client.rpc("append_memory_item", params))
+        finally:
+            # Rewards and reports go to their own tables, not the cached row
+            if field in CACHED_FIELDS:
+                await get_memory_cache().invalidate(user_id)
 
 
 async def get_identity(user_id: str) -> str:
@@ -43,104 +206,277 @@ async def get_long_term_summary(user_id: str) -> str:
     return await read_db_field(user_id, "long_term_summary", "")
 
 
-async def write_long_term_summary(user_id: str, content: str) -> None:
-    await write_db_field(user_id, "long_term_summary", content)
-
-
 async def get_core_instructions(user_id: str) -> list:
     res = await read_db_field(user_id, "core_instructions", [])
-    if not isinstance(res, list):
-        return []
-    return res
+    return _as_list(res)
 
 
 async def add_core_instruction(user_id: str, instruction: str) -> None:
-    current = await get_core_instructions(user_id)
-    # the core_instructions is JSONB but the original code treated it as string
-    # Let's keep it consistent with the schema which says JSONB DEFAULT '[]'
-    if not isinstance(current, list):
-        current = []
-    current.append(instruction)
-    await write_db_field(user_id, "core_instructions", current)
+    await append_db_field(user_id, "core_instructions", instruction)
 
 
 async def get_episodic_memory(user_id: str) -> list:
+    """The recent episodes shown in prompts; the episodes table has all of them."""
     res = await read_db_field(user_id, "episodic_memory", [])
-    if not isinstance(res, list):
-        return []
-    return res
+    return _as_list(res)
 
 
-async def write_episodic_memory(user_id: str, memory_list: list) -> None:
-    await write_db_field(user_id, "episodic_memory", memory_list)
+async def add_episodic_memory(user_id: str, memory_item: dict) -> None:
+    await append_db_field(user_id, "episodic_memory", memory_item)
 
 
-async def add_episodic_memory(user_id: str, memory_item: dict) -> None:
-    current_memories = await get_episodic_memory(user_id)
-    current_memories.append(memory_item)
-    await write_episodic_memory(user_id, current_memories)
+@dataclass(frozen=True)
+class HistoryCursor:
+    """
+    Position of a child table row in (created_at, id) order. Rows created in
+    the same instant are told apart by id, so paging neither skips nor
+    repeats them. Sent to clients as "<created_at>~<id>"; a bare timestamp
+    is accepted too and pages by created_at alone.
+    """
 
+    created_at: str
+    id: int | None = None
 
-async def get_rewards(user_id: str) -> list[dict]:
-    res = await read_db_field(user_id, "rewards", [])
-    if not isinstance(res, list):
+    @classmethod
+    def parse(cls, token: str) -> "HistoryCursor":
+        created_at, _, row_id = token.partition("~")
+        try:
+            created_at = datetime.fromisoformat(created_at).isoformat()
+            return cls(created_at, int(row_id) if row_id else None)
+        except ValueError:
+            raise ValueError(f"Invalid history cursor: {token!r}") from None
+
+    def __str__(self) -> str:
+        if self.id is None:
+            return self.created_at
+        return f"{self.created_at}~{self.id}"
+
+
+async def read_history(
+    table: str,
+    columns: str,
+    user_id: str,
+    limit: int = DEFAULT_HISTORY_LIMIT,
+    before: HistoryCursor | None = None,
+) -> list[dict]:
+    """
+    Reads the newest `limit` rows of an append-only child table (episodes,
+    rewards, parent_reports) that come before `before`, oldest first.
+    Served by the (user_id, created_at, id) index, so the cost does not
+    grow with the length of the user's history.
+    """
+    client = get_supabase_client()
+    query = client.table(table).select(columns).eq("user_id", user_id)
+    if before is not None and before.id is None:
+        query = query.lt("created_at", before.created_at)
+    elif before is not None:
+        # Quoted: timestamps contain PostgREST's reserved "." and ":"
+        created_at = f'"{before.created_at}"'
+        query = query.or_(
+            f"created_at.lt.{created_at},"
+            f"and(created_at.eq.{created_at},id.lt.{before.id})"
+        )
+    query = query.order("created_at", desc=True).order("id", desc=True).limit(limit)
+    try:
+        response = await run_query(query)
+    except Exception:
+        logger.exception("Could not fetch %s", table)
         return []
-    return res
+    rows = [row for row in response.data or [] if isinstance(row, dict)]
+    rows.reverse()
+    return rows
+
+
+async def count_history(table: str, user_id: str) -> int:
+    """Counts a user's rows in a child table without fetching them."""
+    client = get_supabase_client()
+    query = client.table(table).select("id", count=CountMethod.exact, head=True)
+    try:
+        response = await run_query(query.eq("user_id", user_id))
+    except Exception:
+        logger.exception("Could not count %s", table)
+        return 0
+    return response.count or 0
+
+
+def _with_timestamp(item: Any, row: dict) -> dict:
+    item = dict(item) if isinstance(item, dict) else {}
+    item.setdefault("timestamp", row.get("created_at"))
+    return item
+
+
+async def get_rewards(
+    user_id: str,
+    limit: int = DEFAULT_HISTORY_LIMIT,
+    before: HistoryCursor | None = None,
+) -> list[dict]:
+    rows = await read_history(
+        "rewards", "id,sticker,reason,created_at", user_id, limit, before
+    )
+    return [
+        {
+            "id": row.get("id"),
+            "sticker": row.get("sticker"),
+            "reason": row.get("reason", ""),
+            "timestamp": row.get("created_at"),
+            "created_at": row.get("created_at"),
+        }
+        for row in rows
+    ]
 
 
 async def add_reward(user_id: str, sticker: str, reason: str) -> None:
-    current_rewards = await get_rewards(user_id)
     reward_item = {
         "sticker": sticker,
         "reason": reason,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(UTC).isoformat(),
     }
-    current_rewards.append(reward_item)
-    await write_db_field(user_id, "rewards", current_rewards)
+    await append_db_field(user_id, "rewards", reward_item)
 
 
-async def get_parent_reports(user_id: str) -> list:
-    res = await read_db_field(user_id, "parent_reports", [])
-    if not isinstance(res, list):
-        return []
-    return res
+async def get_reward_counts(user_id: str) -> dict[str, int]:
+    """Stickers earned, by sticker, counted in the database (migration 006)."""
+    client = get_supabase_client()
+    try:
+        response = await run_query(client.rpc("reward_counts", {"p_user_id": user_id}))
+    except Exception:
+        logger.exception("Could not count rewards")
+        return {}
+    return {
+        row["sticker"]: int(row["count"])
+        for row in response.data or []
+        if isinstance(row, dict)
+    }
+
+
+async def get_rewards_summary(user_id: str, latest: int) -> dict:
+    counts, recent = await asyncio.gather(
+        get_reward_counts(user_id), get_rewards(user_id, limit=latest)
+    )
+    return {"total": sum(counts.values()), "counts": counts, "latest": recent}
+
+
+async def get_parent_reports(
+    user_id: str,
+    limit: int = DEFAULT_HISTORY_LIMIT,
+    before: HistoryCursor | None = None,
+) -> list[dict]:
+    rows = await read_history(
+        "parent_reports", "id,report,created_at", user_id, limit, before
+    )
+    # The report's own timestamp can differ from created_at, which the pages
+    # are ordered and cursored by
+    return [
+        {
+            **_with_timestamp(row.get("report"), row),
+            "id": row.get("id"),
+            "created_at": row.get("created_at"),
+        }
+        for row in rows
+    ]
+
+
+async def get_parent_reports_summary(user_id: str, latest: int) -> dict:
+    total, recent = await asyncio.gather(
+        count_history("parent_reports", user_id),
+        get_parent_reports(user_id, limit=latest),
+    )
+    return {"total": total, "latest": recent}
 
 
 async def add_parent_report(user_id: str, report: dict) -> None:
-    current_reports = await get_parent_reports(user_id)
-    current_reports.append(report)
-    await write_db_field(user_id, "parent_reports", current_reports)
+    await append_db_field(user_id, "parent_reports", report)
 
 
-async def get_identity_dict(user_id: str) -> dict:
-    res = await read_db_field(user_id, "identity", {})
-    if not isinstance(res, dict):
+def _as_list(value: Any) -> list:
+    return value if isinstance(value, list) else []
+
+
+def _as_identity_dict(value: Any) -> dict:
+    if not isinstance(value, dict):
         try:
-            return json.loads(res) if res else {}
-        except json.JSONDecodeError:
+            parsed = json.loads(value) if value else {}
+        except (json.JSONDecodeError, TypeError):
             return {}
-    return res
+        return parsed if isinstance(parsed, dict) else {}
+    return value
+
+
+async def get_identity_dict(user_id: str) -> dict:
+    res = await read_db_field(user_id, "identity", {})
+    return _as_identity_dict(res)
 
 
 async def update_identity_dict(user_id: str, identity_data: dict) -> None:
-    current = await get_identity_dict(user_id)
-    # Deep merge or simple update
-    if "ai" in identity_data:
-        current["ai"] = {**current.get("ai", {}), **identity_data["ai"]}
-    if "user" in identity_data:
-        current["user"] = {**current.get("user", {}), **identity_data["user"]}
-    await write_db_field(user_id, "identity", current)
+    def merge(row: dict) -> dict:
+        current = _as_identity_dict(row.get("identity", {}))
+        # Deep merge or simple update
+        if "ai" in identity_data:
+            current["ai"] = {**current.get("ai", {}), **identity_data["ai"]}
+        if "user" in identity_data:
+            current["user"] = {**current.get("user", {}), **identity_data["user"]}
+        return {"identity": current}
+
+    await update_memory_row(user_id, merge)
+
+
+@dataclass
+class MemorySnapshot:
+    """The parts of a user's memories row needed to build one LLM prompt."""
+
+    identity: dict = dataclass_field(default_factory=dict)
+    core_instructions: list = dataclass_field(default_factory=list)
+    episodic_memory: list = dataclass_field(default_factory=list)
+    long_term_summary: str = ""
+    current_state: str = ""
+    # Row version: bumped by the database on every write to the row
+    updated_at: str | None = None
+    # Write counter of the row (migration 007); None where the column is absent
+    version: int | None = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> "MemorySnapshot":
+        return cls(
+            identity=_as_identity_dict(row.get("identity", {})),
+            core_instructions=_as_list(row.get("core_instructions", [])),
+            episodic_memory=_as_list(row.get("episodic_memory", [])),
+            long_term_summary=row.get("long_term_summary") or "",
+            current_state=row.get("current_state") or "",
+            updated_at=row.get("updated_at"),
+            version=row.get("version"),
+        )
+
+
+async def load_memory_snapshot(
+    user_id: str, fields: tuple[str, ...] = SNAPSHOT_FIELDS
+) -> MemorySnapshot:
+    """
+    Reads the requested memory fields from the cached row, fetching the row
+    in a single query on a miss. Fields that are not requested (or missing)
+    keep their empty defaults.
+    """
+    unknown = set(fields) - set(SNAPSHOT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown memory snapshot fields: {sorted(unknown)}")
+
+    try:
+        row = await read_memory_row(user_id)
+    except Exception:
+        logger.exception("Could not fetch memory snapshot")
+        return MemorySnapshot()
+    return MemorySnapshot.from_row({f: row[f] for f in fields if f in row})
 
 
 async def get_all_memories(user_id: str) -> dict:
     client = get_supabase_client()
     try:
-        response = client.table("memories").select("*").eq("user_id", user_id).execute()
+        response = await run_query(
+            client.table("memories").select("*").eq("user_id", user_id)
+        )
         if response.data and len(response.data) > 0:
             res = response.data[0]
             if isinstance(res, dict):
                 return res
-    except Exception as e:
-        print(f"Error fetching all memories: {e}")
-        pass
+    except Exception:
+        logger.exception("Could not fetch memories")
     return {}
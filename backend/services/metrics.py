@@ -0,0 +1,152 @@
+"""
+Prometheus metrics for the API, served at /metrics.
+
+Request latency is recorded per route template by MetricsMiddleware, which
+also counts the Supabase round-trips each request makes (run_query reports
+them through count_db_round_trip). The services record their own stage
+timings, Gemini token usage, TTS latency and size, auth cache lookups and
+coalesced calls.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Any
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Latency buckets (seconds) spanning cache hits to slow LLM calls
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)  # fmt: skip
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+REQUEST_SECONDS = Histogram(
+    "linxy_http_request_duration_seconds",
+    "Time from request start until the response body is fully sent.",
+    ("method", "route", "status"),
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_ROUND_TRIPS = Histogram(
+    "linxy_http_request_db_round_trips",
+    "Supabase queries issued while serving one request.",
+    ("method", "route"),
+    buckets=ROUND_TRIP_BUCKETS,
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "linxy_chat_stage_duration_seconds",
+    "Time spent in each stage of a child chat turn.",
+    ("stage",),
+    buckets=LATENCY_BUCKETS,
+)
+GEMINI_TOKENS = Counter(
+    "linxy_gemini_tokens",
+    "Tokens reported in Gemini usage_metadata, by call site and kind.",
+    ("operation", "kind"),
+)
+TTS_SECONDS = Histogram(
+    "linxy_tts_duration_seconds",
+    "Time to produce the audio for one generate_speech or stream_speech call.",
+    ("source",),
+    buckets=LATENCY_BUCKETS,
+)
+TTS_BYTES = Counter(
+    "linxy_tts_audio_bytes",
+    "Audio bytes returned by generate_speech and stream_speech.",
+    ("source",),
+)
+AUTH_TOKEN_CACHE = Counter(
+    "linxy_auth_token_cache_lookups",
+    "Verified-token cache lookups in get_current_user, by result.",
+    ("result",),
+)
+COALESCED_CALLS = Counter(
+    "linxy_coalesced_calls",
+    "Calls through a single-flight layer: served from its cache (hit), "
+    "joined an in-flight computation (shared) or started one (miss).",
+    ("name", "result"),
+)
+
+# usage_metadata attribute -> "kind" label
+_USAGE_FIELDS = {
+    "prompt_token_count": "prompt",
+    "candidates_token_count": "candidates",
+    "cached_content_token_count": "cached",
+    "thoughts_token_count": "thoughts",
+}
+
+# Round-trips of the request being served; None outside a request
+_db_round_trips: ContextVar[list[int] | None] = ContextVar(
+    "_db_round_trips", default=None
+)
+
+
+def count_db_round_trip() -> None:
+    counter = _db_round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def record_gemini_usage(operation: str, response: Any) -> None:
+    """Adds the token counts of a Gemini response (or final stream chunk)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for field, kind in _USAGE_FIELDS.items():
+        count = getattr(usage, field, None)
+        if isinstance(count, int) and count > 0:
+            GEMINI_TOKENS.labels(operation, kind).inc(count)
+
+
+def record_tts(source: str, seconds: float, audio: bytes) -> None:
+    TTS_SECONDS.labels(source).observe(seconds)
+    TTS_BYTES.labels(source).inc(len(audio))
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """The exposition body and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request until its last body chunk is sent, so streamed
+    responses are measured in full. Requests are labelled with the route
+    template (e.g. /jobs/{job_id}) to keep label cardinality bounded.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        round_trips = [0]
+        token = _db_round_trips.set(round_trips)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _db_round_trips.reset(token)
+            # The router stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_SECONDS.labels(method, route, str(status)).observe(
+                time.perf_counter() - started
+            )
+            REQUEST_DB_ROUND_TRIPS.labels(method, route).observe(round_trips[0])
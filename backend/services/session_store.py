@@ -0,0 +1,154 @@
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Protocol
+
+# Sessions idle for SESSION_IDLE_TTL seconds are dropped. Each session keeps at
+# most SESSION_MAX_TURNS messages and SESSION_MAX_CHARS characters of content,
+# discarding the oldest messages first.
+DEFAULT_IDLE_TTL = 1800
+DEFAULT_MAX_TURNS = 100
+DEFAULT_MAX_CHARS = 50_000
+
+_session_store: "SessionStore | None" = None
+
+
+class SessionBackend(Protocol):
+    """Storage for session transcripts, keyed by an opaque session key."""
+
+    async def get(self, key: str) -> list[dict]: ...
+
+    async def append(self, key: str, messages: list[dict]) -> None: ...
+
+    async def pop(self, key: str) -> list[dict]: ...
+
+
+@dataclass
+class _Session:
+    last_access: float
+    messages: list[dict] = field(default_factory=list)
+    chars: int = 0
+
+
+class InMemorySessionBackend:
+    """Per-process session storage with idle-TTL eviction and size caps."""
+
+    def __init__(
+        self,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        max_chars: int = DEFAULT_MAX_CHARS,
+    ) -> None:
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self._sessions: dict[str, _Session] = {}
+        self._next_sweep = time.monotonic() + idle_ttl
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def get(self, key: str) -> list[dict]:
+        session = self._touch(key)
+        return list(session.messages) if session else []
+
+    async def append(self, key: str, messages: list[dict]) -> None:
+        session = self._touch(key)
+        if session is None:
+            session = self._sessions[key] = _Session(last_access=time.monotonic())
+
+        for message in messages:
+            session.messages.append(message)
+            session.chars += len(message["content"])
+
+        while session.messages and (
+            len(session.messages) > self.max_turns or session.chars > self.max_chars
+        ):
+            session.chars -= len(session.messages.pop(0)["content"])
+
+    async def pop(self, key: str) -> list[dict]:
+        session = self._touch(key)
+        self._sessions.pop(key, None)
+        return session.messages if session else []
+
+    def _touch(self, key: str) -> _Session | None:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._evict_idle(now)
+
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        if now - session.last_access > self.idle_ttl:
+            del self._sessions[key]
+            return None
+        session.last_access = now
+        return session
+
+    def _evict_idle(self, now: float) -> None:
+        # Amortized sweep so abandoned sessions don't pile up between lookups
+        expired = [
+            key
+            for key, session in self._sessions.items()
+            if now - session.last_access > self.idle_ttl
+        ]
+        for key in expired:
+            del self._sessions[key]
+        self._next_sweep = now + self.idle_ttl
+
+
+class SessionStore:
+    """
+    Server-side chat transcripts, so clients send only the new message.
+    Sessions are scoped to the user that created them.
+    """
+
+    def __init__(self, backend: SessionBackend) -> None:
+        self.backend = backend
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _key(user_id: str, session_id: str) -> str:
+        return f"{user_id}:{session_id}"
+
+    async def get_history(self, user_id: str, session_id: str) -> list[dict]:
+        return await self.backend.get(self._key(user_id, session_id))
+
+    async def add_messages(
+        self, user_id: str, session_id: str, messages: list[dict]
+    ) -> None:
+        await self.backend.append(self._key(user_id, session_id), messages)
+
+    async def add_turn(
+        self, user_id: str, session_id: str, message: str, reply: str
+    ) -> None:
+        await self.add_messages(
+            user_id,
+            session_id,
+            [
+                {"role": "user", "content": message},
+                {"role": "model", "content": reply},
+            ],
+        )
+
+    async def end_session(self, user_id: str, session_id: str) -> list[dict]:
+        """Removes a session and returns its transcript."""
+        return await self.backend.pop(self._key(user_id, session_id))
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is not None:
+        return _session_store
+
+    backend = InMemorySessionBackend(
+        idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", DEFAULT_IDLE_TTL)),
+        max_turns=int(os.environ.get("SESSION_MAX_TURNS", DEFAULT_MAX_TURNS)),
+        max_chars=int(os.environ.get("SESSION_MAX_CHARS", DEFAULT_MAX_CHARS)),
+    )
+    _session_store = SessionStore(backend)
+    return _session_store
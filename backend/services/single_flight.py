@@ -0,0 +1,70 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, TypeVar
+
+from .metrics import COALESCED_CALLS
+
+T = TypeVar("T")
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class SingleFlight(Generic[T]):
+    """
+    Runs at most one computation per key at a time: callers that arrive while
+    it is in flight await the same result instead of starting their own. A
+    successful result is then served for `ttl` seconds (0 only coalesces);
+    failures reach the callers that were waiting but are not kept.
+
+    The computation runs as its own task, so a caller that is cancelled
+    (its client went away) does not cancel it for the others.
+    """
+
+    def __init__(
+        self, name: str, ttl: float, max_entries: int = DEFAULT_MAX_ENTRIES
+    ) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results: OrderedDict[Hashable, tuple[T, float]] = OrderedDict()
+        self._flights: dict[Hashable, asyncio.Future[T]] = {}
+
+    async def run(
+        self, key: Hashable, compute: Callable[[], Awaitable[T]], cache: bool = True
+    ) -> T:
+        entry = self._results.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._results.move_to_end(key)
+                COALESCED_CALLS.labels(self.name, "hit").inc()
+                return value
+            del self._results[key]
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(compute())
+            self._flights[key] = flight
+            flight.add_done_callback(functools.partial(self._landed, key, cache))
+            COALESCED_CALLS.labels(self.name, "miss").inc()
+        else:
+            COALESCED_CALLS.labels(self.name, "shared").inc()
+        return await asyncio.shield(flight)
+
+    def _landed(self, key: Hashable, cache: bool, flight: asyncio.Future[T]) -> None:
+        self._flights.pop(key, None)
+        # Retrieving the exception also keeps asyncio from logging it when
+        # every caller was cancelled
+        if flight.cancelled() or flight.exception() is not None:
+            return
+        if cache and self.ttl > 0 and self.max_entries > 0:
+            self._results[key] = (flight.result(), time.monotonic() + self.ttl)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        self._results.clear()
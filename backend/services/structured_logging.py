@@ -0,0 +1,205 @@
+"""
+Structured logging: one JSON object per line, written off the event loop.
+
+configure_logging() puts a QueueHandler on the root logger, so a log call
+only enqueues the record and a QueueListener thread formats and writes
+it. Each record carries the id of the request being served (set by
+RequestIdMiddleware) and, when tracing is on, the current trace and span
+ids.
+
+  LOG_LEVEL              root level (default INFO)
+  LOG_LEVELS             per-logger levels, e.g. "services.jwks=DEBUG,httpx=WARNING"
+  LOG_DEBUG_SAMPLE_RATE  share of sampled() records kept (default 1.0)
+  LOG_FORMAT             json (default) or text, for reading locally
+"""
+
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, TextIO
+
+from opentelemetry import trace
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_DEBUG_SAMPLE_RATE = 1.0
+REQUEST_ID_HEADER = "x-request-id"
+# Longer client-supplied ids are replaced rather than logged
+MAX_REQUEST_ID_LENGTH = 128
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+# Set by the filters below, written as dedicated fields instead of extras
+_CONTEXT_ATTRIBUTES = {"request_id", "trace_id", "span_id", "sample_rate"}
+
+_handler: QueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+def sampled(rate: float | None = None) -> dict[str, Any]:
+    """
+    `extra` for a high-frequency line: it is kept with probability `rate`,
+    or LOG_DEBUG_SAMPLE_RATE when no rate is given.
+    """
+    return {"sample_rate": rate}
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, default_rate: float) -> None:
+        super().__init__()
+        self.default_rate = default_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "sample_rate"):
+            return True
+        rate = record.sample_rate
+        if rate is None:
+            rate = self.default_rate
+        return rate >= 1 or random.random() < rate
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the request and trace ids; runs in the logging caller's context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            record.trace_id = format(span_context.trace_id, "032x")
+            record.span_id = format(span_context.span_id, "016x")
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id", "span_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in _CONTEXT_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() folds the traceback into the message text; keep
+        # it apart so the JSON record gets an "exception" field instead
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(stream: TextIO | None = None) -> None:
+    """(Re)configures logging from the environment. Idempotent."""
+    global _handler, _listener
+    close_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if os.environ.get("LOG_FORMAT", "json").lower() == "text":
+        output.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+    else:
+        output.setFormatter(JsonFormatter())
+
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    _handler = _QueueHandler(records)
+    # Sampling and context run at enqueue time, in the request's context
+    _handler.addFilter(
+        SamplingFilter(
+            float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", DEFAULT_DEBUG_SAMPLE_RATE))
+        )
+    )
+    _handler.addFilter(ContextFilter())
+    _listener = QueueListener(records, output)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", DEFAULT_LEVEL).upper())
+    for name, level in _parse_levels(os.environ.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def close_logging() -> None:
+    """Writes out queued records and detaches the queue handler."""
+    global _handler, _listener
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+    if _listener is not None:
+        _listener.stop()
+    _handler = None
+    _listener = None
+
+
+def _request_id(scope: Scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == REQUEST_ID_HEADER.encode():
+            candidate = value.decode("latin-1").strip()
+            if 0 < len(candidate) <= MAX_REQUEST_ID_LENGTH:
+                return candidate
+    return uuid.uuid4().hex
+
+
+class RequestIdMiddleware:
+    """
+    Tags each request with the caller's X-Request-ID (or a fresh one) for
+    the log records it produces, and echoes it on the response.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = request_id
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
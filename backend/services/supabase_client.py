@@ -1,12 +1,22 @@
 import os
+from typing import Any
+import anyio
+from anyio.lowlevel import RunVar
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from services.metrics import count_db_round_trip
 
 load_dotenv()
 
 # Singleton instance
 _supabase_client: Client | None = None
 
+# supabase-py's sync client blocks on every .execute(), so queries run in
+# worker threads instead of on the event loop. SUPABASE_MAX_WORKERS bounds how
+# many can be in flight at once (one limiter per event loop).
+DEFAULT_MAX_WORKERS = 8
+_db_limiter: RunVar[anyio.CapacityLimiter] = RunVar("_db_limiter")
+
 
 def get_supabase_client() -> Client:
     global _supabase_client
@@ -20,3 +30,19 @@ def get_supabase_client() -> Client:
 
     _supabase_client = create_client(url, key)
     return _supabase_client
+
+
+def get_db_limiter() -> anyio.CapacityLimiter:
+    try:
+        return _db_limiter.get()
+    except LookupError:
+        max_workers = int(os.environ.get("SUPABASE_MAX_WORKERS", DEFAULT_MAX_WORKERS))
+        limiter = anyio.CapacityLimiter(max(1, max_workers))
+        _db_limiter.set(limiter)
+        return limiter
+
+
+async def run_query(query: Any) -> Any:
+    """Runs a query builder's blocking .execute() in a bounded worker thread."""
+    count_db_round_trip()
+    return await anyio.to_thread.run_sync(query.execute, limiter=get_db_limiter())
@@ -0,0 +1,161 @@
+"""
+OpenTelemetry tracing: one span per HTTP request, with child spans for
+auth, memories reads and writes, each Gemini call and speech synthesis.
+
+TRACING_EXPORTER picks where finished spans go:
+  none    - tracing off (default); spans are no-ops
+  console - printed to stdout, for local runs
+  memory  - kept in memory, for tests (configure_tracing returns the exporter)
+  otlp    - OTLP over HTTP, to OTEL_EXPORTER_OTLP_ENDPOINT
+"""
+
+import os
+from contextlib import AbstractContextManager
+from typing import Any
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+)
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_EXPORTER = "none"
+SERVICE_NAME = "linxy-backend"
+
+_provider: TracerProvider | None = None
+_tracer: trace.Tracer = trace.NoOpTracer()
+
+# usage_metadata attribute -> span attribute
+_USAGE_ATTRIBUTES = {
+    "prompt_token_count": "gen_ai.usage.input_tokens",
+    "candidates_token_count": "gen_ai.usage.output_tokens",
+    "cached_content_token_count": "gen_ai.usage.cached_input_tokens",
+    "thoughts_token_count": "gen_ai.usage.reasoning_tokens",
+}
+
+
+def _make_exporter(name: str) -> SpanExporter:
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "memory":
+        return InMemorySpanExporter()
+    if name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {name}")
+
+
+def configure_tracing(exporter: str | None = None) -> SpanExporter | None:
+    """
+    (Re)configures tracing with the named exporter, or TRACING_EXPORTER.
+    Returns the exporter, or None when tracing is off.
+    """
+    global _provider, _tracer
+    name = (exporter or os.environ.get("TRACING_EXPORTER", DEFAULT_EXPORTER)).lower()
+    close_tracing()
+    if name == "none":
+        return None
+
+    span_exporter = _make_exporter(name)
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    # In-memory spans are exported as they end so tests can read them at once
+    processor = (
+        SimpleSpanProcessor(span_exporter)
+        if name == "memory"
+        else BatchSpanProcessor(span_exporter)
+    )
+    provider.add_span_processor(processor)
+    _provider = provider
+    _tracer = provider.get_tracer("linxy")
+    return span_exporter
+
+
+def close_tracing() -> None:
+    """Flushes pending spans and turns tracing off."""
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider = None
+    _tracer = trace.NoOpTracer()
+
+
+def _attributes(attributes: dict[str, Any] | None) -> dict[str, Any]:
+    # OpenTelemetry rejects None attribute values
+    return {k: v for k, v in (attributes or {}).items() if v is not None}
+
+
+def start_span(
+    name: str, attributes: dict[str, Any] | None = None
+) -> AbstractContextManager[trace.Span]:
+    """A child of the current span, current itself until the block exits."""
+    return _tracer.start_as_current_span(name, attributes=_attributes(attributes))
+
+
+def open_span(name: str, attributes: dict[str, Any] | None = None) -> trace.Span:
+    """
+    A child of the current span that the caller ends. For async generators,
+    which may resume in another context, so cannot hold a current span.
+    """
+    return _tracer.start_span(name, attributes=_attributes(attributes))
+
+
+def gemini_attributes(operation: str, model: str, stream: bool = False) -> dict:
+    return {
+        "gen_ai.system": "gemini",
+        "gen_ai.request.model": model,
+        "linxy.operation": operation,
+        "linxy.stream": stream,
+    }
+
+
+def set_usage_attributes(span: trace.Span, response: Any) -> None:
+    """Copies the token counts of a Gemini response onto its span."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for field, attribute in _USAGE_ATTRIBUTES.items():
+        count = getattr(usage, field, None)
+        if isinstance(count, int):
+            span.set_attribute(attribute, count)
+
+
+class TracingMiddleware:
+    """
+    Opens the root span of each HTTP request and names it after the route
+    template once routing is done. Streamed bodies are inside the span.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        with start_span(method, {"http.request.method": method}) as span:
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("http.route", route)
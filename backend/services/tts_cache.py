@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+import aiofiles
+import aiofiles.os
+
+logger = logging.getLogger(__name__)
+
+# Memory tier is sized in MB via TTS_CACHE_MEMORY_MB. The disk tier lives in
+# TTS_CACHE_DIR (empty string disables it) and is sized via TTS_CACHE_DISK_MB.
+DEFAULT_MEMORY_MB = 32
+DEFAULT_DISK_DIR = "data/tts_cache"
+DEFAULT_DISK_MB = 512
+
+_tts_cache: "TTSCache | None" = None
+
+# aiofiles.os has no utime; run it in the same thread pool as the other calls
+_utime = aiofiles.os.wrap(os.utime)
+
+
+class TTSCache:
+    """
+    Content-addressed cache for synthesized speech.
+    Audio is keyed by (voice_id, model_id, text) and kept in a size-bounded
+    in-memory LRU, backed by an optional size-bounded on-disk tier. Both tiers
+    evict least-recently-used entries once they exceed their byte budget.
+    """
+
+    def __init__(
+        self,
+        memory_max_bytes: int,
+        disk_dir: str | None = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        # Disk entries in LRU order, mapped to their size in bytes
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        if disk_dir:
+            self._load_disk_index()
+
+    @staticmethod
+    def key(voice_id: str, model_id: str, text: str) -> str:
+        raw = f"{voice_id}\0{model_id}\0{text}".encode()
+        return hashlib.sha256(raw).hexdigest()
+
+    async def get(self, key: str) -> bytes | None:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            return audio
+
+        if key not in self._disk:
+            return None
+        try:
+            async with aiofiles.open(self._disk_path(key), "rb") as f:
+                audio = await f.read()
+        except OSError:
+            self._forget_disk(key)
+            return None
+
+        self._disk.move_to_end(key)
+        try:
+            # Keep recency across restarts, since the index is rebuilt by mtime
+            await _utime(self._disk_path(key))
+        except OSError:
+            pass
+        self._remember(key, audio)
+        return audio
+
+    async def put(self, key: str, audio: bytes) -> None:
+        if not audio:
+            return
+        self._remember(key, audio)
+
+        if not self.disk_dir or key in self._disk or len(audio) > self.disk_max_bytes:
+            return
+        try:
+            await aiofiles.os.makedirs(self.disk_dir, exist_ok=True)
+            async with aiofiles.open(self._disk_path(key), "wb") as f:
+                await f.write(audio)
+        except OSError as e:
+            logger.warning("Could not write TTS cache entry: %s", e)
+            return
+
+        self._disk[key] = len(audio)
+        self._disk_bytes += len(audio)
+        while self._disk_bytes > self.disk_max_bytes:
+            oldest = next(iter(self._disk))
+            self._forget_disk(oldest)
+            try:
+                await aiofiles.os.remove(self._disk_path(oldest))
+            except OSError:
+                pass
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _forget_disk(self, key: str) -> None:
+        self._disk_bytes -= self._disk.pop(key, 0)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir or "", f"{key}.mp3")
+
+    def _load_disk_index(self) -> None:
+        """Rebuilds the disk LRU from what a previous process left behind."""
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return
+        entries = []
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".mp3"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+
+def get_tts_cache() -> TTSCache:
+    global _tts_cache
+    if _tts_cache is not None:
+        return _tts_cache
+
+    memory_mb = float(os.environ.get("TTS_CACHE_MEMORY_MB", DEFAULT_MEMORY_MB))
+    disk_dir = os.environ.get("TTS_CACHE_DIR", DEFAULT_DISK_DIR)
+    disk_mb = float(os.environ.get("TTS_CACHE_DISK_MB", DEFAULT_DISK_MB))
+
+    _tts_cache = TTSCache(
+        memory_max_bytes=int(memory_mb * 1024 * 1024),
+        disk_dir=disk_dir or None,
+        disk_max_bytes=int(disk_mb * 1024 * 1024),
+    )
+    return _tts_cache
@@ -1,5 +1,54 @@
+import asyncio
+import base64
+import logging
 import os
+import re
+import time
+from collections.abc import AsyncIterator
+
+import httpx
 from elevenlabs.client import AsyncElevenLabs
+from elevenlabs.core.api_error import ApiError
+
+from services.metrics import record_tts
+from services.tracing import open_span, start_span
+from services.tts_cache import get_tts_cache
+
+logger = logging.getLogger(__name__)
+
+# Using 'eleven_monolingual_v1' for lower latency if possible, or default
+MODEL_ID = "eleven_monolingual_v1"
+
+# One client, and with it one pooled HTTP connection set, per process.
+# Created at app startup (or lazily on first use) and closed on shutdown.
+_http_client: httpx.AsyncClient | None = None
+_elevenlabs_client: AsyncElevenLabs | None = None
+
+# A sentence ends at terminal punctuation (plus closing quotes) and whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+
+def get_elevenlabs_client() -> AsyncElevenLabs | None:
+    """Returns the shared ElevenLabs client, or None if no API key is set."""
+    global _http_client, _elevenlabs_client
+    if _elevenlabs_client is not None:
+        return _elevenlabs_client
+
+    api_key = os.environ.get("ELEVENLABS_API_KEY", "")
+    if not api_key:
+        return None
+
+    _http_client = httpx.AsyncClient(timeout=240)
+    _elevenlabs_client = AsyncElevenLabs(api_key=api_key, httpx_client=_http_client)
+    return _elevenlabs_client
+
+
+async def close_elevenlabs_client() -> None:
+    global _http_client, _elevenlabs_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _elevenlabs_client = None
 
 
 async def generate_speech(text: str, voice_id: str = "Rachel") -> bytes:
@@ -13,25 +62,182 @@ async def generate_speech(text: str, voice_id: str = "Rachel") -> bytes:
     Returns:
         Audio bytes
     """
-    api_key = os.environ.get("ELEVENLABS_API_KEY", "")
-    if not api_key:
-        print("Warning: ELEVENLABS_API_KEY not set. Returning empty audio.")
-        return b""
+    with start_span(
+        "tts.generate_speech",
+        {"tts.voice_id": voice_id, "tts.model": MODEL_ID, "tts.characters": len(text)},
+    ) as span:
+        started = time.perf_counter()
+        cache = get_tts_cache()
+        cache_key = cache.key(voice_id, MODEL_ID, text)
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            record_tts("cache", time.perf_counter() - started, cached)
+            span.set_attributes({"tts.cache_hit": True, "tts.bytes": len(cached)})
+            return cached
+
+        client = get_elevenlabs_client()
+        if client is None:
+            logger.warning("ELEVENLABS_API_KEY not set, returning empty audio")
+            return b""
 
-    client = AsyncElevenLabs(api_key=api_key)
+        try:
+            audio_generator = client.text_to_speech.convert(
+                text=text, voice_id=voice_id, model_id=MODEL_ID
+            )
 
+            # Collect chunks from async generator
+            chunks = []
+            async for chunk in audio_generator:
+                chunks.append(chunk)
+
+            audio = b"".join(chunks)
+        except Exception as e:
+            logger.error("Speech generation failed: %s", e)
+            span.record_exception(e)
+            return b""
+
+        record_tts("elevenlabs", time.perf_counter() - started, audio)
+        span.set_attributes({"tts.cache_hit": False, "tts.bytes": len(audio)})
+        await cache.put(cache_key, audio)
+        return audio
+
+
+async def stream_speech(text: str, voice_id: str = "Rachel") -> AsyncIterator[bytes]:
+    """
+    Streams speech audio for text from ElevenLabs' streaming endpoint,
+    yielding each audio chunk as soon as it arrives. Cached phrases are
+    served without calling ElevenLabs; fully streamed ones are cached.
+    """
+    # An async generator may resume in another context, so the span is ended
+    # here rather than held as the current span
+    span = open_span(
+        "tts.stream_speech",
+        {"tts.voice_id": voice_id, "tts.model": MODEL_ID, "tts.characters": len(text)},
+    )
     try:
-        # Using 'eleven_monolingual_v1' for lower latency if possible, or default
-        audio_generator = client.text_to_speech.convert(
-            text=text, voice_id=voice_id, model_id="eleven_monolingual_v1"
-        )
+        started = time.perf_counter()
+        cache = get_tts_cache()
+        cache_key = cache.key(voice_id, MODEL_ID, text)
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            record_tts("cache", time.perf_counter() - started, cached)
+            span.set_attributes({"tts.cache_hit": True, "tts.bytes": len(cached)})
+            yield cached
+            return
+
+        client = get_elevenlabs_client()
+        if client is None:
+            logger.warning("ELEVENLABS_API_KEY not set, returning empty audio")
+            return
 
-        # Collect chunks from async generator
         chunks = []
-        async for chunk in audio_generator:
-            chunks.append(chunk)
+        try:
+            async for chunk in client.text_to_speech.stream(
+                text=text, voice_id=voice_id, model_id=MODEL_ID
+            ):
+                chunks.append(chunk)
+                yield chunk
+        except (ApiError, httpx.HTTPError) as e:
+            logger.error("Speech streaming failed after %d chunks: %s", len(chunks), e)
+            span.record_exception(e)
+            return
+
+        audio = b"".join(chunks)
+        record_tts("elevenlabs", time.perf_counter() - started, audio)
+        span.set_attributes({"tts.cache_hit": False, "tts.bytes": len(audio)})
+        await cache.put(cache_key, audio)
+    finally:
+        span.end()
+
+
+class SentenceSplitter:
+    """Accumulates streamed text and hands back complete sentences."""
+
+    def __init__(self) -> None:
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        parts = _SENTENCE_END.split(self._buffer)
+        # The last part has no terminator yet, so keep buffering it
+        self._buffer = parts.pop()
+        return [part.strip() for part in parts if part.strip()]
+
+    def flush(self) -> str:
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest
+
+
+async def stream_reply_audio(
+    text_chunks: AsyncIterator[str], voice_id: str = "Rachel"
+) -> AsyncIterator[bytes]:
+    """
+    Turns a stream of reply text into a stream of audio.
+    Text is split at sentence boundaries and each sentence is synthesized as
+    soon as it is complete, while later text is still being generated.
+    """
+    sentences: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def split_sentences() -> None:
+        splitter = SentenceSplitter()
+        try:
+            async for text in text_chunks:
+                for sentence in splitter.feed(text):
+                    await sentences.put(sentence)
+            tail = splitter.flush()
+            if tail:
+                await sentences.put(tail)
+        finally:
+            await sentences.put(None)
+
+    producer = asyncio.create_task(split_sentences())
+    try:
+        while (sentence := await sentences.get()) is not None:
+            async for chunk in stream_speech(sentence, voice_id):
+                yield chunk
+        # Surface a failure in the text stream once the audio so far is out
+        await producer
+    finally:
+        producer.cancel()
+
 
-        return b"".join(chunks)
-    except Exception as e:
-        print(f"Error generating speech: {e}")
-        return b""
+async def stream_reply_events(
+    events: AsyncIterator[dict], voice_id: str = "Rachel"
+) -> AsyncIterator[dict]:
+    """
+    Speaks a streamed chat reply. Passes the chat events through and adds an
+    "audio" event (base64 MPEG) per synthesized chunk, so the text, the
+    stickers and the audio all come from one generation. "done" is held
+    back until the last chunk has been sent.
+    """
+    out: asyncio.Queue[dict | None] = asyncio.Queue()
+    done: dict | None = None
+
+    async def reply_text() -> AsyncIterator[str]:
+        nonlocal done
+        async for event in events:
+            if event["event"] == "done":
+                done = event
+                continue
+            await out.put(event)
+            if event["event"] == "token":
+                yield event["data"]["text"]
+
+    async def speak() -> None:
+        try:
+            async for chunk in stream_reply_audio(reply_text(), voice_id):
+                audio = base64.b64encode(chunk).decode("ascii")
+                await out.put({"event": "audio", "data": {"audio_base64": audio}})
+        finally:
+            await out.put(None)
+
+    speaker = asyncio.create_task(speak())
+    try:
+        while (event := await out.get()) is not None:
+            yield event
+        # Surface a failure in the reply or the speech once the rest is out
+        await speaker
+        if done is not None:
+            yield done
+    finally:
+        speaker.cancel()
@@ -1,3 +1,5 @@
+-- Base schema. Apply the files in migrations/ in order after this one.
+
 -- Create a table for memories
 CREATE TABLE memories (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
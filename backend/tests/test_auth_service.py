@@ -0,0 +1,89 @@
+import base64
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jwt.algorithms import ECAlgorithm
+
+from services import auth_service
+from services.jwks import JWKSManager, parse_jwks_keys
+
+SECRET = b"super-secret-jwt-key-for-tests-only"
+
+
+def _credentials(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def _hs256_token(sub: str = "user-1", exp_in: int = 3600) -> str:
+    claims = {"sub": sub, "aud": "authenticated", "exp": int(time.time()) + exp_in}
+    return jwt.encode(claims, SECRET, algorithm="HS256")
+
+
+@pytest.fixture(autouse=True)
+def jwt_env(monkeypatch):
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", base64.b64encode(SECRET).decode())
+    auth_service._token_cache.clear()
+    yield
+    auth_service._token_cache.clear()
+
+
+@pytest.mark.anyio
+async def test_repeat_token_skips_verification(monkeypatch):
+    token = _hs256_token()
+    assert await auth_service.get_current_user(_credentials(token)) == "user-1"
+
+    def fail_decode(*args, **kwargs):
+        raise AssertionError("cached token was verified again")
+
+    monkeypatch.setattr(auth_service.jwt, "decode", fail_decode)
+    assert await auth_service.get_current_user(_credentials(token)) == "user-1"
+
+
+def test_token_cache_honours_exp():
+    cache = auth_service.VerifiedTokenCache(max_entries=10, ttl_seconds=300)
+    cache.put("expired", "user-1", exp=time.time() - 1)
+    cache.put("valid", "user-2", exp=time.time() + 60)
+
+    assert cache.get("expired") is None
+    assert cache.get("valid") == "user-2"
+
+
+def test_token_cache_is_bounded():
+    cache = auth_service.VerifiedTokenCache(max_entries=2, ttl_seconds=300)
+    for i in range(3):
+        cache.put(f"token-{i}", f"user-{i}")
+
+    assert cache.get("token-0") is None
+    assert cache.get("token-2") == "user-2"
+
+
+@pytest.mark.anyio
+async def test_invalid_token_is_rejected_and_not_cached():
+    token = _hs256_token()[:-4] + "abcd"
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            await auth_service.get_current_user(_credentials(token))
+        assert exc.value.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_es256_uses_keys_parsed_from_jwks(monkeypatch):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    jwk = ECAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk["kid"] = "key-1"
+    manager = JWKSManager(urls=[])
+    manager.jwks = {"keys": [jwk]}
+    manager.keys = parse_jwks_keys(manager.jwks)
+    manager._expires_at = float("inf")
+
+    monkeypatch.setattr(auth_service, "get_jwks_manager", lambda: manager)
+
+    claims = {"sub": "user-es", "aud": "authenticated", "exp": time.time() + 60}
+    token = jwt.encode(claims, private_key, algorithm="ES256", headers={"kid": "key-1"})
+
+    assert await auth_service.get_current_user(_credentials(token)) == "user-es"
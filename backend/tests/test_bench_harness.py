@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from benchmarks import bench_hot_paths, compare, load_sessions
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert bench_hot_paths.percentile(values, 0.50) == 50
+    assert bench_hot_paths.percentile(values, 0.99) == 99
+    assert bench_hot_paths.percentile([7.0], 0.95) == 7
+    assert bench_hot_paths.percentile([], 0.5) == 0
+
+
+@pytest.mark.anyio
+async def test_endpoint_and_service_cases_run_against_fakes(restore_services):
+    args = bench_hot_paths.parse_args(
+        ["--quick", "--requests", "4", "--warmup", "1", "--concurrency", "2"]
+        + ["--llm-latency", "0", "--tts-latency", "0", "--db-latency", "0"]
+        + ["--case", "auth", "--case", "chat", "--case", "POST /chat"]
+    )
+
+    results = await bench_hot_paths.run(args)
+
+    assert {r.case for r in results} == {"auth", "chat", "POST /chat"}
+    assert all(r.errors == 0 and r.throughput_rps > 0 for r in results)
+    report = bench_hot_paths.report(args, results)
+    assert report["results"][0]["latency_ms"].keys() >= {"p50", "p95", "p99"}
+
+
+@pytest.mark.anyio
+async def test_memory_mutation_case_counts_conflicts(restore_services):
+    args = bench_hot_paths.parse_args(
+        ["--requests", "20", "--warmup", "2", "--concurrency", "1,8"]
+        + ["--db-latency", "0.001", "--case", "memory_mutation"]
+    )
+
+    results = await bench_hot_paths.run(args)
+
+    single = {r.concurrency: r for r in results if r.params == {"rows": 1}}
+    assert single[1].counters == {"attempts": 20, "conflicts": 0, "conflict_rate": 0}
+    # Eight writers on one row conflict, and every lost attempt is retried
+    contended = single[8].counters
+    assert contended["conflicts"] > 0
+    assert contended["attempts"] == 20 - single[8].errors + contended["conflicts"]
+
+
+def test_compare_flags_slower_p95_and_new_errors():
+    def row(p95: float, rps: float, errors: int = 0) -> dict:
+        latency = {"p50": 10.0, "p95": p95, "p99": p95}
+        return {"latency_ms": latency, "throughput_rps": rps, "errors": errors}
+
+    base = {"chat": row(20, 100), "auth": row(1, 5000), "wakeup": row(20, 50)}
+    new = {"chat": row(30, 100), "auth": row(1.05, 4900), "wakeup": row(20, 50, 2)}
+
+    regressed = {r[0] for r in compare.compare(base, new, 0.15) if r[-1]}
+
+    assert regressed == {"chat", "wakeup"}
+
+
+@pytest.mark.anyio
+async def test_load_sessions_replay_every_endpoint(restore_services):
+    args = load_sessions.parse_args(
+        ["--children", "1,3", "--duration", "0.3", "--turns", "5"]
+        + ["--think-time", "0", "--sticker-every", "2", "--memory-items", "3"]
+        + ["--llm-latency", "0", "--db-latency", "0", "--tts-latency", "0"]
+    )
+
+    steps, _ = await load_sessions.run(args)
+
+    assert [step.children for step in steps] == [1, 3]
+    for step in steps:
+        assert step.errors == 0
+        assert step.sessions > 0 and step.stickers > 0
+        assert set(step.endpoints) == set(load_sessions.ENDPOINTS)
+
+
+def test_saturation_is_the_first_step_that_scales_badly():
+    def step(children: int, rps: float, p95: float, errors: int = 0):
+        return load_sessions.Step(
+            children=children,
+            duration=10,
+            requests=100,
+            errors=errors,
+            error_rate=errors / 100,
+            throughput_rps=rps,
+            sessions=10,
+            stickers=0,
+            latency_ms={"p50": p95 / 2, "p95": p95, "p99": p95},
+            endpoints={},
+        )
+
+    args = load_sessions.parse_args([])
+    steps = [step(1, 2, 300), step(10, 19, 320), step(50, 60, 900), step(100, 60, 2000)]
+
+    assert load_sessions.mark_saturation(steps, args) == 10
+    assert steps[2].reasons == ["throughput per child fell", "p95 latency grew"]
+    flaky = [step(1, 2, 300), step(10, 20, 300, errors=5)]
+    assert load_sessions.mark_saturation(flaky, args) == 1
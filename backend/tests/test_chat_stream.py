@@ -0,0 +1,102 @@
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+# Set dummy API key before importing llm_service to avoid crash during import
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from services import llm_service
+from services.memory_service import MemorySnapshot
+
+
+def _chunk(*parts):
+    chunk = MagicMock()
+    chunk.candidates[0].content.parts = list(parts)
+    return chunk
+
+
+def _text_part(text):
+    part = MagicMock()
+    part.text = text
+    return part
+
+
+def _call_part(name, args):
+    part = MagicMock()
+    part.text = None
+    part.function_call.name = name
+    part.function_call.args = args
+    return part
+
+
+@pytest.fixture
+def mock_stream(monkeypatch):
+    mock_client = MagicMock()
+
+    def set_chunks(*chunks):
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        mock_client.aio.models.generate_content_stream = AsyncMock(
+            return_value=stream()
+        )
+
+    monkeypatch.setattr(llm_service, "client", mock_client)
+
+    async def mock_load_memory_snapshot(user_id, fields):
+        return MemorySnapshot(identity={"user": {"name": "Tommy"}})
+
+    monkeypatch.setattr(llm_service, "load_memory_snapshot", mock_load_memory_snapshot)
+    return set_chunks
+
+
+@pytest.mark.anyio
+async def test_stream_chat_response_emits_tokens_then_persists_sticker(
+    mock_stream, monkeypatch
+):
+    saved = []
+
+    async def mock_add_reward(user_id, sticker, reason):
+        saved.append((sticker, reason))
+
+    monkeypatch.setattr(llm_service, "add_reward", mock_add_reward)
+    mock_stream(
+        _chunk(_text_part("Great ")),
+        _chunk(
+            _text_part("counting!"),
+            _call_part("award_sticker", {"sticker": "Star", "reason": "Counted"}),
+        ),
+    )
+
+    events = []
+    async for event in llm_service.stream_chat_response("user", "1, 2, 3"):
+        # Nothing is persisted until the model stream has ended
+        if event["event"] != "done":
+            assert saved == []
+        events.append(event)
+
+    assert [e["event"] for e in events] == ["token", "token", "sticker", "done"]
+    assert events[2]["data"] == {"sticker": "Star", "reason": "Counted"}
+    assert events[-1]["data"]["reply"] == "Great counting!"
+    assert events[-1]["data"]["awarded_sticker"]["sticker"] == "Star"
+    assert saved == [("Star", "Counted")]
+
+
+@pytest.mark.anyio
+async def test_stream_parent_chat_response_reports_function_calls(mock_stream):
+    mock_stream(
+        _chunk(
+            _call_part("save_core_instruction", {"instruction": "Practice counting"}),
+            _call_part("update_identity", {"child_grade_level": "1st Grade"}),
+        ),
+    )
+
+    events = [e async for e in llm_service.stream_parent_chat_response("u", "Yes")]
+
+    assert [e["event"] for e in events] == ["instruction", "identity", "token", "done"]
+    done = events[-1]["data"]
+    assert done["saved_instruction"] == "Practice counting"
+    assert done["updated_identity"] == {"user": {"grade_level": "1st Grade"}}
+    assert done["reply"] == "I have successfully saved the instruction for Linxy."
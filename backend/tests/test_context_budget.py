@@ -0,0 +1,139 @@
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from services import context_budget as cb
+from services import llm_service
+from services.context_budget import ContextBudget, estimate_tokens, plan_child_context
+from services.memory_service import MemorySnapshot
+
+GENEROUS = ContextBudget(system_prompt=10_000, memories=10_000, history=10_000)
+
+
+def _history(turns: int, words: int = 20) -> list[dict]:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i} " + "word " * words})
+        history.append({"role": "model", "content": f"answer {i} " + "word " * words})
+    return history
+
+
+def _snapshot(**kwargs) -> MemorySnapshot:
+    return MemorySnapshot(
+        identity={"user": {"name": "Tommy"}},
+        core_instructions=kwargs.pop("core_instructions", ["Practice counting"]),
+        **kwargs,
+    )
+
+
+def test_estimate_tokens_is_roughly_four_chars_per_token():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 400) == 100
+    # Short words and punctuation count at least one token each
+    assert estimate_tokens("I, a, b, c.") == 8
+
+
+def test_everything_fits_untouched():
+    history = _history(3)
+    snapshot = _snapshot(episodic_memory=[{"summary": "Dinos"}])
+
+    plan = plan_child_context(snapshot, history, "hi", GENEROUS)
+
+    assert plan.history == history
+    assert plan.dropped_turns == 0
+    assert plan.snapshot == snapshot
+    tokens = plan.tokens
+    assert tokens["total"] == sum(
+        tokens[k] for k in ("system_prompt", "memories", "history", "message")
+    )
+    assert tokens["system_prompt"] > cb.STATIC_PREFIX_TOKENS
+
+
+def test_oldest_history_is_dropped():
+    history = _history(40)
+    budget = ContextBudget(system_prompt=10_000, memories=10_000, history=500)
+
+    plan = plan_child_context(_snapshot(), history, "hi", budget)
+
+    assert plan.tokens["history"] <= 500
+    assert plan.dropped_turns > 0
+    # The newest turns survive, in order, with nothing standing in for the rest
+    assert plan.history == history[plan.dropped_turns :]
+
+
+def test_memories_drop_oldest_episodes_then_shorten_summary():
+    snapshot = _snapshot(
+        episodic_memory=[{"summary": f"Episode {i} " + "x " * 100} for i in range(5)],
+        long_term_summary="Loves space. " * 200,
+    )
+
+    plan = plan_child_context(
+        snapshot, [], "hi", ContextBudget(10_000, memories=400, history=10_000)
+    )
+
+    assert plan.tokens["memories"] <= 400
+    assert plan.snapshot.episodic_memory == []
+    assert plan.snapshot.long_term_summary.endswith("...")
+
+    plan = plan_child_context(
+        snapshot, [], "hi", ContextBudget(10_000, memories=900, history=10_000)
+    )
+    # Room for the summary and some episodes: the newest ones are kept
+    kept = [e["summary"][:9] for e in plan.snapshot.episodic_memory]
+    assert kept == ["Episode 3", "Episode 4"]
+    assert plan.snapshot.long_term_summary == snapshot.long_term_summary
+
+
+def test_directives_are_kept_and_overflow_comes_from_memories_then_history(
+    monkeypatch, caplog
+):
+    directives = [f"Directive {i} " + "rule " * 100 for i in range(10)]
+    snapshot = _snapshot(
+        core_instructions=directives,
+        episodic_memory=[{"summary": "Episode " + "x " * 100}],
+    )
+    history = _history(20)
+    system = cb.STATIC_PREFIX_TOKENS + 600
+    budget = ContextBudget(system_prompt=system, memories=400, history=1500)
+
+    plan = plan_child_context(snapshot, history, "hi", budget)
+
+    assert plan.snapshot.core_instructions == directives
+    overflow = plan.tokens["system_prompt"] - system
+    assert plan.system_overflow == overflow > 400
+    # The memories budget is used up first, the history budget pays the rest
+    assert plan.snapshot.episodic_memory == []
+    assert plan.tokens["history"] <= 1500 - (overflow - 400)
+    assert plan.dropped_turns > 0
+
+    monkeypatch.setattr(llm_service, "context_budget", budget)
+    with caplog.at_level("WARNING", logger=llm_service.logger.name):
+        llm_service._plan_child_turn("user-1", snapshot, "hi", history)
+    assert "over budget" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_chat_turn_sends_trimmed_history(monkeypatch):
+    mock_client = MagicMock()
+    response = MagicMock()
+    response.candidates = []
+    mock_client.aio.models.generate_content = AsyncMock(return_value=response)
+    monkeypatch.setattr(llm_service, "client", mock_client)
+    monkeypatch.setattr(
+        llm_service,
+        "context_budget",
+        ContextBudget(system_prompt=10_000, memories=10_000, history=300),
+    )
+
+    history = _history(30)
+    await llm_service.generate_chat_response(
+        "user-1", "latest", history, snapshot=_snapshot()
+    )
+
+    contents = mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+    assert contents[-1].parts[0].text == "latest"
+    assert contents[-2].parts[0].text == history[-1]["content"]
+    assert len(contents) < len(history)
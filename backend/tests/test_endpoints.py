@@ -4,11 +4,20 @@ import os
 if "GEMINI_API_KEY" not in os.environ:
     os.environ["GEMINI_API_KEY"] = "dummy"
 
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import anyio
+import pytest
 from fastapi.testclient import TestClient
+
+import main
+from benchmarks.fakes import FakeSupabase
 from main import app
 from services.auth_service import get_current_user
-from unittest.mock import patch, AsyncMock
-import pytest
+from services.job_queue import JobQueue, SQLiteJobBackend
+from services.memory_service import HistoryCursor
 
 # Override dependency to return a mock user_id
 app.dependency_overrides[get_current_user] = lambda: "test_user_id"
@@ -30,18 +39,11 @@ async def test_wakeup_endpoint(monkeypatch):
 
 @pytest.mark.anyio
 async def test_child_rewards_endpoint(monkeypatch):
-    async def mock_get_rewards(user_id):
+    async def mock_get_rewards(user_id, limit, before):
         return [
             {"sticker": "Dino", "reason": "Drawing", "timestamp": "2023-10-27T10:00:00"}
         ]
 
-    monkeypatch.setattr("services.memory_service.get_rewards", mock_get_rewards)
-    # main.py imports get_rewards from services.memory_service too, let's patch it there if needed
-    # But wait, main.py does: from services.memory_service import ... get_episodic_memory ...
-    # It does NOT import get_rewards currently. I will be adding it.
-    # So I will need to patch main.get_rewards once I add it.
-
-    # For now, let's assume I will import it in main.
     monkeypatch.setattr("main.get_rewards", mock_get_rewards)
 
     response = client.get("/child/rewards")
@@ -50,6 +52,108 @@ async def test_child_rewards_endpoint(monkeypatch):
     assert "rewards" in data
     assert len(data["rewards"]) == 1
     assert data["rewards"][0]["sticker"] == "Dino"
+    assert data["next_before"] is None
+
+
+def test_child_rewards_pages_with_before_cursor(monkeypatch):
+    mock_get_rewards = AsyncMock(
+        return_value=[
+            {
+                "id": 7,
+                "sticker": "Star",
+                "reason": "",
+                "timestamp": "2026-01-01T00:00:00+00:00",
+                "created_at": "2026-01-01T00:00:00+00:00",
+            },
+            {
+                "id": 9,
+                "sticker": "Moon",
+                "reason": "",
+                "timestamp": "2026-01-02T00:00:00+00:00",
+                "created_at": "2026-01-02T00:00:00+00:00",
+            },
+        ]
+    )
+    monkeypatch.setattr("main.get_rewards", mock_get_rewards)
+
+    response = client.get(
+        "/child/rewards",
+        params={"limit": 2, "before": "2026-01-03T00:00:00+00:00~12"},
+    )
+
+    assert response.status_code == 200
+    mock_get_rewards.assert_awaited_once_with(
+        "test_user_id",
+        limit=2,
+        before=HistoryCursor("2026-01-03T00:00:00+00:00", 12),
+    )
+    # A full page points at its oldest entry for the next one
+    assert response.json()["next_before"] == "2026-01-01T00:00:00+00:00~7"
+
+
+def test_parent_report_pages_follow_created_at_not_the_report_timestamp(
+    monkeypatch,
+):
+    db = FakeSupabase()
+    # Backfilled reports whose own timestamps disagree with created_at
+    db.tables["parent_reports"] = [
+        {
+            "id": i,
+            "user_id": "test_user_id",
+            "report": {"themes": [f"T{i}"], "timestamp": f"2020-01-0{6 - i}"},
+            "created_at": f"2026-01-0{i}T00:00:00+00:00",
+        }
+        for i in range(1, 6)
+    ]
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+
+    seen, params = [], {"limit": 2}
+    while True:
+        page = client.get("/parent/reports", params=params).json()
+        seen = [r["themes"][0] for r in page["reports"]] + seen
+        if page["next_before"] is None:
+            break
+        params["before"] = page["next_before"]
+
+    assert seen == ["T1", "T2", "T3", "T4", "T5"]
+
+
+def test_child_rewards_rejects_a_malformed_cursor():
+    response = client.get("/child/rewards", params={"before": "yesterday~1"})
+    assert response.status_code == 422
+
+
+def test_child_rewards_rejects_oversized_page():
+    response = client.get("/child/rewards", params={"limit": 10_000})
+    assert response.status_code == 422
+
+
+def test_child_rewards_summary_mode(monkeypatch):
+    summary = {"total": 3, "counts": {"Star": 2, "Moon": 1}, "latest": []}
+    mock_summary = AsyncMock(return_value=summary)
+    monkeypatch.setattr("main.get_rewards_summary", mock_summary)
+
+    response = client.get("/child/rewards", params={"summary": True, "latest": 3})
+
+    assert response.json() == summary
+    mock_summary.assert_awaited_once_with("test_user_id", 3)
+
+
+def test_parent_reports_pages_and_summarizes(monkeypatch):
+    mock_get_reports = AsyncMock(
+        return_value=[{"id": 1, "timestamp": "2026-01-01T00:00:00"}]
+    )
+    mock_summary = AsyncMock(return_value={"total": 7, "latest": []})
+    monkeypatch.setattr("main.get_parent_reports", mock_get_reports)
+    monkeypatch.setattr("main.get_parent_reports_summary", mock_summary)
+
+    page = client.get("/parent/reports", params={"limit": 5}).json()
+    assert page["status"] == "success"
+    assert page["next_before"] is None
+    mock_get_reports.assert_awaited_once_with("test_user_id", limit=5, before=None)
+
+    summary = client.get("/parent/reports", params={"summary": True}).json()
+    assert summary == {"status": "success", "total": 7, "latest": []}
 
 
 @pytest.mark.anyio
@@ -94,6 +198,7 @@ async def test_parent_chat_endpoint_update_identity(monkeypatch):
     monkeypatch.setattr("main.update_identity_dict", mock_update_identity_dict)
 
     from fastapi.testclient import TestClient
+
     from main import app
 
     client = TestClient(app)
@@ -115,3 +220,174 @@ def test_debug_memories_endpoint():
         assert response.status_code == 200
         assert response.json() == {"id": "123", "identity": {"test": "data"}}
         mock_get_all.assert_called_once_with("test_user_id")
+
+
+def _parse_sse(body: str) -> list[tuple[str, dict]]:
+    import json
+
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_stream_endpoint(monkeypatch):
+    async def mock_stream_chat_response(user_id, message, history):
+        yield {"event": "token", "data": {"text": "Hi "}}
+        yield {"event": "token", "data": {"text": "there!"}}
+        yield {"event": "done", "data": {"reply": "Hi there!", "awarded_sticker": None}}
+
+    monkeypatch.setattr("main.stream_chat_response", mock_stream_chat_response)
+
+    response = client.post("/chat/stream", json={"message": "Hello", "history": []})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["token", "token", "done"]
+    assert events[-1][1]["reply"] == "Hi there!"
+
+
+def test_parent_chat_stream_endpoint_persists_on_done(monkeypatch):
+    async def mock_stream_parent_chat_response(user_id, message, history):
+        yield {"event": "instruction", "data": {"instruction": "Read daily"}}
+        yield {
+            "event": "done",
+            "data": {
+                "reply": "Saved!",
+                "saved_instruction": "Read daily",
+                "updated_identity": None,
+            },
+        }
+
+    saved = []
+
+    async def mock_add_core_instruction(user_id, instruction):
+        saved.append(instruction)
+
+    monkeypatch.setattr(
+        "main.stream_parent_chat_response", mock_stream_parent_chat_response
+    )
+    monkeypatch.setattr("main.add_core_instruction", mock_add_core_instruction)
+
+    response = client.post("/parent/chat/stream", json={"message": "Yes"})
+    assert response.status_code == 200
+    assert [name for name, _ in _parse_sse(response.text)] == ["instruction", "done"]
+    assert saved == ["Read daily"]
+
+
+def test_chat_session_keeps_history_server_side(monkeypatch):
+    seen_histories = []
+
+    async def mock_generate_chat_response(user_id, message, history):
+        seen_histories.append(list(history))
+        return {"reply": f"echo {message}", "awarded_sticker": None}
+
+    monkeypatch.setattr("main.generate_chat_response", mock_generate_chat_response)
+
+    first = client.post("/chat", json={"message": "one"}).json()
+    session_id = first["session_id"]
+    assert session_id
+
+    second = client.post("/chat", json={"message": "two", "session_id": session_id})
+    assert second.json()["session_id"] == session_id
+    assert seen_histories[0] == []
+    assert seen_histories[1] == [
+        {"role": "user", "content": "one"},
+        {"role": "model", "content": "echo one"},
+    ]
+
+    job_queue = JobQueue(SQLiteJobBackend(":memory:"))
+    monkeypatch.setattr("main.get_job_queue", lambda: job_queue)
+
+    response = client.post("/chat/reflect", json={"session_id": session_id})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    job = anyio.run(job_queue.get, job_id)
+    assert job.user_id == "test_user_id"
+    assert [m["content"] for m in job.payload["history"]] == [
+        "one",
+        "echo one",
+        "two",
+        "echo two",
+    ]
+
+    # A repeated End Session reuses the queued job
+    again = client.post("/chat/reflect", json={"session_id": session_id})
+    assert again.json()["job_id"] == job_id
+
+
+def test_failed_enqueue_keeps_the_session(monkeypatch):
+    monkeypatch.setattr(
+        "main.generate_chat_response",
+        AsyncMock(return_value={"reply": "hello", "awarded_sticker": None}),
+    )
+    session_id = client.post("/chat", json={"message": "one"}).json()["session_id"]
+
+    broken_queue = MagicMock()
+    broken_queue.enqueue = AsyncMock(side_effect=RuntimeError("queue down"))
+    monkeypatch.setattr("main.get_job_queue", lambda: broken_queue)
+    assert (
+        client.post("/chat/reflect", json={"session_id": session_id}).status_code == 500
+    )
+
+    job_queue = JobQueue(SQLiteJobBackend(":memory:"))
+    monkeypatch.setattr("main.get_job_queue", lambda: job_queue)
+    retried = client.post("/chat/reflect", json={"session_id": session_id})
+    job = anyio.run(job_queue.get, retried.json()["job_id"])
+    assert [m["content"] for m in job.payload["history"]] == ["one", "hello"]
+
+
+def test_identical_transcript_is_reflected_again_later(monkeypatch):
+    job_queue = JobQueue(SQLiteJobBackend(":memory:"))
+    monkeypatch.setattr("main.get_job_queue", lambda: job_queue)
+
+    async def reflect(job, report):
+        return {"reflection": None}
+
+    job_queue.register("session_reflection", reflect)
+    body = {"history": [{"role": "user", "content": "hi"}]}
+
+    first = client.post("/chat/reflect", json=body).json()["job_id"]
+    assert anyio.run(job_queue.run_once)
+    # The window slides with the first job, not with a wall-clock bucket
+    almost = time.time() + main.REFLECTION_DEDUP_SECONDS - 1
+    monkeypatch.setattr("services.job_queue.time", SimpleNamespace(time=lambda: almost))
+    assert client.post("/chat/reflect", json=body).json()["job_id"] == first
+
+    later = time.time() + main.REFLECTION_DEDUP_SECONDS
+    monkeypatch.setattr("services.job_queue.time", SimpleNamespace(time=lambda: later))
+    again = client.post("/chat/reflect", json=body).json()["job_id"]
+    assert again != first
+    assert client.post("/chat/reflect", json=body).json()["job_id"] == again
+
+
+def test_job_status_endpoint(monkeypatch):
+    job_queue = JobQueue(SQLiteJobBackend(":memory:"))
+    monkeypatch.setattr("main.get_job_queue", lambda: job_queue)
+
+    async def reflect(job, report):
+        await report("private_reflection", {"summary": "Counted"})
+        await report("parent_report", {"error": "model down"})
+        return {"reflection": {"summary": "Counted"}}
+
+    job_queue.register("session_reflection", reflect)
+    job_id = client.post(
+        "/chat/reflect", json={"history": [{"role": "user", "content": "hi"}]}
+    ).json()["job_id"]
+
+    queued = client.get(f"/jobs/{job_id}").json()
+    assert queued["status"] == "queued"
+    assert queued["completed_stages"] == []
+
+    assert anyio.run(job_queue.run_once)
+    done = client.get(f"/jobs/{job_id}").json()
+    assert done["status"] == "succeeded"
+    assert done["completed_stages"] == ["private_reflection"]
+    assert done["failed_stages"] == ["parent_report"]
+    assert done["result"] == {"reflection": {"summary": "Counted"}}
+
+    other = anyio.run(job_queue.enqueue, "session_reflection", "other_user", {})
+    assert client.get(f"/jobs/{other.id}").status_code == 404
+    assert client.get("/jobs/missing").status_code == 404
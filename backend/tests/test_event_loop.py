@@ -0,0 +1,81 @@
+import os
+
+# Set dummy key before importing anything that uses it
+if "GEMINI_API_KEY" not in os.environ:
+    os.environ["GEMINI_API_KEY"] = "dummy"
+
+import asyncio
+import statistics
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+
+from main import app
+from services import llm_service
+from services.auth_service import get_current_user
+
+app.dependency_overrides[get_current_user] = lambda: "test_user_id"
+
+GEMINI_LATENCY = 0.5
+DB_LATENCY = 0.02
+
+
+def _blocking_execute():
+    # supabase-py's sync client blocks the calling thread for the round-trip
+    time.sleep(DB_LATENCY)
+    response = MagicMock()
+    response.data = [{"rewards": [{"sticker": "Star"}]}]
+    return response
+
+
+@pytest.fixture
+def slow_backends(monkeypatch):
+    db = MagicMock()
+    db.table().select().eq().execute.side_effect = _blocking_execute
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+
+    async def slow_generate_content(**kwargs):
+        await asyncio.sleep(GEMINI_LATENCY)
+        response = MagicMock()
+        response.candidates = []
+        return response
+
+    genai = MagicMock()
+    genai.aio.models.generate_content = AsyncMock(side_effect=slow_generate_content)
+    monkeypatch.setattr(llm_service, "client", genai)
+
+
+def _p99(samples: list[float]) -> float:
+    return statistics.quantiles(samples, n=100)[-1]
+
+
+async def _time_rewards(client: httpx.AsyncClient, count: int) -> list[float]:
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.get("/child/rewards")
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return latencies
+
+
+@pytest.mark.anyio
+async def test_cheap_endpoint_latency_flat_while_chats_in_flight(slow_backends):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # Warm up the app before measuring
+        await _time_rewards(client, 30)
+
+        chats = [
+            asyncio.create_task(client.post("/chat", json={"message": "hi"}))
+            for _ in range(10)
+        ]
+        await asyncio.sleep(0.05)  # let every chat reach the Gemini call
+        loaded = await _time_rewards(client, 30)
+        responses = await asyncio.gather(*chats)
+
+    assert all(r.status_code == 200 for r in responses)
+    # A blocking Gemini call would hold every rewards request for GEMINI_LATENCY
+    assert _p99(loaded) < GEMINI_LATENCY / 2
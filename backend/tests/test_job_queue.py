@@ -0,0 +1,223 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import job_queue as jq
+from services.job_queue import JobQueue, SQLiteJobBackend
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(
+        SQLiteJobBackend(str(tmp_path / "jobs.sqlite3")),
+        max_attempts=3,
+        poll_interval=0.05,
+        backoff_base=10,
+    )
+
+
+async def _make_due(queue, job_id):
+    backend = queue.backend
+    await backend._run(
+        lambda: backend._conn.execute(
+            "UPDATE jobs SET run_at = 0 WHERE id = ?", (job_id,)
+        )
+    )
+
+
+@pytest.mark.anyio
+async def test_enqueue_is_idempotent(queue):
+    first = await queue.enqueue("kind", "user-1", {"n": 1}, idempotency_key="k")
+    second = await queue.enqueue("kind", "user-1", {"n": 2}, idempotency_key="k")
+
+    assert second.id == first.id
+    assert (await queue.get(first.id)).payload == {"n": 1}
+
+
+@pytest.mark.anyio
+async def test_dedup_window_slides_from_the_finished_job(queue, monkeypatch):
+    async def handler(job, report):
+        return None
+
+    queue.register("kind", handler)
+    first = await queue.enqueue("kind", "user-1", {}, "k", dedup_seconds=60)
+    running = await queue.enqueue("kind", "user-1", {}, "k", dedup_seconds=0)
+    # Unfinished jobs keep their key however old they are
+    assert running.id == first.id
+
+    assert await queue.run_once()
+    again = await queue.enqueue("kind", "user-1", {}, "k", dedup_seconds=60)
+    assert again.id == first.id
+    later = time.time() + 60
+    monkeypatch.setattr(jq, "time", SimpleNamespace(time=lambda: later))
+    second = await queue.enqueue("kind", "user-1", {}, "k", dedup_seconds=60)
+
+    assert second.id != first.id
+    assert second.status == jq.QUEUED
+    assert (await queue.get(first.id)).idempotency_key == f"k#{first.id}"
+
+
+@pytest.mark.anyio
+async def test_successful_job_stores_result_and_progress(queue):
+    async def handler(job, report):
+        await report("step", True)
+        return {"doubled": job.payload["n"] * 2}
+
+    queue.register("double", handler)
+    job = await queue.enqueue("double", "user-1", {"n": 21})
+
+    assert await queue.run_once()
+    stored = await queue.get(job.id)
+    assert stored.status == jq.SUCCEEDED
+    assert stored.attempts == 1
+    assert stored.progress == {"step": True}
+    assert stored.result == {"doubled": 42}
+    # The payload was only for the handler
+    assert stored.payload == {}
+    assert not await queue.run_once()
+
+
+@pytest.mark.anyio
+async def test_failed_job_is_retried_with_backoff_then_fails(queue):
+    calls = []
+
+    async def handler(job, report):
+        calls.append(job.attempts)
+        raise RuntimeError("gemini unavailable")
+
+    queue.register("flaky", handler)
+    job = await queue.enqueue("flaky", "user-1", {})
+
+    assert await queue.run_once()
+    stored = await queue.get(job.id)
+    assert stored.status == jq.QUEUED
+    assert stored.error == "gemini unavailable"
+    # backoff_base=10 with jitter puts the retry 5-10s out
+    assert 4 < stored.run_at - time.time() <= 10
+    # Not due yet
+    assert not await queue.run_once()
+
+    for _ in range(2):
+        await _make_due(queue, job.id)
+        assert await queue.run_once()
+        stored = await queue.get(job.id)
+
+    assert calls == [1, 2, 3]
+    assert stored.status == jq.FAILED
+    assert stored.attempts == 3
+
+
+@pytest.mark.anyio
+async def test_expired_lease_is_reclaimed(queue):
+    job = await queue.enqueue("kind", "user-1", {})
+    claimed = await queue.backend.claim(time.time(), lease_seconds=60)
+    assert claimed.id == job.id
+
+    # Still leased to the first worker
+    assert await queue.backend.claim(time.time(), lease_seconds=60) is None
+    reclaimed = await queue.backend.claim(time.time() + 61, lease_seconds=60)
+    assert reclaimed.id == job.id
+    assert reclaimed.attempts == 2
+
+
+@pytest.mark.anyio
+async def test_workers_pick_up_enqueued_jobs(queue):
+    finished = asyncio.Event()
+
+    async def handler(job, report):
+        finished.set()
+
+    queue.register("kind", handler)
+    await queue.start()
+    try:
+        job = await queue.enqueue("kind", "user-1", {})
+        await asyncio.wait_for(finished.wait(), timeout=2)
+        for _ in range(50):
+            if (await queue.get(job.id)).status == jq.SUCCEEDED:
+                break
+            await asyncio.sleep(0.02)
+        assert (await queue.get(job.id)).status == jq.SUCCEEDED
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.anyio
+async def test_stop_hands_running_job_back(queue):
+    started = asyncio.Event()
+
+    async def handler(job, report):
+        started.set()
+        await asyncio.sleep(10)
+
+    queue.register("slow", handler)
+    await queue.start()
+    job = await queue.enqueue("slow", "user-1", {})
+    await asyncio.wait_for(started.wait(), timeout=2)
+    await queue.stop()
+
+    stored = await queue.get(job.id)
+    assert stored.status == jq.QUEUED
+    assert stored.attempts == 0
+
+
+@pytest.mark.anyio
+async def test_stale_claim_cannot_overwrite_the_newer_one(queue):
+    job = await queue.enqueue("kind", "user-1", {})
+    stale = await queue.backend.claim(time.time(), lease_seconds=60)
+    fresh = await queue.backend.claim(time.time() + 61, lease_seconds=60)
+
+    stale.status, stale.result = jq.SUCCEEDED, {"stale": True}
+    assert not await queue.backend.save(stale, stale.attempts)
+    assert not await queue.backend.renew(stale, stale.attempts, time.time() + 60)
+    fresh.progress = {"step": True}
+    assert await queue.backend.save(fresh, fresh.attempts)
+
+    stored = await queue.get(job.id)
+    assert stored.status == jq.RUNNING
+    assert stored.attempts == 2
+    assert stored.progress == {"step": True}
+    assert stored.result is None
+
+
+@pytest.mark.anyio
+async def test_running_job_keeps_renewing_its_lease(tmp_path):
+    queue = JobQueue(
+        SQLiteJobBackend(str(tmp_path / "jobs.sqlite3")), lease_seconds=0.2
+    )
+    competing_claims = []
+
+    async def handler(job, report):
+        for _ in range(4):
+            await asyncio.sleep(0.1)
+            competing_claims.append(await queue.backend.claim(time.time(), 0.2))
+        return {"done": True}
+
+    queue.register("slow", handler)
+    job = await queue.enqueue("slow", "user-1", {})
+
+    assert await queue.run_once()
+    assert competing_claims == [None] * 4
+    stored = await queue.get(job.id)
+    assert stored.status == jq.SUCCEEDED
+    assert stored.attempts == 1
+
+
+@pytest.mark.anyio
+async def test_worker_that_lost_its_lease_stops_writing(queue):
+    async def handler(job, report):
+        # Another worker re-claims the job as if this one's lease had lapsed
+        await queue.backend.claim(time.time() + queue.lease_seconds + 1, 60)
+        await report("step", "stale")
+        return {"stale": True}
+
+    queue.register("kind", handler)
+    job = await queue.enqueue("kind", "user-1", {})
+
+    assert await queue.run_once()
+    stored = await queue.get(job.id)
+    assert stored.status == jq.RUNNING
+    assert stored.attempts == 2
+    assert stored.progress == {}
+    assert stored.result is None
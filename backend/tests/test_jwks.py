@@ -0,0 +1,105 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from jwt.algorithms import ECAlgorithm
+
+from services.jwks import JWKSManager
+
+
+def _jwk(kid: str) -> dict:
+    public_key = ec.generate_private_key(ec.SECP256R1()).public_key()
+    jwk = ECAlgorithm.to_jwk(public_key, as_dict=True)
+    jwk["kid"] = kid
+    return jwk
+
+
+class StubJWKSServer:
+    """A local JWKS endpoint whose keys and Cache-Control can be changed."""
+
+    def __init__(self) -> None:
+        self.keys = [_jwk("key-1")]
+        self.cache_control = "public, max-age=600"
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                body = json.dumps({"keys": stub.keys}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", stub.cache_control)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubJWKSServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+async def manager(stub_server):
+    manager = JWKSManager([stub_server.url], min_refetch_interval=60)
+    yield manager
+    await manager.aclose()
+
+
+@pytest.mark.anyio
+async def test_concurrent_cold_requests_fetch_once(stub_server, manager):
+    keys = await asyncio.gather(*(manager.get_key("key-1") for _ in range(20)))
+
+    assert all(key is not None for key in keys)
+    assert stub_server.hits == 1
+
+
+@pytest.mark.anyio
+async def test_refreshes_in_background_before_max_age(stub_server, manager):
+    stub_server.cache_control = "max-age=1"
+    await manager.get_key("key-1")
+
+    # The background refresh fires at 80% of max-age without any request
+    await asyncio.sleep(1.1)
+    assert stub_server.hits >= 2
+
+
+@pytest.mark.anyio
+async def test_unknown_kid_refetches_once_then_rate_limits(stub_server, manager):
+    await manager.get_key("key-1")
+    stub_server.keys.append(_jwk("key-2"))
+
+    # Key rotation is picked up on the first miss
+    assert await manager.get_key("key-2") is not None
+    assert stub_server.hits == 2
+
+    # Further unknown kids within the interval do not hit the endpoint
+    assert await manager.get_key("forged-1") is None
+    assert await manager.get_key("forged-2") is None
+    assert stub_server.hits == 2
+
+
+@pytest.mark.anyio
+async def test_serves_previous_keys_when_refresh_fails(stub_server, manager):
+    await manager.get_key("key-1")
+    stub_server.close()
+
+    await manager.refresh(force=True)
+    assert await manager.get_key("key-1") is not None
@@ -0,0 +1,137 @@
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from benchmarks.fakes import FakeSupabase
+from services import llm_service
+from services import long_term_summary as lts
+
+
+def _episode(day: int, interests=(), milestones=(), summary="A session") -> dict:
+    return {
+        "timestamp": f"2026-10-{day:02d}T10:00:00+00:00",
+        "summary": summary,
+        "interests": list(interests),
+        "milestones": list(milestones),
+    }
+
+
+def test_fold_counts_interests_and_milestones_with_recency():
+    state = lts.new_state()
+
+    lts.fold_episode(state, _episode(1, ["Dinosaurs", "space"]))
+    changed = lts.fold_episode(
+        state, _episode(2, ["dinosaurs", "Dinosaurs"], ["counted to 20"])
+    )
+
+    assert changed == {"interests": ["Dinosaurs"], "milestones": ["counted to 20"]}
+    dinosaurs = state["interests"]["dinosaurs"]
+    assert dinosaurs["count"] == 2
+    assert dinosaurs["first_seen"].startswith("2026-10-01")
+    assert dinosaurs["last_seen"].startswith("2026-10-02")
+    assert state["episodes"] == 2
+
+
+def test_folding_the_same_episode_twice_is_a_no_op():
+    state = lts.new_state()
+    episode = _episode(1, ["space"])
+
+    assert lts.fold_episode(state, episode) is not None
+    assert lts.fold_episode(state, episode) is None
+    assert state["interests"]["space"]["count"] == 1
+    assert state["episodes"] == 1
+
+
+def test_sections_keep_the_most_recent_entries(monkeypatch):
+    monkeypatch.setattr(lts, "MAX_SECTION_ENTRIES", 3)
+    state = lts.new_state()
+    for day in range(1, 6):
+        lts.fold_episode(state, _episode(day, [f"topic {day}"]))
+
+    assert sorted(state["interests"]) == ["topic 3", "topic 4", "topic 5"]
+
+
+def test_render_lists_themes_then_sections():
+    state = lts.new_state("Curious about nature.")
+    lts.fold_episode(state, _episode(1, ["bugs"]))
+    lts.fold_episode(state, _episode(3, ["bugs", "space"], ["read a word"]))
+
+    assert lts.render_summary(state) == (
+        "Themes: Curious about nature.\n\n"
+        "Interests (most recent first):\n"
+        "- bugs (x2, last 2026-10-03)\n"
+        "- space (x1, last 2026-10-03)\n\n"
+        "Milestones (most recent first):\n"
+        "- read a word (x1, last 2026-10-03)"
+    )
+
+
+@pytest.fixture
+def themes_client(monkeypatch):
+    response = MagicMock()
+    response.text = "New themes."
+    mock_client = MagicMock()
+    mock_client.aio.models.generate_content = AsyncMock(return_value=response)
+    monkeypatch.setattr(llm_service, "client", mock_client)
+    return mock_client.aio.models.generate_content
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    state = lts.new_state("Old themes.")
+    for day in range(1, 4):
+        lts.fold_episode(state, _episode(day, [f"topic {day}"]))
+    db = FakeSupabase()
+    db.tables["memories"] = [
+        {"user_id": "user-1", "version": 0, "long_term_state": state}
+    ]
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+    return db
+
+
+@pytest.mark.anyio
+async def test_incremental_update_sends_only_what_changed(themes_client, stored):
+    await llm_service._update_long_term_summary(
+        "user-1", _episode(4, ["rockets"], summary="Built a rocket")
+    )
+
+    prompt = themes_client.call_args.kwargs["contents"][0].parts[0].text
+    assert "Old themes." in prompt
+    assert "Built a rocket" in prompt
+    assert "Interests shown: rockets" in prompt
+    # Unchanged entries stay out of the prompt
+    assert "topic 1" not in prompt
+
+    row = stored.memories_row("user-1")
+    state, summary = row["long_term_state"], row["long_term_summary"]
+    assert state["themes"] == "New themes."
+    assert state["interests"]["rockets"]["count"] == 1
+    assert summary.startswith("Themes: New themes.")
+
+
+@pytest.mark.anyio
+async def test_full_rewrite_runs_on_schedule(themes_client, stored, monkeypatch):
+    monkeypatch.setattr(lts, "FULL_REWRITE_EVERY", 4)
+
+    await llm_service._update_long_term_summary("user-1", _episode(4, ["rockets"]))
+
+    prompt = themes_client.call_args.kwargs["contents"][0].parts[0].text
+    assert "Rewrite the themes from scratch" in prompt
+    assert "topic 1" in prompt and "rockets" in prompt
+    assert stored.memories_row("user-1")["long_term_state"]["last_rewrite"] == 4
+
+
+@pytest.mark.anyio
+async def test_retried_fold_does_not_call_the_llm(themes_client, stored):
+    episode = _episode(4, ["rockets"])
+    await llm_service._update_long_term_summary("user-1", episode)
+    themes_client.reset_mock()
+    version = stored.memories_row("user-1")["version"]
+
+    await llm_service._update_long_term_summary("user-1", episode)
+
+    themes_client.assert_not_awaited()
+    assert stored.memories_row("user-1")["version"] == version
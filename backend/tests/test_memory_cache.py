@@ -0,0 +1,279 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from redis.exceptions import AuthenticationError
+
+from services import memory_service
+from services.memory_cache import (
+    LocalCacheBackend,
+    MemoryCache,
+    RedisCacheBackend,
+)
+
+
+class RespStandIn:
+    """A local server speaking enough of the Redis protocol for the cache."""
+
+    def __init__(self, password: str | None = None) -> None:
+        self.password = password
+        self.data: dict[bytes, bytes] = {}
+        self.commands: list[str] = []
+        self.clients: set[asyncio.StreamWriter] = set()
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.port}/0"
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_connections(self) -> None:
+        for writer in self.clients:
+            writer.close()
+
+    async def _serve(self, reader, writer) -> None:
+        self.clients.add(writer)
+        authed = self.password is None
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n")
+                args = []
+                for _ in range(int(header[1:-2])):
+                    length = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                command = args[0].decode().upper()
+                self.commands.append(command)
+                if command == "HELLO":
+                    # HELLO 3 [AUTH username password]: switch to RESP3
+                    if len(args) > 2:
+                        authed = args[-1].decode() == self.password
+                    if authed:
+                        writer.write(b"%1\r\n$5\r\nproto\r\n:3\r\n")
+                    else:
+                        writer.write(b"-WRONGPASS invalid password\r\n")
+                elif command == "AUTH":
+                    authed = args[-1].decode() == self.password
+                    writer.write(b"+OK\r\n" if authed else b"-WRONGPASS\r\n")
+                elif not authed:
+                    writer.write(b"-NOAUTH Authentication required.\r\n")
+                elif command == "GET":
+                    value = self.data.get(args[1])
+                    if value is None:
+                        writer.write(b"$-1\r\n")
+                    else:
+                        writer.write(b"$%d\r\n%s\r\n" % (len(value), value))
+                elif command == "SET":
+                    self.data[args[1]] = args[2]
+                    writer.write(b"+OK\r\n")
+                elif command == "DEL":
+                    writer.write(
+                        b":%d\r\n" % int(self.data.pop(args[1], None) is not None)
+                    )
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+
+@pytest.fixture
+async def resp_server():
+    server = RespStandIn()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest.fixture
+def memories_table(monkeypatch):
+    """A fake supabase client whose memories row can be read and upserted."""
+    row = {"identity": {"ai": {"name": "Buddy"}}, "core_instructions": []}
+    client = MagicMock()
+    query = client.table.return_value.select.return_value.eq.return_value
+
+    def execute():
+        return MagicMock(data=[dict(row)])
+
+    query.execute.side_effect = execute
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: client)
+    return client, row
+
+
+@pytest.mark.anyio
+async def test_local_backend_is_a_bounded_lru_with_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("services.memory_cache.time.monotonic", lambda: clock[0])
+    backend = LocalCacheBackend(max_entries=2)
+
+    await backend.set("a", "1", ttl=60)
+    await backend.set("b", "2", ttl=60)
+    assert await backend.get("a") == "1"
+    # "b" is now the least recently used
+    await backend.set("c", "3", ttl=60)
+    assert len(backend) == 2
+    assert await backend.get("b") is None
+
+    clock[0] += 61
+    assert await backend.get("a") is None
+
+
+@pytest.mark.anyio
+async def test_chat_turns_skip_the_database_until_a_write(memories_table):
+    client, row = memories_table
+
+    first = await memory_service.load_memory_snapshot("u1")
+    await memory_service.load_memory_snapshot("u1")
+    assert await memory_service.get_identity_dict("u1") == first.identity
+    assert client.table.return_value.select.call_count == 1
+
+    row["core_instructions"] = ["Practice counting"]
+    await memory_service.add_core_instruction("u1", "Practice counting")
+
+    snapshot = await memory_service.load_memory_snapshot("u1")
+    assert snapshot.core_instructions == ["Practice counting"]
+    assert client.table.return_value.select.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_rewards_do_not_invalidate_the_row(memories_table):
+    client, _row = memories_table
+
+    await memory_service.load_memory_snapshot("u1")
+    await memory_service.add_reward("u1", "Star", "Counting")
+    await memory_service.load_memory_snapshot("u1")
+
+    assert client.table.return_value.select.call_count == 1
+
+
+@pytest.mark.anyio
+async def test_cached_rows_are_copies():
+    cache = MemoryCache(LocalCacheBackend(), ttl=60)
+
+    async def fetch():
+        return {"identity": {"ai": {"name": "Buddy"}}}
+
+    row = await cache.get_row("u1", fetch)
+    cached = await cache.get_row("u1", fetch)
+    cached["identity"]["ai"]["name"] = "Changed"
+
+    assert (await cache.get_row("u1", fetch))["identity"]["ai"]["name"] == "Buddy"
+    assert row is not cached
+
+
+@pytest.mark.anyio
+async def test_row_fetched_during_a_write_is_not_stored():
+    cache = MemoryCache(LocalCacheBackend(), ttl=60)
+    fetched = asyncio.Event()
+    release = asyncio.Event()
+    calls = []
+
+    async def slow_fetch():
+        calls.append(1)
+        fetched.set()
+        await release.wait()
+        return {"long_term_summary": "old"}
+
+    reader = asyncio.create_task(cache.get_row("u1", slow_fetch))
+    await fetched.wait()
+    await cache.invalidate("u1")
+    release.set()
+    assert (await reader)["long_term_summary"] == "old"
+
+    async def fresh_fetch():
+        return {"long_term_summary": "new"}
+
+    assert (await cache.get_row("u1", fresh_fetch))["long_term_summary"] == "new"
+
+
+@pytest.mark.anyio
+async def test_backend_errors_fall_back_to_the_database():
+    backend = MagicMock()
+    backend.get.side_effect = ConnectionError("down")
+    backend.set.side_effect = ConnectionError("down")
+    cache = MemoryCache(backend, ttl=60)
+
+    async def fetch():
+        return {"current_state": "ok"}
+
+    assert await cache.get_row("u1", fetch) == {"current_state": "ok"}
+
+
+@pytest.mark.anyio
+async def test_redis_backend_shares_rows_between_workers(resp_server):
+    worker_a = MemoryCache(RedisCacheBackend.from_url(resp_server.url), ttl=60)
+    worker_b = MemoryCache(RedisCacheBackend.from_url(resp_server.url), ttl=60)
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        return {"long_term_summary": f"version {len(fetches)}"}
+
+    assert (await worker_a.get_row("u1", fetch))["long_term_summary"] == "version 1"
+    assert (await worker_b.get_row("u1", fetch))["long_term_summary"] == "version 1"
+    assert len(fetches) == 1
+    assert b"memories:u1" in resp_server.data
+
+    # A write in one worker is seen by the other on its next read
+    await worker_a.invalidate("u1")
+    assert (await worker_b.get_row("u1", fetch))["long_term_summary"] == "version 2"
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+@pytest.mark.anyio
+async def test_redis_backend_authenticates_and_reconnects():
+    server = RespStandIn(password="secret")
+    await server.start()
+    try:
+        backend = RedisCacheBackend.from_url(server.url)
+        await backend.set("u1", '{"a": 1}', ttl=5)
+        assert await backend.get("u1") == '{"a": 1}'
+        assert server.commands[0] == "HELLO"
+
+        # A dropped connection is reopened on the next command
+        server.drop_connections()
+        assert await backend.get("u1") == '{"a": 1}'
+        await backend.close()
+
+        wrong = RedisCacheBackend.from_url(server.url.replace("secret", "nope"))
+        with pytest.raises(AuthenticationError):
+            await wrong.get("u1")
+        await wrong.close()
+    finally:
+        await server.stop()
+
+
+@pytest.mark.anyio
+async def test_redis_operation_is_bounded_by_the_timeout():
+    async def silent(reader, writer):
+        await reader.read()
+
+    server = await asyncio.start_server(silent, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    backend = RedisCacheBackend.from_url(f"redis://127.0.0.1:{port}/0", timeout=0.1)
+    cache = MemoryCache(backend, ttl=60)
+
+    async def fetch():
+        return {"current_state": "ok"}
+
+    try:
+        with pytest.raises(TimeoutError):
+            await backend.get("u1")
+        # The cache treats it as a miss
+        assert await cache.get_row("u1", fetch) == {"current_state": "ok"}
+    finally:
+        await backend.close()
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,115 @@
+import asyncio
+from collections.abc import Awaitable
+from typing import Any
+
+import pytest
+
+from benchmarks.fakes import FakeSupabase
+from services import memory_service
+
+USERS = 10
+MUTATIONS_PER_USER = 40
+# Simulated database round-trip, so concurrent writers interleave
+LATENCY = 0.001
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeSupabase(latency=LATENCY)
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+    return db
+
+
+def _count(key: str):
+    def mutate(row: dict) -> dict:
+        state = dict(row.get("long_term_state") or {})
+        state[key] = state.get(key, 0) + 1
+        return {"long_term_state": state}
+
+    return mutate
+
+
+async def _mutations(user_id: str) -> list[Awaitable[Any]]:
+    """A mix of every kind of write the memory service makes to one row."""
+    calls: list[Awaitable[Any]] = []
+    for i in range(MUTATIONS_PER_USER):
+        kind = i % 4
+        if kind == 0:
+            calls.append(
+                memory_service.update_identity_dict(user_id, {"user": {f"k{i}": i}})
+            )
+        elif kind == 1:
+            calls.append(memory_service.add_core_instruction(user_id, f"rule {i}"))
+        elif kind == 2:
+            calls.append(memory_service.update_memory_row(user_id, _count("folds")))
+        else:
+            calls.append(memory_service.write_current_state(user_id, f"state {i}"))
+    return calls
+
+
+@pytest.mark.anyio
+async def test_concurrent_mutations_are_never_lost(db):
+    users = [f"user-{n}" for n in range(USERS)]
+    calls = [call for user_id in users for call in await _mutations(user_id)]
+
+    await asyncio.gather(*calls)
+
+    quarter = MUTATIONS_PER_USER // 4
+    for user_id in users:
+        row = db.memories_row(user_id)
+        assert len(row["identity"]["user"]) == quarter
+        assert len(row["core_instructions"]) == quarter
+        assert row["long_term_state"]["folds"] == quarter
+        # Every write bumped the version exactly once
+        assert row["version"] == MUTATIONS_PER_USER - 1
+
+    # Conflicts are retried, but each attempt is at most a read and a write
+    attempts = memory_service.DEFAULT_WRITE_ATTEMPTS
+    assert db.round_trips <= len(calls) * 2 * attempts
+
+
+@pytest.mark.anyio
+async def test_conflicting_write_is_retried_on_the_fresh_row(db, monkeypatch):
+    await memory_service.update_identity_dict("user-1", {"ai": {"name": "Buddy"}})
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(memory_service.anyio, "sleep", fake_sleep)
+    seen = []
+
+    def mutate(row: dict) -> dict:
+        seen.append(row["identity"])
+        if len(seen) == 1:
+            # A concurrent writer lands between this read and the write
+            db.memories_row("user-1")["identity"] = {"user": {"name": "Mia"}}
+            db.touch(db.memories_row("user-1"))
+        return {"identity": {**row["identity"], "ai": {"name": "Rex"}}}
+
+    await memory_service.update_memory_row("user-1", mutate)
+
+    assert seen[1] == {"user": {"name": "Mia"}}
+    assert db.memories_row("user-1")["identity"] == {
+        "user": {"name": "Mia"},
+        "ai": {"name": "Rex"},
+    }
+    assert len(sleeps) == 1 and 0 <= sleeps[0] <= memory_service.WRITE_BACKOFF_BASE
+
+
+@pytest.mark.anyio
+async def test_gives_up_after_bounded_attempts(db, monkeypatch):
+    await memory_service.write_current_state("user-1", "awake")
+
+    async def fake_sleep(delay):
+        pass
+
+    monkeypatch.setattr(memory_service.anyio, "sleep", fake_sleep)
+
+    def always_conflicts(row: dict) -> dict:
+        db.touch(db.memories_row("user-1"))
+        return {"current_state": "asleep"}
+
+    with pytest.raises(memory_service.MemoryConflictError):
+        await memory_service.update_memory_row("user-1", always_conflicts, attempts=3)
+    assert db.memories_row("user-1")["current_state"] == "awake"
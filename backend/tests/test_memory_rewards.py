@@ -17,6 +17,10 @@ def mock_supabase_client(monkeypatch):
     mock_table.select.return_value = mock_select
     mock_select.eq.return_value = mock_eq
     mock_eq.execute.return_value = mock_execute
+    # Range queries on the child tables chain further filters onto .eq()
+    mock_eq.lt.return_value = mock_eq
+    mock_eq.order.return_value = mock_eq
+    mock_eq.limit.return_value = mock_eq
     mock_table.upsert.return_value = mock_upsert
 
     # Set up default empty response
@@ -39,13 +43,19 @@ async def test_add_and_get_reward(mock_supabase_client):
 
     await memory_service.add_reward("test_user_id", sticker, reason)
 
-    # Now simulate getting the rewards we just upserted
-    # Upsert receives {"user_id": ..., "rewards": [the new reward]}
+    # Now simulate getting the reward we just appended
+    # The append RPC receives {"p_user_id": ..., "p_item": the new reward}
     # We can inspect the mock call
-    args, kwargs = mock_client.table().upsert.call_args
-    upserted_data = args[0]
+    params = mock_client.rpc.call_args.args[1]
 
-    mock_execute.data = [{"rewards": upserted_data["rewards"]}]
+    item = params["p_item"]
+    mock_execute.data = [
+        {
+            "sticker": item["sticker"],
+            "reason": item["reason"],
+            "created_at": item["timestamp"],
+        }
+    ]
 
     rewards = await memory_service.get_rewards("test_user_id")
     assert len(rewards) == 1
@@ -67,9 +77,15 @@ async def test_rewards_persistence(mock_supabase_client):
 
     await memory_service.add_reward("test_user_id", "Star", "Good behavior")
 
-    args, kwargs = mock_client.table().upsert.call_args
-    upserted_data = args[0]
-    mock_execute.data = [{"rewards": upserted_data["rewards"]}]
+    params = mock_client.rpc.call_args.args[1]
+    item = params["p_item"]
+    mock_execute.data = [
+        {
+            "sticker": item["sticker"],
+            "reason": item["reason"],
+            "created_at": item["timestamp"],
+        }
+    ]
 
     # Simulate fresh start by reading directly from DB
     content = await memory_service.get_rewards("test_user_id")
@@ -1,9 +1,16 @@
-import pytest
 from unittest.mock import MagicMock
+
+import pytest
+from postgrest import CountMethod
+
+from benchmarks.fakes import FakeSupabase
 from services.memory_service import (
-    get_rewards,
+    CACHED_FIELDS,
+    HistoryCursor,
     add_reward,
     get_identity_dict,
+    get_parent_reports,
+    get_rewards,
     update_identity_dict,
 )
 
@@ -21,6 +28,10 @@ def mock_supabase_client(monkeypatch):
     mock_table.select.return_value = mock_select
     mock_select.eq.return_value = mock_eq
     mock_eq.execute.return_value = mock_execute
+    # Range queries on the child tables chain further filters onto .eq()
+    mock_eq.lt.return_value = mock_eq
+    mock_eq.order.return_value = mock_eq
+    mock_eq.limit.return_value = mock_eq
     mock_table.upsert.return_value = mock_upsert
 
     # Set up default empty response
@@ -34,7 +45,7 @@ def mock_supabase_client(monkeypatch):
 
 @pytest.mark.anyio
 async def test_get_rewards_empty_when_no_data(mock_supabase_client):
-    mock_client, mock_execute, mock_upsert = mock_supabase_client
+    _mock_client, mock_execute, _mock_upsert = mock_supabase_client
     # Make select return empty data
     mock_execute.data = []
 
@@ -44,56 +55,146 @@ async def test_get_rewards_empty_when_no_data(mock_supabase_client):
 
 @pytest.mark.anyio
 async def test_get_rewards_returns_list_when_data_exists(mock_supabase_client):
-    mock_client, mock_execute, mock_upsert = mock_supabase_client
+    _mock_client, mock_execute, _mock_upsert = mock_supabase_client
     # Make select return some data
-    mock_execute.data = [{"rewards": [{"id": 1, "name": "Star"}]}]
+    mock_execute.data = [
+        {
+            "id": 2,
+            "sticker": "Moon",
+            "reason": "",
+            "created_at": "2026-01-02T00:00:00+00:00",
+        },
+        {
+            "id": 1,
+            "sticker": "Star",
+            "reason": "Kind",
+            "created_at": "2026-01-01T00:00:00+00:00",
+        },
+    ]
 
     rewards = await get_rewards("test_user_id")
-    assert len(rewards) == 1
-    assert rewards[0]["name"] == "Star"
+    # Rows come back newest first and are returned oldest first
+    assert [r["sticker"] for r in rewards] == ["Star", "Moon"]
+    assert rewards[0] == {
+        "id": 1,
+        "sticker": "Star",
+        "reason": "Kind",
+        "timestamp": "2026-01-01T00:00:00+00:00",
+        "created_at": "2026-01-01T00:00:00+00:00",
+    }
 
 
 @pytest.mark.anyio
-async def test_add_reward_updates_data(mock_supabase_client):
-    mock_client, mock_execute, mock_upsert = mock_supabase_client
+async def test_get_rewards_is_a_bounded_range_query(mock_supabase_client):
+    mock_client, _mock_execute, _mock_upsert = mock_supabase_client
+    mock_eq = mock_client.table.return_value.select.return_value.eq.return_value
 
-    # Initial state: empty rewards
-    mock_execute.data = []
+    await get_rewards(
+        "test_user_id", limit=20, before=HistoryCursor("2026-01-02T00:00:00+00:00", 5)
+    )
+
+    mock_client.table.assert_called_with("rewards")
+    mock_client.table.return_value.select.return_value.eq.assert_called_with(
+        "user_id", "test_user_id"
+    )
+    mock_eq.or_.assert_called_once_with(
+        'created_at.lt."2026-01-02T00:00:00+00:00",'
+        'and(created_at.eq."2026-01-02T00:00:00+00:00",id.lt.5)'
+    )
+    mock_or = mock_eq.or_.return_value
+    mock_or.order.assert_any_call("created_at", desc=True)
+    mock_or.order.return_value.order.assert_any_call("id", desc=True)
+
+
+@pytest.mark.anyio
+async def test_reward_pages_split_rows_created_in_the_same_instant(monkeypatch):
+    db = FakeSupabase()
+    instant = "2026-01-01T00:00:00+00:00"
+    db.tables["rewards"] = [
+        {"id": i, "user_id": "u1", "sticker": f"S{i}", "created_at": instant}
+        for i in range(1, 6)
+    ]
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+
+    seen, before = [], None
+    while page := await get_rewards("u1", limit=2, before=before):
+        seen = [r["sticker"] for r in page] + seen
+        before = HistoryCursor(page[0]["created_at"], page[0]["id"])
+
+    assert seen == ["S1", "S2", "S3", "S4", "S5"]
+
+
+@pytest.mark.anyio
+async def test_get_parent_reports_reads_child_table(mock_supabase_client):
+    mock_client, mock_execute, _mock_upsert = mock_supabase_client
+    mock_execute.data = [
+        {
+            "id": 1,
+            "report": {"themes": ["Space"]},
+            "created_at": "2026-01-01T00:00:00+00:00",
+        }
+    ]
+
+    reports = await get_parent_reports("test_user_id")
+
+    mock_client.table.assert_called_with("parent_reports")
+    assert reports == [
+        {
+            "themes": ["Space"],
+            "timestamp": "2026-01-01T00:00:00+00:00",
+            "id": 1,
+            "created_at": "2026-01-01T00:00:00+00:00",
+        }
+    ]
+
+
+@pytest.mark.anyio
+async def test_add_reward_appends_atomically(mock_supabase_client):
+    mock_client, _mock_execute, _mock_upsert = mock_supabase_client
 
     await add_reward("test_user_id", "Star", "Reason 1")
 
-    # Assert upsert was called with the right data structure
-    # Wait, the add_reward first gets rewards, then upserts the new list.
-    mock_table = mock_client.table.return_value
-    mock_table.upsert.assert_called_once()
+    # One RPC round-trip, no read and no full-array upsert
+    mock_client.rpc.assert_called_once()
+    mock_client.table.return_value.select.assert_not_called()
+    mock_client.table.return_value.upsert.assert_not_called()
 
-    args, kwargs = mock_table.upsert.call_args
-    assert args[0]["user_id"] == "test_user_id"
-    assert "rewards" in args[0]
-    assert len(args[0]["rewards"]) == 1
-    assert args[0]["rewards"][0]["sticker"] == "Star"
-    assert args[0]["rewards"][0]["reason"] == "Reason 1"
+    name, params = mock_client.rpc.call_args.args
+    assert name == "append_memory_item"
+    assert params["p_user_id"] == "test_user_id"
+    assert params["p_field"] == "rewards"
+    assert params["p_item"]["sticker"] == "Star"
+    assert params["p_item"]["reason"] == "Reason 1"
 
 
 @pytest.mark.anyio
-async def test_identity_dict(monkeypatch):
-    mock_db = {}
+async def test_add_core_instruction_appends_atomically(mock_supabase_client):
+    from services.memory_service import add_core_instruction
 
-    async def mock_read(user_id, field, default):
-        return mock_db.get(field, default)
+    mock_client, _mock_execute, _mock_upsert = mock_supabase_client
 
-    async def mock_write(user_id, field, value):
-        mock_db[field] = value
+    await add_core_instruction("test_user_id", "Practice counting")
 
-    monkeypatch.setattr("services.memory_service.read_db_field", mock_read)
-    monkeypatch.setattr("services.memory_service.write_db_field", mock_write)
+    name, params = mock_client.rpc.call_args.args
+    assert name == "append_memory_item"
+    assert params["p_field"] == "core_instructions"
+    assert params["p_item"] == "Practice counting"
+    mock_client.rpc.return_value.execute.assert_called_once()
 
-    new_identity = {"ai": {"name": "Buddy"}, "user": {"grade_level": "3rd Grade"}}
-    await update_identity_dict("test_user", new_identity)
+
+@pytest.mark.anyio
+async def test_identity_dict(monkeypatch):
+    db = FakeSupabase()
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+
+    await update_identity_dict("test_user", {"ai": {"name": "Buddy"}})
+    await update_identity_dict("test_user", {"user": {"grade_level": "3rd Grade"}})
+    await update_identity_dict("test_user", {"ai": {"persona": "an astronaut"}})
 
     identity = await get_identity_dict("test_user")
-    assert identity["ai"]["name"] == "Buddy"
+    assert identity["ai"] == {"name": "Buddy", "persona": "an astronaut"}
     assert identity["user"]["grade_level"] == "3rd Grade"
+    assert db.memories_row("test_user")["version"] == 2
 
 
 @pytest.fixture
@@ -114,3 +215,140 @@ async def test_get_all_memories(mock_supabase):
 
     assert result == {"user_id": "test_user_id", "identity": {"test": "data"}}
     mock_supabase.table().select.assert_called_with("*")
+
+
+@pytest.mark.anyio
+async def test_load_memory_snapshot_single_query(mock_supabase):
+    from services.memory_service import load_memory_snapshot
+
+    mock_supabase.table().select().eq().execute.return_value.data = [
+        {
+            "identity": '{"ai": {"name": "Buddy"}}',
+            "core_instructions": ["Practice counting"],
+            "episodic_memory": [{"summary": "Dinosaurs"}],
+            "long_term_summary": "Loves space.",
+            "current_state": "Sleepy",
+        }
+    ]
+    mock_supabase.table().select.reset_mock()
+
+    snapshot = await load_memory_snapshot(
+        "test_user_id",
+        ("identity", "core_instructions", "episodic_memory", "long_term_summary"),
+    )
+
+    # One query for the whole cached row; unrequested fields stay empty
+    mock_supabase.table().select.assert_called_once_with(",".join(CACHED_FIELDS))
+    assert snapshot.identity == {"ai": {"name": "Buddy"}}
+    assert snapshot.core_instructions == ["Practice counting"]
+    assert snapshot.episodic_memory == [{"summary": "Dinosaurs"}]
+    assert snapshot.long_term_summary == "Loves space."
+    assert snapshot.current_state == ""
+
+
+@pytest.mark.anyio
+async def test_load_memory_snapshot_defaults_when_no_row(mock_supabase):
+    from services.memory_service import load_memory_snapshot
+
+    snapshot = await load_memory_snapshot("test_user_id")
+
+    assert snapshot.identity == {}
+    assert snapshot.episodic_memory == []
+    assert snapshot.long_term_summary == ""
+
+
+@pytest.mark.anyio
+async def test_rewards_summary_counts_in_database(mock_supabase_client):
+    from services.memory_service import get_rewards_summary
+
+    mock_client, mock_execute, _mock_upsert = mock_supabase_client
+    mock_client.rpc.return_value.execute.return_value.data = [
+        {"sticker": "Star", "count": 2},
+        {"sticker": "Moon", "count": 1},
+    ]
+    mock_execute.data = [
+        {"id": 3, "sticker": "Star", "reason": "", "created_at": "2026-01-03T00:00:00"}
+    ]
+
+    summary = await get_rewards_summary("test_user_id", latest=1)
+
+    mock_client.rpc.assert_called_once_with(
+        "reward_counts", {"p_user_id": "test_user_id"}
+    )
+    assert summary["total"] == 3
+    assert summary["counts"] == {"Star": 2, "Moon": 1}
+    assert [r["sticker"] for r in summary["latest"]] == ["Star"]
+
+
+@pytest.mark.anyio
+async def test_parent_reports_summary_counts_without_fetching(mock_supabase_client):
+    from services.memory_service import get_parent_reports_summary
+
+    mock_client, mock_execute, _mock_upsert = mock_supabase_client
+    mock_execute.count = 12
+    mock_execute.data = []
+
+    summary = await get_parent_reports_summary("test_user_id", latest=2)
+
+    mock_client.table.return_value.select.assert_any_call(
+        "id", count=CountMethod.exact, head=True
+    )
+    assert summary == {"total": 12, "latest": []}
+
+
+def test_backfill_child_rows_keeps_legacy_positions():
+    from scripts.backfill_child_tables import child_rows
+
+    rows = child_rows(
+        {
+            "user_id": "u1",
+            "created_at": "2025-01-01T00:00:00+00:00",
+            "episodic_memory": [
+                {"summary": "Dinosaurs", "timestamp": "2025-02-01T00:00:00"}
+            ],
+            "rewards": [
+                {
+                    "sticker": "Star",
+                    "reason": "Kind",
+                    "timestamp": "2025-03-01T00:00:00",
+                },
+                {"reason": "no sticker"},
+                {"sticker": "Moon", "timestamp": "not a date"},
+            ],
+            "parent_reports": None,
+        }
+    )
+
+    # Episodes are matched on content, since the array window shifts
+    assert rows["episodes"] == [
+        {
+            "user_id": "u1",
+            "created_at": "2025-02-01T00:00:00",
+            "episode": {"summary": "Dinosaurs", "timestamp": "2025-02-01T00:00:00"},
+        }
+    ]
+    assert [
+        (r["sticker"], r["legacy_position"], r["created_at"]) for r in rows["rewards"]
+    ] == [
+        ("Star", 0, "2025-03-01T00:00:00"),
+        ("Moon", 2, "2025-01-01T00:00:00+00:00"),
+    ]
+    assert "parent_reports" not in rows
+
+
+def test_backfill_copies_only_episodes_not_in_the_table():
+    from collections import Counter
+
+    from scripts.backfill_child_tables import _episode_key, uncopied_episodes
+
+    def row(summary: str) -> dict:
+        return {"user_id": "u1", "episode": {"summary": summary}}
+
+    # The window was trimmed and appended to since the last run, and one
+    # episode was appended twice
+    rows = [row("Space"), row("Dinos"), row("Dinos"), row("Trains")]
+    copied = Counter(
+        _episode_key(e) for e in ({"summary": "Dinos"}, {"summary": "Space"})
+    )
+
+    assert uncopied_episodes(rows, copied) == [row("Dinos"), row("Trains")]
@@ -0,0 +1,110 @@
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from benchmarks.fakes import FakeSupabase
+from main import app
+from services import llm_service
+from services.auth_service import get_current_user
+from services.memory_service import MemorySnapshot
+from services.metrics import record_gemini_usage
+
+app.dependency_overrides[get_current_user] = lambda: "test_user_id"
+
+client = TestClient(app)
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_request_latency_and_round_trips_per_route(monkeypatch):
+    db = FakeSupabase()
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+    labels = {"method": "GET", "route": "/child/rewards"}
+    requests_before = _sample(
+        "linxy_http_request_duration_seconds_count", status="200", **labels
+    )
+    trips_before = _sample("linxy_http_request_db_round_trips_sum", **labels)
+
+    assert client.get("/child/rewards").status_code == 200
+
+    assert (
+        _sample("linxy_http_request_duration_seconds_count", status="200", **labels)
+        == requests_before + 1
+    )
+    assert (
+        _sample("linxy_http_request_db_round_trips_sum", **labels)
+        == trips_before + db.round_trips
+        == trips_before + 1
+    )
+
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    client.get("/")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'linxy_http_request_duration_seconds_bucket{le="0.005",method="GET"' in (
+        response.text
+    )
+    assert 'route="/"' in response.text
+
+
+def test_gemini_usage_counts_each_reported_kind():
+    response = MagicMock()
+    response.usage_metadata.prompt_token_count = 120
+    response.usage_metadata.candidates_token_count = 30
+    response.usage_metadata.cached_content_token_count = None
+    response.usage_metadata.thoughts_token_count = 0
+    before = {
+        kind: _sample("linxy_gemini_tokens_total", operation="test", kind=kind)
+        for kind in ("prompt", "candidates", "cached")
+    }
+
+    record_gemini_usage("test", response)
+    record_gemini_usage("test", None)
+
+    after = {
+        kind: _sample("linxy_gemini_tokens_total", operation="test", kind=kind)
+        for kind in before
+    }
+    assert after["prompt"] - before["prompt"] == 120
+    assert after["candidates"] - before["candidates"] == 30
+    assert after["cached"] == before["cached"]
+
+
+@pytest.mark.anyio
+async def test_chat_turn_records_every_stage(monkeypatch):
+    sticker = MagicMock()
+    sticker.text = None
+    sticker.function_call.name = "award_sticker"
+    sticker.function_call.args = {"sticker": "Star", "reason": "Counted"}
+    response = MagicMock()
+    response.candidates[0].content.parts = [sticker]
+    response.usage_metadata.prompt_token_count = 50
+    mock_client = MagicMock()
+    mock_client.aio.models.generate_content = AsyncMock(return_value=response)
+    monkeypatch.setattr(llm_service, "client", mock_client)
+    monkeypatch.setattr(
+        llm_service, "load_memory_snapshot", AsyncMock(return_value=MemorySnapshot())
+    )
+    monkeypatch.setattr(llm_service, "add_reward", AsyncMock())
+    stages = ("memory_load", "prompt_build", "gemini", "reward_persist")
+    before = {
+        stage: _sample("linxy_chat_stage_duration_seconds_count", stage=stage)
+        for stage in stages
+    }
+
+    await llm_service.generate_chat_response("user-1", "I counted to ten!")
+
+    for stage in stages:
+        count = _sample("linxy_chat_stage_duration_seconds_count", stage=stage)
+        assert count == before[stage] + 1, stage
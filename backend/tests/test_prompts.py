@@ -0,0 +1,76 @@
+import pytest
+
+from services import prompts
+from services.memory_service import MemorySnapshot
+
+
+@pytest.fixture(autouse=True)
+def empty_prompt_cache():
+    prompts.prompt_cache.clear()
+    yield
+    prompts.prompt_cache.clear()
+
+
+def _snapshot(name: str, updated_at: str | None) -> MemorySnapshot:
+    return MemorySnapshot(
+        identity={"user": {"name": name, "grade_level": "1st Grade"}},
+        core_instructions=["Practice counting"],
+        episodic_memory=[{"summary": "Dinosaurs", "interests": ["T-Rex"]}],
+        long_term_summary="Loves space.",
+        updated_at=updated_at,
+    )
+
+
+def test_child_prompt_renders_per_user_slots():
+    prompt = prompts.render_child_chat_prompt(_snapshot("Tommy", None))
+
+    assert "Child's Name: Tommy" in prompt
+    assert "age-appropriate for 1st Grade" in prompt
+    assert "Practice counting" in prompt
+    assert "Interests: T-Rex" in prompt
+    assert "=== LONG-TERM SUMMARY ===\nLoves space." in prompt
+    assert prompts.CHILD_SAFETY_PROTOCOL in prompt
+
+
+def test_child_prompt_is_static_prefix_plus_session_context():
+    snapshot = _snapshot("Tommy", None)
+    prompt = prompts.render_child_chat_prompt(snapshot)
+    context = prompts.render_child_session_context(snapshot)
+
+    assert prompt == prompts.CHILD_STATIC_PREFIX + context
+    assert "Tommy" not in prompts.CHILD_STATIC_PREFIX
+    assert prompts.CHILD_SAFETY_PROTOCOL not in context
+
+
+def test_prompt_is_memoized_until_row_version_changes(monkeypatch):
+    renders = []
+    render = prompts.render_child_chat_prompt
+
+    def counting_render(snapshot):
+        renders.append(snapshot.updated_at)
+        return render(snapshot)
+
+    monkeypatch.setattr(prompts, "render_child_chat_prompt", counting_render)
+
+    first = prompts.child_chat_prompt("user-1", _snapshot("Tommy", "v1"))
+    # Same version: served from the memo even if the snapshot object differs
+    assert prompts.child_chat_prompt("user-1", _snapshot("Tommy", "v1")) is first
+    # New version: re-rendered
+    updated = prompts.child_chat_prompt("user-1", _snapshot("Tom", "v2"))
+
+    assert "Child's Name: Tom\n" in updated
+    assert renders == ["v1", "v2"]
+
+
+def test_prompt_without_version_is_not_memoized():
+    prompts.child_chat_prompt("user-1", _snapshot("Tommy", None))
+    assert prompts.prompt_cache.get("child", "user-1", None) is None
+
+
+def test_memo_is_per_user_and_kind():
+    child = prompts.child_chat_prompt("user-1", _snapshot("Tommy", "v1"))
+    parent = prompts.parent_chat_prompt("user-1", _snapshot("Tommy", "v1"))
+    other = prompts.child_chat_prompt("user-2", _snapshot("Anna", "v1"))
+
+    assert child != parent
+    assert "Anna" in other and "Anna" not in child
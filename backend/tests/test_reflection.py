@@ -0,0 +1,226 @@
+import asyncio
+import json
+import os
+from unittest.mock import DEFAULT, AsyncMock, MagicMock
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from benchmarks.fakes import FakeSupabase
+from services import llm_service, memory_service
+from services.job_queue import Job
+
+STAGE_DELAY = 0.2
+HISTORY = [
+    {"role": "user", "content": "I saw a T-Rex!"},
+    {"role": "model", "content": "Wow, how big was it?"},
+]
+
+
+def _response_for(config) -> MagicMock:
+    response = MagicMock()
+    if config.response_schema is llm_service.ReflectionOutput:
+        response.text = json.dumps(
+            {"summary": "Dinosaurs", "interests": ["dinosaurs"], "milestones": []}
+        )
+    elif config.response_schema is llm_service.ParentReportOutput:
+        response.text = json.dumps(
+            {
+                "themes": ["Nature"],
+                "emotional_trend": "Excited",
+                "growth_areas": [],
+                "parent_action_suggestions": [],
+            }
+        )
+    else:
+        response.text = "Loves dinosaurs."
+    return response
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    db = FakeSupabase()
+    db.tables["memories"] = [
+        {
+            "user_id": "user-1",
+            "version": 0,
+            "episodic_memory": [{"summary": f"Episode {i}"} for i in range(6)],
+            "long_term_summary": "Old summary",
+            "long_term_state": {},
+        }
+    ]
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+    mocks = {
+        "read_memory_row": AsyncMock(wraps=memory_service.read_memory_row),
+        "update_memory_row": AsyncMock(wraps=memory_service.update_memory_row),
+        "add_parent_report": AsyncMock(),
+    }
+    for name, mock in mocks.items():
+        monkeypatch.setattr(llm_service, name, mock)
+    return {"db": db, **mocks}
+
+
+@pytest.fixture
+def slow_client(monkeypatch):
+    async def generate_content(model, contents, config):
+        await asyncio.sleep(STAGE_DELAY)
+        return _response_for(config)
+
+    mock_client = MagicMock()
+    mock_client.aio.models.generate_content = generate_content
+    monkeypatch.setattr(llm_service, "client", mock_client)
+    return mock_client
+
+
+def _job() -> Job:
+    return Job(
+        id="job-1",
+        kind=llm_service.REFLECTION_JOB,
+        user_id="user-1",
+        payload={"history": HISTORY},
+    )
+
+
+def _reporter(job: Job):
+    async def report(key, value):
+        job.progress[key] = value
+
+    return report
+
+
+@pytest.fixture
+def add_episodic_memory(monkeypatch):
+    mock = AsyncMock()
+    monkeypatch.setattr(llm_service, "add_episodic_memory", mock)
+    return mock
+
+
+@pytest.mark.anyio
+async def test_reflection_stages_run_concurrently(
+    slow_client, memory, add_episodic_memory
+):
+    job = _job()
+
+    result = await llm_service.run_reflection_job(job, _reporter(job))
+
+    assert result["reflection"]["summary"] == "Dinosaurs"
+    assert result["parent_report"] is True
+    timings = result["timings_ms"]
+    assert set(timings) == {*llm_service.REFLECTION_STAGES, "total"}
+    for stage in llm_service.REFLECTION_STAGES:
+        assert timings[stage] >= STAGE_DELAY * 1000 * 0.9
+    # The parent report overlaps the reflection and the summary fold that
+    # depends on it, so the total is two stages rather than all three
+    assert timings["total"] < STAGE_DELAY * 1000 * 2.5
+
+    memory["add_parent_report"].assert_awaited_once()
+    row = memory["db"].memories_row("user-1")
+    state = row["long_term_state"]
+    assert state["themes"] == "Loves dinosaurs."
+    assert state["interests"]["dinosaurs"]["count"] == 1
+    # The six stored episodes plus the new one
+    assert state["episodes"] == 7
+    assert row["long_term_summary"].startswith("Themes: Loves dinosaurs.")
+    # Trimmed in the same conditional write
+    assert row["episodic_memory"] == [{"summary": f"Episode {i}"} for i in range(3, 6)]
+    assert row["version"] == 1
+    add_episodic_memory.assert_awaited_once_with("user-1", result["reflection"])
+
+
+@pytest.mark.anyio
+async def test_parent_report_failure_still_stores_the_episode(
+    slow_client, memory, add_episodic_memory, caplog
+):
+    memory["add_parent_report"].side_effect = RuntimeError("db down")
+    job = _job()
+
+    result = await llm_service.run_reflection_job(job, _reporter(job))
+
+    assert result["reflection"]["summary"] == "Dinosaurs"
+    assert result["parent_report"] is False
+    assert job.progress["parent_report"] == {"error": "db down"}
+    assert "Parent report failed" in caplog.text
+    # The summary already counts the episode, so it is stored regardless
+    memory["update_memory_row"].assert_awaited_once()
+    add_episodic_memory.assert_awaited_once_with("user-1", result["reflection"])
+
+    # A later run does not retry the report or store the episode again
+    await llm_service.run_reflection_job(job, _reporter(job))
+    memory["add_parent_report"].assert_awaited_once()
+    add_episodic_memory.assert_awaited_once()
+
+
+@pytest.mark.anyio
+async def test_summary_failure_raises_after_other_stages_finish(
+    slow_client, memory, add_episodic_memory
+):
+    memory["read_memory_row"].side_effect = RuntimeError("db down")
+    job = _job()
+
+    with pytest.raises(RuntimeError, match="long_term_summary: db down"):
+        await llm_service.run_reflection_job(job, _reporter(job))
+
+    # The parent report still completed rather than being cancelled
+    memory["add_parent_report"].assert_awaited_once()
+    assert job.progress["parent_report"] is True
+
+
+@pytest.mark.anyio
+async def test_empty_history_skips_every_stage(slow_client, memory):
+    job = _job()
+    job.payload["history"] = []
+
+    result = await llm_service.run_reflection_job(job, _reporter(job))
+
+    assert result == {"reflection": None}
+    memory["read_memory_row"].assert_not_awaited()
+    memory["add_parent_report"].assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_reflection_job_retry_skips_finished_stages(
+    slow_client, memory, add_episodic_memory
+):
+    memory["update_memory_row"].side_effect = [RuntimeError("db down"), DEFAULT]
+    job = _job()
+    report = _reporter(job)
+
+    with pytest.raises(RuntimeError, match="long_term_summary: db down"):
+        await llm_service.run_reflection_job(job, report)
+    assert set(job.progress) == {"private_reflection", "parent_report"}
+    add_episodic_memory.assert_not_awaited()
+
+    result = await llm_service.run_reflection_job(job, report)
+
+    assert result["reflection"]["summary"] == "Dinosaurs"
+    assert set(result["timings_ms"]) == {"long_term_summary", "total"}
+    memory["add_parent_report"].assert_awaited_once()
+    add_episodic_memory.assert_awaited_once_with(
+        "user-1", job.progress["private_reflection"]
+    )
+    assert job.progress["episode_saved"] is True
+
+
+@pytest.mark.anyio
+async def test_summary_fold_keeps_an_episode_appended_meanwhile(
+    slow_client, memory, monkeypatch
+):
+    # Another session's episode lands between the read and the write
+    read = memory_service.read_memory_row
+
+    async def read_then_append(user_id):
+        row = await read(user_id)
+        await memory_service.add_episodic_memory(user_id, {"summary": "Episode 6"})
+        return row
+
+    monkeypatch.setattr(llm_service, "read_memory_row", read_then_append)
+
+    await llm_service._update_long_term_summary(
+        "user-1", {"summary": "Dinosaurs", "interests": ["dinosaurs"]}
+    )
+
+    row = memory["db"].memories_row("user-1")
+    # The trim was redone on the fresh row instead of dropping Episode 6
+    assert row["episodic_memory"][-1] == {"summary": "Episode 6"}
+    assert row["long_term_state"]["interests"]["dinosaurs"]["count"] == 1
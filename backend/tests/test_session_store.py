@@ -0,0 +1,66 @@
+import pytest
+
+from services.session_store import InMemorySessionBackend, SessionStore
+
+
+@pytest.mark.anyio
+async def test_turns_accumulate_per_user_session():
+    store = SessionStore(InMemorySessionBackend())
+
+    await store.add_turn("user-1", "s1", "Hi", "Hello!")
+    await store.add_turn("user-1", "s1", "Count with me", "1, 2, 3!")
+
+    history = await store.get_history("user-1", "s1")
+    assert [m["content"] for m in history] == [
+        "Hi",
+        "Hello!",
+        "Count with me",
+        "1, 2, 3!",
+    ]
+    assert [m["role"] for m in history] == ["user", "model", "user", "model"]
+
+    # The same session id is not visible to another user
+    assert await store.get_history("user-2", "s1") == []
+
+
+@pytest.mark.anyio
+async def test_end_session_returns_and_removes_transcript():
+    store = SessionStore(InMemorySessionBackend())
+    await store.add_turn("user-1", "s1", "Hi", "Hello!")
+
+    assert len(await store.end_session("user-1", "s1")) == 2
+    assert await store.get_history("user-1", "s1") == []
+
+
+@pytest.mark.anyio
+async def test_idle_sessions_expire(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("services.session_store.time.monotonic", lambda: clock[0])
+    backend = InMemorySessionBackend(idle_ttl=60)
+    store = SessionStore(backend)
+
+    await store.add_turn("user-1", "active", "Hi", "Hello!")
+    await store.add_turn("user-1", "idle", "Hi", "Hello!")
+    clock[0] += 45
+    await store.get_history("user-1", "active")
+    clock[0] += 45
+
+    assert await store.get_history("user-1", "active") != []
+    assert await store.get_history("user-1", "idle") == []
+    assert len(backend) == 1
+
+
+@pytest.mark.anyio
+async def test_session_memory_is_capped_oldest_first():
+    store = SessionStore(InMemorySessionBackend(max_turns=4, max_chars=1000))
+    for i in range(3):
+        await store.add_turn("user-1", "s1", f"q{i}", f"a{i}")
+
+    history = await store.get_history("user-1", "s1")
+    assert [m["content"] for m in history] == ["q1", "a1", "q2", "a2"]
+
+    capped = SessionStore(InMemorySessionBackend(max_turns=100, max_chars=10))
+    await capped.add_turn("user-1", "s1", "aaaaa", "bbbbb")
+    await capped.add_turn("user-1", "s1", "ccc", "dd")
+    history = await capped.get_history("user-1", "s1")
+    assert [m["content"] for m in history] == ["bbbbb", "ccc", "dd"]
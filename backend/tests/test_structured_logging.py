@@ -0,0 +1,132 @@
+import io
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import structured_logging, tracing
+from services.auth_service import get_current_user
+from services.structured_logging import REQUEST_ID_HEADER, sampled
+
+app.dependency_overrides[get_current_user] = lambda: "test_user_id"
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def log_output(monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    monkeypatch.setenv("LOG_LEVELS", "tests.chatty=DEBUG")
+    monkeypatch.delenv("LOG_FORMAT", raising=False)
+    stream = io.StringIO()
+    structured_logging.configure_logging(stream)
+
+    def records() -> list[dict]:
+        # Stopping the listener writes out everything still queued
+        structured_logging.close_logging()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield records
+    structured_logging.close_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("tests.chatty").setLevel(logging.NOTSET)
+
+
+def test_records_are_json_with_extras_and_exceptions(log_output):
+    logger = logging.getLogger("tests.json")
+    logger.info("Job failed %s", "twice", extra={"job_id": "job-1"})
+    try:
+        raise RuntimeError("db down")
+    except RuntimeError:
+        logger.exception("Request failed")
+
+    first, second = log_output()
+    assert first["level"] == "INFO"
+    assert first["logger"] == "tests.json"
+    assert first["message"] == "Job failed twice"
+    assert first["job_id"] == "job-1"
+    assert second["message"] == "Request failed"
+    assert "RuntimeError: db down" in second["exception"]
+
+
+class _ThreadRecordingStream(io.StringIO):
+    def __init__(self) -> None:
+        super().__init__()
+        self.writers: list[threading.Thread] = []
+
+    def write(self, text: str) -> int:
+        self.writers.append(threading.current_thread())
+        return super().write(text)
+
+
+def test_writing_happens_off_the_calling_thread():
+    stream = _ThreadRecordingStream()
+    structured_logging.configure_logging(stream)
+    try:
+        logging.getLogger("tests.thread").warning("hello")
+    finally:
+        structured_logging.close_logging()
+
+    assert "hello" in stream.getvalue()
+    assert stream.writers
+    assert threading.current_thread() not in stream.writers
+
+
+def test_per_logger_levels(log_output):
+    logging.getLogger("tests.chatty").debug("kept")
+    logging.getLogger("tests.quiet").debug("dropped")
+
+    assert [r["message"] for r in log_output()] == ["kept"]
+
+
+def test_sampled_lines_follow_their_rate(log_output):
+    logger = logging.getLogger("tests.chatty")
+    for _ in range(20):
+        logger.debug("never", extra=sampled(0.0))
+        logger.debug("always", extra=sampled(1.0))
+
+    messages = [r["message"] for r in log_output()]
+    assert messages == ["always"] * 20
+
+
+def test_request_id_is_echoed_and_stamped_on_records(log_output, monkeypatch):
+    def broken_queue():
+        raise RuntimeError("queue down")
+
+    monkeypatch.setattr("main.get_job_queue", broken_queue)
+    body = {"history": [{"role": "user", "content": "Hi"}]}
+
+    response = client.post(
+        "/chat/reflect", json=body, headers={REQUEST_ID_HEADER: "req-42"}
+    )
+    generated = client.post("/chat/reflect", json=body)
+
+    assert response.status_code == 500
+    assert response.headers[REQUEST_ID_HEADER] == "req-42"
+    assert len(generated.headers[REQUEST_ID_HEADER]) == 32
+    records = [r for r in log_output() if r["logger"] == "main"]
+    assert [r["request_id"] for r in records] == [
+        "req-42",
+        generated.headers[REQUEST_ID_HEADER],
+    ]
+    assert "queue down" in records[0]["exception"]
+
+
+def test_records_carry_the_current_trace(log_output):
+    tracing.configure_tracing("memory")
+    try:
+        with tracing.start_span("work") as span:
+            logging.getLogger("tests.trace").warning("traced")
+            trace_id = format(span.get_span_context().trace_id, "032x")
+    finally:
+        tracing.close_tracing()
+
+    (record,) = log_output()
+    assert record["trace_id"] == trace_id
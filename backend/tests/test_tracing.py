@@ -0,0 +1,126 @@
+import base64
+import os
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import jwt
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+
+from benchmarks.fakes import FakeSupabase
+from main import app
+from services import auth_service, llm_service, tracing
+from services.auth_service import get_current_user
+
+app.dependency_overrides[get_current_user] = lambda: "test_user_id"
+
+client = TestClient(app)
+
+SECRET = b"tracing-test-secret-tracing-test"
+
+
+@pytest.fixture
+def spans():
+    exporter = tracing.configure_tracing("memory")
+    yield exporter
+    tracing.close_tracing()
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    response = MagicMock()
+    part = MagicMock()
+    part.text = "Let's count!"
+    response.candidates[0].content.parts = [part]
+    response.usage_metadata.prompt_token_count = 812
+    response.usage_metadata.candidates_token_count = 9
+    response.usage_metadata.cached_content_token_count = None
+    response.usage_metadata.thoughts_token_count = None
+    mock_client = MagicMock()
+    mock_client.aio.models.generate_content = AsyncMock(return_value=response)
+    monkeypatch.setattr(llm_service, "client", mock_client)
+    db = FakeSupabase()
+    monkeypatch.setattr("services.memory_service.get_supabase_client", lambda: db)
+    return mock_client
+
+
+def _by_name(exporter) -> dict:
+    return {span.name: span for span in exporter.get_finished_spans()}
+
+
+def test_chat_request_spans_form_one_trace(spans, gemini):
+    response = client.post("/chat", json={"message": "Hi"})
+    assert response.status_code == 200
+
+    finished = _by_name(spans)
+    root = finished["POST /chat"]
+    assert root.parent is None
+    assert root.attributes["http.route"] == "/chat"
+    assert root.attributes["http.response.status_code"] == 200
+
+    llm = finished["gemini.generate_content"]
+    assert llm.attributes["gen_ai.request.model"] == llm_service.MODEL_ID
+    assert llm.attributes["linxy.operation"] == "child_chat"
+    assert llm.attributes["gen_ai.usage.input_tokens"] == 812
+    assert llm.attributes["gen_ai.usage.output_tokens"] == 9
+    assert "gen_ai.usage.cached_input_tokens" not in llm.attributes
+
+    memory = finished["memories.read_row"]
+    for span in (llm, memory):
+        assert span.context.trace_id == root.context.trace_id
+        assert span.parent.span_id == root.context.span_id
+
+
+@pytest.mark.anyio
+async def test_auth_span_records_token_cache_result(spans, monkeypatch):
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", base64.b64encode(SECRET).decode())
+    auth_service._token_cache.clear()
+    claims = {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 60}
+    token = jwt.encode(claims, SECRET, algorithm="HS256")
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    await auth_service.get_current_user(credentials)
+    await auth_service.get_current_user(credentials)
+    auth_service._token_cache.clear()
+
+    results = [
+        span.attributes["linxy.token_cache"]
+        for span in spans.get_finished_spans()
+        if span.name == "auth.get_current_user"
+    ]
+    assert results == ["miss", "hit"]
+
+
+@pytest.mark.anyio
+async def test_streamed_reply_span_ends_with_usage(spans, gemini):
+    chunk = MagicMock()
+    chunk.candidates[0].content.parts[0].text = "Hi!"
+    chunk.usage_metadata.prompt_token_count = 40
+
+    async def stream():
+        yield chunk
+
+    gemini.aio.models.generate_content_stream = AsyncMock(return_value=stream())
+
+    events = [event async for event in llm_service.stream_chat_response("user-1", "Hi")]
+
+    assert events[-1]["event"] == "done"
+    llm = _by_name(spans)["gemini.generate_content"]
+    assert llm.attributes["linxy.stream"] is True
+    assert llm.attributes["gen_ai.usage.input_tokens"] == 40
+
+
+def test_tracing_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("TRACING_EXPORTER", raising=False)
+    assert tracing.configure_tracing() is None
+    with tracing.start_span("noop") as span:
+        assert not span.is_recording()
+
+
+def test_unknown_exporter_is_rejected():
+    with pytest.raises(ValueError, match="Unknown TRACING_EXPORTER"):
+        tracing.configure_tracing("zipkin")
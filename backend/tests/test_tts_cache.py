@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+from services import voice_service
+from services.tts_cache import TTSCache
+
+
+@pytest.mark.anyio
+async def test_memory_tier_evicts_least_recently_used():
+    cache = TTSCache(memory_max_bytes=10)
+
+    await cache.put("a", b"aaaa")
+    await cache.put("b", b"bbbb")
+    assert await cache.get("a") == b"aaaa"  # "a" is now most recent
+    await cache.put("c", b"cccc")
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == b"aaaa"
+    assert await cache.get("c") == b"cccc"
+
+
+@pytest.mark.anyio
+async def test_disk_tier_survives_restart_and_evicts_by_size(tmp_path):
+    cache = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=10)
+    await cache.put("a", b"aaaa")
+    await cache.put("b", b"bbbb")
+
+    restarted = TTSCache(memory_max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=10)
+    assert await restarted.get("a") == b"aaaa"
+
+    await restarted.put("c", b"cccc")
+    assert not (tmp_path / "b.mp3").exists()
+    assert await restarted.get("b") is None
+    assert await restarted.get("c") == b"cccc"
+
+
+def test_key_depends_on_voice_model_and_text():
+    key = TTSCache.key("Rachel", "eleven_monolingual_v1", "Hi!")
+    assert key == TTSCache.key("Rachel", "eleven_monolingual_v1", "Hi!")
+    assert key != TTSCache.key("Adam", "eleven_monolingual_v1", "Hi!")
+    assert key != TTSCache.key("Rachel", "eleven_turbo_v2", "Hi!")
+    assert key != TTSCache.key("Rachel", "eleven_monolingual_v1", "Hi")
+
+
+@pytest.mark.anyio
+async def test_repeated_phrase_costs_one_tts_call(monkeypatch, tmp_path):
+    calls = []
+
+    async def convert(text, voice_id, model_id):
+        calls.append(text)
+        yield b"audio"
+
+    mock_client = MagicMock()
+    mock_client.text_to_speech.convert = convert
+    cache = TTSCache(memory_max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    monkeypatch.setattr(voice_service, "get_elevenlabs_client", lambda: mock_client)
+    monkeypatch.setattr(voice_service, "get_tts_cache", lambda: cache)
+
+    phrase = "Hi! I'm Linxy. What should we do today?"
+    assert await voice_service.generate_speech(phrase) == b"audio"
+    assert await voice_service.generate_speech(phrase) == b"audio"
+    assert [b async for b in voice_service.stream_speech(phrase)] == [b"audio"]
+
+    assert calls == [phrase]
+
+
+def _tts_seconds_count(source: str) -> float:
+    labels = {"source": source}
+    return REGISTRY.get_sample_value("linxy_tts_duration_seconds_count", labels) or 0
+
+
+@pytest.mark.anyio
+async def test_streamed_speech_is_measured_and_failures_logged(
+    monkeypatch, tmp_path, caplog
+):
+    async def stream(text, voice_id, model_id):
+        yield b"au"
+        if text == "fail":
+            raise httpx.ReadError("socket closed")
+        yield b"dio"
+
+    mock_client = MagicMock()
+    mock_client.text_to_speech.stream = stream
+    cache = TTSCache(memory_max_bytes=1024)
+    monkeypatch.setattr(voice_service, "get_elevenlabs_client", lambda: mock_client)
+    monkeypatch.setattr(voice_service, "get_tts_cache", lambda: cache)
+    before = _tts_seconds_count("elevenlabs")
+
+    streamed = [b async for b in voice_service.stream_speech("ok")]
+    failed = [b async for b in voice_service.stream_speech("fail")]
+
+    assert streamed == [b"au", b"dio"]
+    assert failed == [b"au"]
+    assert _tts_seconds_count("elevenlabs") == before + 1
+    assert "socket closed" in caplog.text
+    assert await cache.get(cache.key("Rachel", voice_service.MODEL_ID, "fail")) is None
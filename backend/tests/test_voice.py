@@ -3,6 +3,8 @@ from main import app
 from services.auth_service import get_current_user
 from unittest.mock import patch, AsyncMock
 import base64
+import json
+import pytest
 
 client = TestClient(app)
 
@@ -43,3 +45,126 @@ def test_process_voice_whitespace_text():
     response = client.post("/chat/voice", json={"text": "   "})
     assert response.status_code == 400
     assert response.json()["detail"] == "Text cannot be empty"
+
+
+def test_sentence_splitter_holds_incomplete_sentence():
+    from services.voice_service import SentenceSplitter
+
+    splitter = SentenceSplitter()
+    assert splitter.feed("Hi Tommy! Want to") == ["Hi Tommy!"]
+    assert splitter.feed(" count stars? Let's go") == ["Want to count stars?"]
+    assert splitter.flush() == "Let's go"
+    assert splitter.flush() == ""
+
+
+@pytest.mark.anyio
+async def test_stream_reply_audio_starts_tts_before_text_ends(monkeypatch):
+    import asyncio
+
+    from services import voice_service
+
+    first_sentence_spoken = asyncio.Event()
+
+    async def mock_stream_speech(text, voice_id="Rachel"):
+        first_sentence_spoken.set()
+        yield f"<{text}>".encode()
+
+    monkeypatch.setattr(voice_service, "stream_speech", mock_stream_speech)
+
+    async def reply_text():
+        yield "Hello there. "
+        # Generation only continues once the first sentence is being spoken
+        await asyncio.wait_for(first_sentence_spoken.wait(), timeout=1)
+        yield "Want to play?"
+
+    audio = [chunk async for chunk in voice_service.stream_reply_audio(reply_text())]
+    assert audio == [b"<Hello there.>", b"<Want to play?>"]
+
+
+def _sse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name.removeprefix("event: "), json.loads(data[len("data: ") :])))
+    return events
+
+
+def test_process_voice_stream_endpoint(monkeypatch):
+    async def mock_stream_chat_response(user_id, message):
+        yield {"event": "token", "data": {"text": "Hi there! How"}}
+        yield {"event": "sticker", "data": {"sticker": "Star", "reason": "Hi"}}
+        yield {"event": "token", "data": {"text": " are you?"}}
+        yield {"event": "done", "data": {"reply": "Hi there! How are you?"}}
+
+    async def mock_stream_speech(text, voice_id="Rachel"):
+        yield text.encode()
+
+    monkeypatch.setattr("routers.voice.stream_chat_response", mock_stream_chat_response)
+    monkeypatch.setattr("services.voice_service.stream_speech", mock_stream_speech)
+
+    response = client.post("/chat/voice/stream", json={"text": "Hello"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response.text)
+    assert events[-1] == ("done", {"reply": "Hi there! How are you?"})
+    text = "".join(data["text"] for name, data in events if name == "token")
+    assert text == "Hi there! How are you?"
+    assert ("sticker", {"sticker": "Star", "reason": "Hi"}) in events
+    audio = [
+        base64.b64decode(data["audio_base64"])
+        for name, data in events
+        if name == "audio"
+    ]
+    assert audio == [b"Hi there!", b"How are you?"]
+
+
+@pytest.mark.anyio
+async def test_stream_reply_events_sends_text_before_its_audio(monkeypatch):
+    import asyncio
+
+    from services import voice_service
+
+    speech_started = asyncio.Event()
+
+    async def mock_stream_speech(text, voice_id="Rachel"):
+        speech_started.set()
+        yield text.encode()
+
+    monkeypatch.setattr(voice_service, "stream_speech", mock_stream_speech)
+
+    async def chat_events():
+        yield {"event": "token", "data": {"text": "One. "}}
+        await asyncio.wait_for(speech_started.wait(), timeout=1)
+        yield {"event": "token", "data": {"text": "Two."}}
+        yield {"event": "done", "data": {"reply": "One. Two."}}
+
+    events = [e async for e in voice_service.stream_reply_events(chat_events())]
+
+    names = [event["event"] for event in events]
+    assert names == ["token", "audio", "token", "audio", "done"]
+
+
+@pytest.mark.anyio
+async def test_stream_reply_events_raises_after_the_audio_so_far(monkeypatch):
+    from services import voice_service
+
+    async def mock_stream_speech(text, voice_id="Rachel"):
+        yield text.encode()
+
+    monkeypatch.setattr(voice_service, "stream_speech", mock_stream_speech)
+
+    async def chat_events():
+        yield {"event": "token", "data": {"text": "One. "}}
+        raise RuntimeError("model went away")
+
+    events = []
+    with pytest.raises(RuntimeError):
+        async for event in voice_service.stream_reply_events(chat_events()):
+            events.append(event["event"])
+    assert events == ["token", "audio"]
+
+
+def test_process_voice_stream_empty_text():
+    response = client.post("/chat/voice/stream", json={"text": " "})
+    assert response.status_code == 400
@@ -1,18 +1,19 @@
+import asyncio
 import os
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 # Set dummy API key before importing llm_service to avoid crash during import
 os.environ["GEMINI_API_KEY"] = "dummy_key"
 
 from services import llm_service
+from services.memory_service import MemorySnapshot
 
 
 @pytest.fixture
 def mock_genai_client(monkeypatch):
     mock_client = MagicMock()
-    mock_models = MagicMock()
-    mock_client.models = mock_models
+    mock_client.aio.models.generate_content = AsyncMock()
     monkeypatch.setattr(llm_service, "client", mock_client)
     return mock_client
 
@@ -20,27 +21,25 @@ def mock_genai_client(monkeypatch):
 @pytest.mark.anyio
 async def test_generate_wakeup_message_with_memories(mock_genai_client, monkeypatch):
     # Mock data
-    async def mock_get_identity_dict(user_id):
-        return {
-            "ai": {"name": "Linxy", "persona": "a helpful AI companion."},
-            "user": {"name": "the child", "grade_level": "Kindergarten (ages 4-6)"},
-        }
-
-    async def mock_get_current_state(user_id):
-        return "The child was learning about dinosaurs."
-
-    async def mock_get_episodic_memory(user_id):
-        return [{"summary": "Talked about T-Rex", "interests": ["dinosaurs"]}]
-
-    # Patch the imported functions in llm_service
-    monkeypatch.setattr(llm_service, "get_identity_dict", mock_get_identity_dict)
-    monkeypatch.setattr(llm_service, "get_current_state", mock_get_current_state)
-    monkeypatch.setattr(llm_service, "get_episodic_memory", mock_get_episodic_memory)
+    async def mock_load_memory_snapshot(user_id, fields):
+        return MemorySnapshot(
+            identity={
+                "ai": {"name": "Linxy", "persona": "a helpful AI companion."},
+                "user": {"name": "the child", "grade_level": "Kindergarten (ages 4-6)"},
+            },
+            current_state="The child was learning about dinosaurs.",
+            episodic_memory=[
+                {"summary": "Talked about T-Rex", "interests": ["dinosaurs"]}
+            ],
+        )
+
+    # Patch the imported loader in llm_service
+    monkeypatch.setattr(llm_service, "load_memory_snapshot", mock_load_memory_snapshot)
 
     # Mock Gemini response
     mock_response = MagicMock()
     mock_response.text = "Hey! Ready to find more dinosaur bones?"
-    mock_genai_client.models.generate_content.return_value = mock_response
+    mock_genai_client.aio.models.generate_content.return_value = mock_response
 
     # specific model check
     expected_model = "gemini-2.5-flash"
@@ -52,7 +51,7 @@ async def test_generate_wakeup_message_with_memories(mock_genai_client, monkeypa
     assert response == "Hey! Ready to find more dinosaur bones?"
 
     # Verify Gemini was called with correct model and prompt
-    args, kwargs = mock_genai_client.models.generate_content.call_args
+    args, kwargs = mock_genai_client.aio.models.generate_content.call_args
     assert kwargs["model"] == expected_model
 
     # Check if prompt contains relevant info
@@ -65,21 +64,15 @@ async def test_generate_wakeup_message_with_memories(mock_genai_client, monkeypa
 @pytest.mark.anyio
 async def test_generate_wakeup_message_fallback(mock_genai_client, monkeypatch):
     # Mock empty data
-    async def mock_get_identity_dict(user_id):
-        return {
-            "ai": {"name": "Linxy", "persona": "a friendly AI companion."},
-            "user": {"name": "the child", "grade_level": "Kindergarten (ages 4-6)"},
-        }
-
-    async def mock_get_current_state(user_id):
-        return ""
+    async def mock_load_memory_snapshot(user_id, fields):
+        return MemorySnapshot(
+            identity={
+                "ai": {"name": "Linxy", "persona": "a friendly AI companion."},
+                "user": {"name": "the child", "grade_level": "Kindergarten (ages 4-6)"},
+            },
+        )
 
-    async def mock_get_episodic_memory(user_id):
-        return []
-
-    monkeypatch.setattr(llm_service, "get_identity_dict", mock_get_identity_dict)
-    monkeypatch.setattr(llm_service, "get_current_state", mock_get_current_state)
-    monkeypatch.setattr(llm_service, "get_episodic_memory", mock_get_episodic_memory)
+    monkeypatch.setattr(llm_service, "load_memory_snapshot", mock_load_memory_snapshot)
 
     # Call function
     response = await llm_service.generate_wakeup_message("test_user_id")
@@ -88,7 +81,7 @@ async def test_generate_wakeup_message_fallback(mock_genai_client, monkeypatch):
     assert response == "Hi! I'm Linxy. What should we do today?"
 
     # Gemini should NOT be called
-    mock_genai_client.models.generate_content.assert_not_called()
+    mock_genai_client.aio.models.generate_content.assert_not_called()
 
 
 @pytest.mark.anyio
@@ -96,26 +89,21 @@ async def test_generate_wakeup_message_only_current_state(
     mock_genai_client, monkeypatch
 ):
     # Mock data: No memories, but has current state
-    async def mock_get_identity_dict(user_id):
-        return {
-            "ai": {"name": "Linxy", "persona": "a friendly AI companion."},
-            "user": {"name": "the child", "grade_level": "Kindergarten (ages 4-6)"},
-        }
-
-    async def mock_get_current_state(user_id):
-        return "The child was building a lego castle."
-
-    async def mock_get_episodic_memory(user_id):
-        return []
+    async def mock_load_memory_snapshot(user_id, fields):
+        return MemorySnapshot(
+            identity={
+                "ai": {"name": "Linxy", "persona": "a friendly AI companion."},
+                "user": {"name": "the child", "grade_level": "Kindergarten (ages 4-6)"},
+            },
+            current_state="The child was building a lego castle.",
+        )
 
-    monkeypatch.setattr(llm_service, "get_identity_dict", mock_get_identity_dict)
-    monkeypatch.setattr(llm_service, "get_current_state", mock_get_current_state)
-    monkeypatch.setattr(llm_service, "get_episodic_memory", mock_get_episodic_memory)
+    monkeypatch.setattr(llm_service, "load_memory_snapshot", mock_load_memory_snapshot)
 
     # Mock Gemini response
     mock_response = MagicMock()
     mock_response.text = "Hey! Want to finish that castle?"
-    mock_genai_client.models.generate_content.return_value = mock_response
+    mock_genai_client.aio.models.generate_content.return_value = mock_response
 
     # Call function
     response = await llm_service.generate_wakeup_message("test_user_id")
@@ -124,10 +112,10 @@ async def test_generate_wakeup_message_only_current_state(
     assert response == "Hey! Want to finish that castle?"
 
     # Gemini SHOULD be called
-    mock_genai_client.models.generate_content.assert_called_once()
+    mock_genai_client.aio.models.generate_content.assert_called_once()
 
     # Check prompt content
-    args, kwargs = mock_genai_client.models.generate_content.call_args
+    args, kwargs = mock_genai_client.aio.models.generate_content.call_args
     config = kwargs["config"]
     assert "lego castle" in config.system_instruction
 
@@ -136,30 +124,108 @@ async def test_generate_wakeup_message_only_current_state(
 async def test_generate_wakeup_message_with_structured_identity(
     mock_genai_client, monkeypatch
 ):
-    async def mock_get_identity_dict(user_id):
-        return {
-            "ai": {"name": "Captain Sparkle", "persona": "a brave pirate"},
-            "user": {"name": "Tommy", "grade_level": "1st Grade"},
-        }
-
-    monkeypatch.setattr(llm_service, "get_identity_dict", mock_get_identity_dict)
-
-    async def mock_get_current_state(user_id):
-        return "The child was learning about dinosaurs."
-
-    async def mock_get_episodic_memory(user_id):
-        return [{"summary": "Talked about T-Rex", "interests": ["dinosaurs"]}]
-
-    monkeypatch.setattr(llm_service, "get_current_state", mock_get_current_state)
-    monkeypatch.setattr(llm_service, "get_episodic_memory", mock_get_episodic_memory)
+    async def mock_load_memory_snapshot(user_id, fields):
+        return MemorySnapshot(
+            identity={
+                "ai": {"name": "Captain Sparkle", "persona": "a brave pirate"},
+                "user": {"name": "Tommy", "grade_level": "1st Grade"},
+            },
+            current_state="The child was learning about dinosaurs.",
+            episodic_memory=[
+                {"summary": "Talked about T-Rex", "interests": ["dinosaurs"]}
+            ],
+        )
+
+    monkeypatch.setattr(llm_service, "load_memory_snapshot", mock_load_memory_snapshot)
 
     mock_response = MagicMock()
     mock_response.text = "Ahoy there Tommy! Ready to find more dinosaur bones?"
-    mock_genai_client.models.generate_content.return_value = mock_response
+    mock_genai_client.aio.models.generate_content.return_value = mock_response
 
     await llm_service.generate_wakeup_message("test_user_id")
 
-    args, kwargs = mock_genai_client.models.generate_content.call_args
+    args, kwargs = mock_genai_client.aio.models.generate_content.call_args
     system_instruction = kwargs["config"].system_instruction
     assert "Captain Sparkle" in system_instruction
     assert "brave pirate" in system_instruction
+
+
+def _remembering_snapshot(version: int | None) -> MemorySnapshot:
+    return MemorySnapshot(
+        current_state="The child was counting rockets.",
+        episodic_memory=[{"summary": "Counted to 20", "interests": ["space"]}],
+        version=version,
+    )
+
+
+@pytest.mark.anyio
+async def test_concurrent_wakeups_share_one_generation(mock_genai_client):
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_generate(**kwargs):
+        started.set()
+        await release.wait()
+        response = MagicMock()
+        response.text = "Ready for more rockets?"
+        return response
+
+    mock_genai_client.aio.models.generate_content.side_effect = slow_generate
+    snapshot = _remembering_snapshot(version=3)
+
+    calls = [
+        asyncio.create_task(llm_service.generate_wakeup_message("user-1", snapshot))
+        for _ in range(5)
+    ]
+    await started.wait()
+    release.set()
+    replies = await asyncio.gather(*calls)
+    # Kept for the unchanged memories, regenerated once they change
+    await llm_service.generate_wakeup_message("user-1", snapshot)
+    await llm_service.generate_wakeup_message("user-1", _remembering_snapshot(4))
+
+    assert replies == ["Ready for more rockets?"] * 5
+    assert mock_genai_client.aio.models.generate_content.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_a_caller_going_away_does_not_cancel_the_shared_generation(
+    mock_genai_client,
+):
+    release = asyncio.Event()
+
+    async def slow_generate(**kwargs):
+        await release.wait()
+        response = MagicMock()
+        response.text = "Hello again!"
+        return response
+
+    mock_genai_client.aio.models.generate_content.side_effect = slow_generate
+    snapshot = _remembering_snapshot(version=1)
+
+    first = asyncio.create_task(llm_service.generate_wakeup_message("user-1", snapshot))
+    second = asyncio.create_task(
+        llm_service.generate_wakeup_message("user-1", snapshot)
+    )
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    assert await second == "Hello again!"
+
+
+@pytest.mark.anyio
+async def test_failed_wakeups_are_not_kept(mock_genai_client):
+    response = MagicMock()
+    response.text = "Back to the rockets?"
+    mock_genai_client.aio.models.generate_content.side_effect = [
+        RuntimeError("quota"),
+        response,
+    ]
+    snapshot = _remembering_snapshot(version=2)
+
+    first = await llm_service.generate_wakeup_message("user-1", snapshot)
+    second = await llm_service.generate_wakeup_message("user-1", snapshot)
+
+    assert first == llm_service.WAKEUP_FALLBACK
+    assert second == "Back to the rockets?"